@@ -0,0 +1 @@
+from .analysis_cache import AnalysisCache, CacheSegment, hash_file
\ No newline at end of file
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Part of every key; bumped when the meaning of a frame range changes, so older entries are not reused.
+# Version 2: frame ranges count from the first decoded frame (frame 0) in every processing mode.
+KEY_VERSION = 2
+
+
+def hash_file(path, chunk_size=1 << 22):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CacheSegment:
+    """
+    Cache entries of one frame range of one video, addressed by stage name and parameters.
+
+    tracking_start is the frame where the tracker and camera movement estimator
+    started from scratch. Their results for a frame range depend on it, so a
+    parallel worker starting mid-video never shares entries with a run from frame 0.
+    """
+
+    def __init__(self, cache, video_hash, frame_start, frame_end, tracking_start=0):
+        self.cache = cache
+        self.video_hash = video_hash
+        self.frame_start = frame_start
+        self.frame_end = frame_end
+        self.tracking_start = tracking_start
+
+    def key(self, stage, params):
+        return self.cache.make_key(stage, self.video_hash, (self.frame_start, self.frame_end), params,
+                                   tracking_start=self.tracking_start)
+
+    def contains(self, stage, params):
+        return self.cache.contains(self.key(stage, params))
+
+    def get(self, stage, params):
+        return self.cache.get(self.key(stage, params))
+
+    def put(self, stage, params, arrays):
+        self.cache.put(self.key(stage, params), arrays)
+
+
+class AnalysisCache:
+    """
+    Content-addressed on-disk cache for per-segment analysis results.
+
+    Entries are keyed by the video content hash, the frame range, the stage
+    name and the stage parameters (which include the model weight hash for
+    inference). Each entry is a directory of .npy files, so reads are
+    memory-mapped instead of unpickled. Least recently used entries are
+    evicted once the cache grows beyond max_bytes; entry sizes are scanned
+    when the cache opens and kept up to date by put and evict afterwards.
+    """
+
+    def __init__(self, cache_dir='stubs/analysis_cache', max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._file_hashes = {}
+        # Entry directory -> size in bytes, least recently used first
+        self._entry_sizes = OrderedDict(
+            (entry_dir, size) for _, size, entry_dir in sorted(self._entries())
+        )
+        self._total_size = sum(self._entry_sizes.values())
+
+    def file_hash(self, path):
+        """Content hash of a file, remembered per (path, size, mtime) to avoid re-reading large videos"""
+        stat = os.stat(path)
+        signature = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if signature in self._file_hashes:
+            return self._file_hashes[signature]
+
+        index_path = os.path.join(self.cache_dir, 'file_hashes.json')
+        file_hashes = {}
+        if os.path.exists(index_path):
+            try:
+                with open(index_path) as f:
+                    file_hashes = json.load(f)
+            except (OSError, ValueError):
+                file_hashes = {}
+
+        if signature not in file_hashes:
+            file_hashes[signature] = hash_file(path)
+            with open(index_path, 'w') as f:
+                json.dump(file_hashes, f)
+
+        self._file_hashes[signature] = file_hashes[signature]
+        return file_hashes[signature]
+
+    def segment(self, video_hash, frame_start, frame_end, tracking_start=0):
+        return CacheSegment(self, video_hash, frame_start, frame_end, tracking_start)
+
+    def make_key(self, stage, video_hash, frame_range, params, tracking_start=0):
+        description = json.dumps({
+            "version": KEY_VERSION,
+            "stage": stage,
+            "video": video_hash,
+            "frames": list(frame_range),
+            "tracking_start": tracking_start,
+            "params": params,
+        }, sort_keys=True, default=str)
+        return f"{stage}-{hashlib.sha1(description.encode()).hexdigest()}"
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def contains(self, key):
+        return os.path.exists(os.path.join(self._entry_dir(key), 'meta.json'))
+
+    def get(self, key):
+        """Memory-mapped arrays of an entry, or None on a miss"""
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            arrays = {
+                name: np.load(os.path.join(entry_dir, file_name), mmap_mode='r', allow_pickle=False)
+                for name, file_name in meta['arrays'].items()
+            }
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading cache entry {key}: {e}. Discarding it...")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            self._total_size -= self._entry_sizes.pop(entry_dir, 0)
+            return None
+
+        # Access time drives LRU eviction, also for the next process that opens the cache
+        os.utime(meta_path)
+        if entry_dir in self._entry_sizes:
+            self._entry_sizes.move_to_end(entry_dir)
+        return arrays
+
+    def put(self, key, arrays):
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        file_names = {}
+        for index, (name, array) in enumerate(arrays.items()):
+            file_name = f"{index}.npy"
+            np.save(os.path.join(tmp_dir, file_name), np.asarray(array), allow_pickle=False)
+            file_names[name] = file_name
+
+        # meta.json is written last, so half-written entries are never read
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({"arrays": file_names, "created": time.time()}, f)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+        self._total_size -= self._entry_sizes.pop(entry_dir, 0)
+        self._entry_sizes[entry_dir] = self._entry_size(entry_dir)
+        self._total_size += self._entry_sizes[entry_dir]
+        self.evict()
+
+    @staticmethod
+    def _entry_size(entry_dir):
+        return sum(
+            os.path.getsize(os.path.join(entry_dir, file_name))
+            for file_name in os.listdir(entry_dir)
+        )
+
+    def _entries(self):
+        """(last access, size, directory) of every entry on disk; only scanned when the cache opens"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            meta_path = os.path.join(self.cache_dir, name, 'meta.json')
+            if not os.path.exists(meta_path):
+                continue
+            entry_dir = os.path.join(self.cache_dir, name)
+            entries.append((os.path.getmtime(meta_path), self._entry_size(entry_dir), entry_dir))
+        return entries
+
+    def size(self):
+        return self._total_size
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        while self._total_size > self.max_bytes and self._entry_sizes:
+            entry_dir, size = self._entry_sizes.popitem(last=False)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            self._total_size -= size
+            print(f"Evicted cache entry {os.path.basename(entry_dir)}")
@@ -0,0 +1 @@
+from .batch_autotuner import BatchAutotuner
\ No newline at end of file
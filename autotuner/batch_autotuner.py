@@ -0,0 +1,175 @@
+import json
+import os
+import platform
+import threading
+import time
+
+import psutil
+
+
+class _PeakRSS:
+    """Samples the resident set size of this process in a background thread"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+class BatchAutotuner:
+    """
+    Picks the model.predict batch size and the pipeline batch size (frames per
+    process_batch call) from a short calibration on the first frames of a video.
+
+    Inference batch sizes are timed first. The pipeline batch sizes are then
+    timed with the fastest one. A candidate is only eligible while the peak RSS
+    during its run stays below memory_ceiling. For the pipeline, the batch's
+    memory is counted once per batch in flight. The choice is stored in
+    cache_path under the machine, the model and the frame resolution, so later
+    runs skip the calibration.
+    """
+
+    def __init__(self, cache_path='stubs/batch_tuning.json', memory_ceiling=None,
+                 inference_candidates=(1, 4, 8, 16, 20, 32), pipeline_candidates=(25, 50, 100),
+                 in_flight_batches=1, calibration_frames=32):
+        # Default ceiling: 75% of the memory available when the tuner is created
+        self.memory_ceiling_setting = memory_ceiling
+        self.memory_ceiling = memory_ceiling or int(psutil.virtual_memory().available * 0.75)
+        self.cache_path = cache_path
+        self.inference_candidates = sorted(inference_candidates)
+        self.pipeline_candidates = sorted(pipeline_candidates)
+        self.in_flight_batches = in_flight_batches
+        self.calibration_frames = calibration_frames
+        self.measurements = []
+
+    def machine_key(self):
+        memory_gb = psutil.virtual_memory().total / 1024 ** 3
+        return f"{platform.node()}-{platform.machine()}-{os.cpu_count()}cpu-{memory_gb:.0f}GB"
+
+    def cache_key(self, model_key, frame_size):
+        return "|".join([
+            self.machine_key(),
+            str(model_key),
+            f"{frame_size[0]}x{frame_size[1]}",
+            f"ceiling={self.memory_ceiling_setting // 1024 ** 2}MB" if self.memory_ceiling_setting else "ceiling=auto",
+            f"in_flight={self.in_flight_batches}",
+        ])
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading batch tuning cache: {e}. Recalibrating...")
+            return {}
+
+    def _save_cache(self, key, choice):
+        tuning = self._load_cache()
+        tuning[key] = choice
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with open(self.cache_path, 'w') as f:
+            json.dump(tuning, f, indent=2)
+
+    def _measure(self, kind, batch_size, run, num_frames, in_flight=1, input_bytes=0):
+        baseline = psutil.Process().memory_info().rss
+        with _PeakRSS() as peak_rss:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        # input_bytes: decoded frames that were already in memory before the run
+        peak = baseline + (peak_rss.peak - baseline + input_bytes) * in_flight
+        measurement = {
+            "kind": kind,
+            "batch_size": batch_size,
+            "fps": num_frames / elapsed if elapsed > 0 else float('inf'),
+            "peak_rss": int(peak),
+            "within_ceiling": peak <= self.memory_ceiling,
+        }
+        self.measurements.append(measurement)
+        print(f"  {kind} batch {batch_size:4d}: {measurement['fps']:7.1f} fps, "
+              f"peak RSS {peak / 1024 ** 2:.0f} MB")
+        return measurement
+
+    def _best(self, measurements, default):
+        eligible = [m for m in measurements if m["within_ceiling"]]
+        if not eligible:
+            print(f"No batch size stays below the memory ceiling, using {default}")
+            return default
+        return max(eligible, key=lambda m: m["fps"])["batch_size"]
+
+    def lookup(self, model_key, frame_size):
+        """Cached (inference_batch_size, pipeline_batch_size) for this machine, model and resolution, or None"""
+        cached = self._load_cache().get(self.cache_key(model_key, frame_size))
+        if cached is None:
+            return None
+        print(f"Using tuned batch sizes: inference {cached['inference_batch_size']}, "
+              f"pipeline {cached['pipeline_batch_size']}")
+        return cached["inference_batch_size"], cached["pipeline_batch_size"]
+
+    def tune(self, frames, run_inference, run_pipeline, model_key, frame_size):
+        """
+        frames: the first frames of the video, at least max(pipeline_candidates) of them
+        run_inference(frames, inference_batch_size): runs model.predict over frames
+        run_pipeline(frames, inference_batch_size): processes frames as one pipeline batch
+        Returns (inference_batch_size, pipeline_batch_size).
+        """
+        cached = self.lookup(model_key, frame_size)
+        if cached is not None:
+            return cached
+
+        print(f"Calibrating batch sizes on {len(frames)} frames "
+              f"(memory ceiling {self.memory_ceiling / 1024 ** 2:.0f} MB)...")
+        self.measurements = []
+
+        # Warm up the model so the first candidate does not pay for initialisation
+        run_inference(frames[:1], 1)
+
+        inference_frames = frames[:max(self.calibration_frames, max(self.inference_candidates))]
+        inference_results = [
+            self._measure("inference", batch_size, lambda: run_inference(inference_frames, batch_size), len(inference_frames))
+            for batch_size in self.inference_candidates
+        ]
+        inference_batch_size = self._best(inference_results, self.inference_candidates[0])
+
+        pipeline_results = []
+        for batch_size in self.pipeline_candidates:
+            if batch_size > len(frames):
+                break
+            batch_frames = frames[:batch_size]
+            pipeline_results.append(self._measure(
+                "pipeline", batch_size, lambda: run_pipeline(batch_frames, inference_batch_size),
+                batch_size, self.in_flight_batches, sum(frame.nbytes for frame in batch_frames)
+            ))
+        pipeline_batch_size = self._best(pipeline_results, self.pipeline_candidates[0])
+
+        self._save_cache(self.cache_key(model_key, frame_size), {
+            "inference_batch_size": inference_batch_size,
+            "pipeline_batch_size": pipeline_batch_size,
+            "measurements": self.measurements,
+            "created": time.time(),
+        })
+        print(f"Tuned batch sizes: inference {inference_batch_size}, pipeline {pipeline_batch_size}")
+        return inference_batch_size, pipeline_batch_size
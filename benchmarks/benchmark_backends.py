@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trackers import Tracker, BACKENDS, export_model
+from utils import read_sampled_frames, get_iou_matrix
+
+
+def read_frames(video_path, num_frames):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def detect(tracker, frames):
+    """sv.Detections per frame, through the same conversion the tracker uses; and the fps"""
+    tracker.detect_frames(frames[:1])
+    start = time.perf_counter()
+    results = tracker.detect_frames(frames)
+    elapsed = time.perf_counter() - start
+    return [tracker._convert_goalkeepers(result)[0] for result in results], len(frames) / elapsed
+
+
+def compare_detections(reference, candidate, min_iou=0.5):
+    """
+    Agreement of a backend's detections with the reference backend: detections
+    matched one-to-one with the same class and IoU >= min_iou, greedily by IoU
+    -> (precision, recall, mean IoU of matches, mean |confidence difference|)
+    """
+    matched, reference_count, candidate_count = 0, 0, 0
+    ious, confidence_differences = [], []
+    for reference_frame, candidate_frame in zip(reference, candidate):
+        reference_count += len(reference_frame)
+        candidate_count += len(candidate_frame)
+        if len(reference_frame) == 0 or len(candidate_frame) == 0:
+            continue
+        iou = get_iou_matrix(reference_frame.xyxy, candidate_frame.xyxy)
+        iou[reference_frame.class_id[:, None] != candidate_frame.class_id[None, :]] = 0
+        for index in np.argsort(-iou, axis=None):
+            row, column = np.unravel_index(index, iou.shape)
+            if iou[row, column] < min_iou:
+                break
+            matched += 1
+            ious.append(iou[row, column])
+            confidence_differences.append(abs(reference_frame.confidence[row] - candidate_frame.confidence[column]))
+            iou[row, :] = 0
+            iou[:, column] = 0
+    return (
+        matched / max(candidate_count, 1),
+        matched / max(reference_count, 1),
+        float(np.mean(ious)) if ious else 0.0,
+        float(np.mean(confidence_differences)) if confidence_differences else 0.0,
+    )
+
+
+def main(video_path='input_videos/Data-1.mp4', num_frames=100, model_path='models/best.pt', backends=BACKENDS):
+    frames = read_frames(video_path, num_frames)
+    if not frames:
+        print(f"Could not read frames from {video_path}")
+        return
+    print(f"Detection on {len(frames)} frames")
+
+    reference = None
+    for backend in backends:
+        try:
+            calibration_frames = read_sampled_frames(video_path, 64) if backend == "onnx-int8" else None
+            export_model(model_path, backend, calibration_frames=calibration_frames)
+            detections, fps = detect(Tracker(model_path, backend=backend), frames)
+        except (ImportError, RuntimeError, ValueError) as e:
+            print(f"{backend:10s} unavailable: {e}")
+            continue
+
+        if reference is None:
+            reference = detections
+        precision, recall, mean_iou, confidence_difference = compare_detections(reference, detections)
+        print(f"{backend:10s} {fps:6.1f} fps  precision {precision*100:5.1f}%  recall {recall*100:5.1f}%  "
+              f"mean IoU {mean_iou:.3f}  confidence diff {confidence_difference:.3f}")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trackers import Tracker
+from trackers.track_store import TrackStore
+
+
+def pandas_interpolate(ball_positions):
+    """The former Tracker.interpolate_ball_positions: one DataFrame per call, interpolate, then bfill"""
+    ball_bboxes = []
+    for frame_data in ball_positions:
+        if 1 in frame_data and 'bbox' in frame_data[1] and len(frame_data[1]['bbox']) == 4:
+            ball_bboxes.append(frame_data[1]['bbox'])
+        else:
+            ball_bboxes.append([np.nan, np.nan, np.nan, np.nan])
+    df_ball_positions = pd.DataFrame(ball_bboxes, columns=['x1', 'y1', 'x2', 'y2'])
+    df_ball_positions = df_ball_positions.interpolate().bfill()
+    return [{1: {"bbox": bbox}} for bbox in df_ball_positions.to_numpy().tolist()]
+
+
+def synthetic_ball_track(num_frames, miss_rate=0.3, occlusions_per_minute=2, seed=0):
+    """
+    Ball track dicts of a ball moving smoothly over a 1080p frame, with single
+    missed detections and longer occlusions of up to 4 seconds
+    """
+    rng = np.random.default_rng(seed)
+    center = np.cumsum(rng.normal(0, 4, (num_frames, 2)), axis=0)
+    center = np.abs((center + [960, 540]) % [3840, 2160] - [1920, 1080])
+    bboxes = np.hstack([center - 8, center + 8])
+
+    missing = rng.random(num_frames) < miss_rate
+    for start in rng.integers(0, num_frames, int(num_frames / 24 / 60 * occlusions_per_minute)):
+        missing[start:start + rng.integers(5, 96)] = True
+    return [{} if is_missing else {1: {"bbox": bbox}} for is_missing, bbox in zip(missing, bboxes.tolist())]
+
+
+def to_array(ball_positions):
+    return np.array([
+        frame_data[1]['bbox'] if 1 in frame_data else [np.nan] * 4 for frame_data in ball_positions
+    ], dtype=np.float64)
+
+
+def main(num_frames=24 * 60 * 90, batch_size=50, repeats=3):
+    ball_tracks = synthetic_ball_track(num_frames)
+    print(f"Ball interpolation over {num_frames} frames, batches of {batch_size}")
+
+    # Former version: a DataFrame per batch
+    pandas_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        pandas_result = []
+        for frame_start in range(0, num_frames, batch_size):
+            pandas_result += pandas_interpolate(ball_tracks[frame_start:frame_start + batch_size])
+        pandas_times.append(time.perf_counter() - start)
+
+    # Streaming NumPy version on the columnar ball table, as in process_batch
+    ball_table = TrackStore.from_dict({'ball': ball_tracks}).table('ball')
+    batches = [ball_table.slice_frames(frame_start, frame_start + batch_size)
+               for frame_start in range(0, num_frames, batch_size)]
+    numpy_times = []
+    for _ in range(repeats):
+        tracker = Tracker(None)
+        start = time.perf_counter()
+        numpy_result = [tracker.interpolate_ball_positions(batch) for batch in batches]
+        numpy_times.append(time.perf_counter() - start)
+    numpy_bboxes = np.concatenate([batch.columns['bbox'] for batch in numpy_result]).astype(np.float64)
+    max_gap = tracker.ball_interpolator.max_gap
+
+    # Agreement with the former version on one pass over the whole track, where neither is cut at batches
+    whole_pandas = to_array(pandas_interpolate(ball_tracks))
+    tracker = Tracker(None)
+    tracker.ball_interpolator.max_gap = None
+    whole_numpy = tracker.ball_interpolator.interpolate(to_array(ball_tracks))
+    max_difference = np.nanmax(np.abs(whole_pandas - whole_numpy)) if np.isfinite(whole_numpy).any() else 0.0
+
+    missing = int(np.isnan(to_array(ball_tracks)).any(axis=1).sum())
+    pandas_time, numpy_time = min(pandas_times), min(numpy_times)
+    print(f"Frames without a detection: {missing}")
+    print(f"Whole-track max difference to pandas: {max_difference:.2e} px")
+    print(f"Per-batch pandas: {pandas_time*1000:.1f} ms, empty frames after it: "
+          f"{int(np.isnan(to_array(pandas_result)).any(axis=1).sum())}")
+    print(f"Streaming NumPy:  {numpy_time*1000:.1f} ms, empty frames after it: "
+          f"{int(np.isnan(numpy_bboxes).any(axis=1).sum())} (gaps over {max_gap} frames stay empty)")
+    print(f"Speedup:          {pandas_time / numpy_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trackers import Tracker, BallROIDetector
+
+
+def read_frames(video_path, num_frames):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def count_gaps(ball_tracks):
+    """Frames without a ball and the longest run of them, i.e. what the interpolation has to fill"""
+    missing = np.array([1 not in ball_track for ball_track in ball_tracks])
+    longest, run = 0, 0
+    for is_missing in missing:
+        run = run + 1 if is_missing else 0
+        longest = max(longest, run)
+    return int(missing.sum()), longest
+
+
+def main(video_path='input_videos/Data-1.mp4', num_frames=200, model_path='models/best.pt'):
+    frames = read_frames(video_path, num_frames)
+    if not frames:
+        print(f"Could not read frames from {video_path}")
+        return
+    print(f"Ball detection over {len(frames)} frames")
+
+    tracker = Tracker(model_path)
+    start = time.perf_counter()
+    full_frame_tracks = tracker.get_object_tracks(frames)["ball"]
+    full_frame_time = time.perf_counter() - start
+
+    ball_detector = BallROIDetector(tracker.model)
+    start = time.perf_counter()
+    refined_tracks = tracker.refine_ball_tracks(frames, full_frame_tracks, ball_detector)
+    refine_time = time.perf_counter() - start
+    print(ball_detector.report())
+
+    ball_detector = BallROIDetector(tracker.model)
+    start = time.perf_counter()
+    roi_tracks = tracker.get_ball_tracks(frames, ball_detector)
+    roi_time = time.perf_counter() - start
+    print(ball_detector.report())
+
+    for name, ball_tracks, elapsed in (
+        ("Full frame", full_frame_tracks, full_frame_time),
+        ("Full frame + ROI refill", refined_tracks, full_frame_time + refine_time),
+        ("ROI only", roi_tracks, roi_time),
+    ):
+        missing, longest = count_gaps(ball_tracks)
+        print(f"{name:24s} missing {missing:4d} frames (longest gap {longest:3d}), "
+              f"{elapsed/len(frames)*1000:.1f} ms per frame")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import main as pipeline_main
+from utils import get_video_properties
+
+
+def write_clip(video_path, clip_path, num_frames):
+    """The first num_frames of the video, so both modes process the same short input"""
+    cap = cv2.VideoCapture(video_path)
+    fps, frame_size = get_video_properties(cap)
+    writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, frame_size)
+    frames = 0
+    while frames < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        writer.write(frame)
+        frames += 1
+    cap.release()
+    writer.release()
+    return frames
+
+
+def main(video_path='input_videos/Data-1.mp4', num_frames=300, batch_size=50):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clip_path = os.path.join(tmp_dir, 'clip.avi')
+        frames = write_clip(video_path, clip_path, num_frames)
+        if frames == 0:
+            print(f"Could not read frames from {video_path}")
+            return
+        print(f"Full render path vs headless on {frames} frames")
+
+        start = time.perf_counter()
+        pipeline_main.process_video_in_batches(clip_path, os.path.join(tmp_dir, 'output.avi'), batch_size=batch_size)
+        render_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipeline_main.process_video_headless(clip_path, os.path.join(tmp_dir, 'metrics'), batch_size=batch_size)
+        headless_time = time.perf_counter() - start
+
+    print(f"Full render: {frames / render_time:6.1f} fps ({render_time:.1f} s)")
+    print(f"Headless:    {frames / headless_time:6.1f} fps ({headless_time:.1f} s)")
+    print(f"Speedup:     {render_time / headless_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
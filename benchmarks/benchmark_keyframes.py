@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trackers import Tracker, KeyframeScheduler
+from camera_movement_estimator.camera_movement_estimator import CameraMovementEstimator
+from utils.bbox_utils import get_iou_matrix
+
+
+def read_frames(video_path, num_frames):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def compare_boxes(baseline_table, keyframe_table):
+    """Best IoU of every baseline box against the keyframe boxes of the same frame"""
+    best_ious = []
+    for frame_num in range(baseline_table.num_frames):
+        start, end = baseline_table.rows(frame_num)
+        if start == end:
+            continue
+        key_start, key_end = keyframe_table.rows(frame_num)
+        if key_start == key_end:
+            best_ious.append(np.zeros(end - start))
+            continue
+        ious = get_iou_matrix(baseline_table.columns['bbox'][start:end], keyframe_table.columns['bbox'][key_start:key_end])
+        best_ious.append(ious.max(axis=1))
+    return np.concatenate(best_ious) if best_ious else np.zeros(0)
+
+
+def main(video_path='input_videos/Data-1.mp4', num_frames=200, model_path='models/best.pt', batch_size=50):
+    frames = read_frames(video_path, num_frames)
+    if not frames:
+        print(f"Could not read frames from {video_path}")
+        return
+    print(f"Comparing keyframe mode against every-frame detection over {len(frames)} frames")
+
+    camera_movement_estimator = CameraMovementEstimator(frames[0], motion_method="median", pyramid_level=1)
+    camera_movement = camera_movement_estimator.get_camera_movement(frames)
+
+    baseline_tracker = Tracker(model_path)
+    start = time.perf_counter()
+    baseline_tracks = [
+        baseline_tracker.get_object_tracks(frames[i:i + batch_size], columnar=True)
+        for i in range(0, len(frames), batch_size)
+    ]
+    baseline_time = time.perf_counter() - start
+
+    keyframe_tracker = Tracker(model_path)
+    keyframe_scheduler = KeyframeScheduler()
+    start = time.perf_counter()
+    keyframe_tracks = [
+        keyframe_tracker.get_object_tracks_keyframes(
+            frames[i:i + batch_size], keyframe_scheduler, camera_movement[i:i + batch_size]
+        )
+        for i in range(0, len(frames), batch_size)
+    ]
+    keyframe_time = time.perf_counter() - start
+
+    print(keyframe_scheduler.report())
+    for object_type in ("players", "referees"):
+        best_ious = np.concatenate([
+            compare_boxes(baseline.table(object_type), keyframe.table(object_type))
+            for baseline, keyframe in zip(baseline_tracks, keyframe_tracks)
+        ])
+        if len(best_ious) == 0:
+            continue
+        print(f"{object_type}: mean IoU to every-frame boxes {best_ious.mean():.3f}, "
+              f"recall at IoU 0.5 {np.mean(best_ious >= 0.5)*100:.1f}%")
+    print(f"Every frame: {baseline_time:.2f} s ({len(frames)/baseline_time:.1f} fps)")
+    print(f"Keyframes:   {keyframe_time:.2f} s ({len(frames)/keyframe_time:.1f} fps)")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,65 @@
+import os
+import pickle
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from team_assigner.team_assigner import TeamAssigner
+
+
+def read_frames(video_path, num_frames):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def classify_all_players(team_assigner, frames, player_tracks):
+    """Fit on the first frame, then classify every player of every frame (no id cache)"""
+    team_assigner.assign_team_color(frames[0], player_tracks[0])
+
+    labels = []
+    start = time.perf_counter()
+    for frame, player_track in zip(frames, player_tracks):
+        bboxes = [track['bbox'] for track in player_track.values()]
+        if not bboxes:
+            continue
+        player_colors = team_assigner.get_player_colors(frame, bboxes)
+        labels.extend(team_assigner.predict_teams(player_colors).tolist())
+    return np.array(labels), time.perf_counter() - start
+
+
+def main(video_path='input_videos/Data-1.mp4', stub_path='stubs/track_stubs.pkl', num_frames=50):
+    with open(stub_path, 'rb') as f:
+        tracks = pickle.load(f)
+
+    frames = read_frames(video_path, num_frames)
+    if not frames:
+        print(f"Could not read frames from {video_path}")
+        return
+    player_tracks = tracks['players'][:len(frames)]
+    num_players = sum(len(player_track) for player_track in player_tracks)
+    print(f"Classifying {num_players} player crops over {len(frames)} frames")
+
+    reference_labels, reference_time = classify_all_players(TeamAssigner(color_mode="kmeans"), frames, player_tracks)
+    fast_labels, fast_time = classify_all_players(TeamAssigner(color_mode="fast"), frames, player_tracks)
+
+    # Team numbering depends on the cluster order, so compare up to a swap
+    agreement = np.mean(reference_labels == fast_labels)
+    agreement = max(agreement, 1 - agreement)
+    print(f"Team label agreement: {agreement*100:.2f}%")
+    print(f"KMeans per crop: {reference_time*1000:.1f} ms ({reference_time/num_players*1000:.2f} ms per player)")
+    print(f"Fast batched:    {fast_time*1000:.1f} ms ({fast_time/num_players*1000:.2f} ms per player)")
+    print(f"Speedup:         {reference_time / fast_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -4,10 +4,22 @@ import numpy as np
 import os
 import sys 
 sys.path.append('../')
-from utils.bbox_utils import measure_distance, measure_xy_distance
+from trackers.track_store import TrackStore
 
 class CameraMovementEstimator():
-    def __init__(self, frame):
+    MOTION_METHODS = ("max", "median", "affine")
+
+    def __init__(self, frame, motion_method="max", pyramid_level=0):
+        # motion_method: "max" follows the single largest feature displacement,
+        # "median" and "affine" (RANSAC partial affine) are robust global estimates
+        if motion_method not in self.MOTION_METHODS:
+            raise ValueError(f"Unknown motion method: {motion_method}")
+        self.motion_method = motion_method
+        # Optical flow runs on the frame downscaled pyramid_level times by 2;
+        # movements are returned in full-resolution pixels
+        self.pyramid_level = pyramid_level
+        self.scale = 2 ** pyramid_level
+
         self.minimum_distance = 5
 
         self.lk_params = dict(
@@ -16,7 +28,7 @@ class CameraMovementEstimator():
             criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
         )
 
-        first_frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        first_frame_grayscale = self.to_grayscale(frame)
         
         # Create a better mask for feature detection
         mask_features = np.ones_like(first_frame_grayscale) * 255
@@ -32,7 +44,20 @@ class CameraMovementEstimator():
             mask=mask_features
         )
 
+        # Re-detect features when fewer than this many (or this share of the
+        # last detection) are still being tracked
+        self.minimum_tracked_features = 10
+        self.redetect_ratio = 0.5
+        self.detected_features = 0
+
+        self.old_gray = None
+        self.old_features = None
+
     def add_adjust_positions_to_tracks(self, tracks, camera_movement_per_frame):
+        if isinstance(tracks, TrackStore):
+            tracks.apply_camera_movement(camera_movement_per_frame)
+            return
+
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
                 for track_id, track_info in track.items():
@@ -43,28 +68,45 @@ class CameraMovementEstimator():
                             position_adjusted = (position[0]-camera_movement[0], position[1]-camera_movement[1])
                             tracks[object][frame_num][track_id]['position_adjusted'] = position_adjusted
 
-    def get_camera_movement(self, frames, read_from_stub=False, stub_path=None):
-        # Read the stub 
-        if read_from_stub and stub_path is not None and os.path.exists(stub_path):
-            try:
-                with open(stub_path, 'rb') as f:
-                    camera_movement = pickle.load(f)
-                print(f"Loaded camera movement from stub: {len(camera_movement)} frames")
-                return camera_movement
-            except Exception as e:
-                print(f"Error loading camera movement stub: {e}. Regenerating...")
+    def to_grayscale(self, frame):
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        for _ in range(self.pyramid_level):
+            frame_gray = cv2.pyrDown(frame_gray)
+        return frame_gray
 
-        camera_movement = [[0, 0]] * len(frames)
+    def estimate_movement(self, good_old, good_new):
+        """Camera movement (old - new) in downscaled pixels from all tracked points at once"""
+        displacement = good_old - good_new
 
-        if len(frames) == 0:
-            return camera_movement
+        if self.motion_method == "max":
+            distance = np.hypot(displacement[:, 0], displacement[:, 1])
+            max_index = int(np.argmax(distance))
+            return displacement[max_index], distance[max_index]
 
-        # Initialize with first frame
-        old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
-        old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)
-        
-        if old_features is None:
-            print("No features found in first frame, using default Shi-Tomasi parameters")
+        if self.motion_method == "affine" and len(good_new) >= 3:
+            transform, _ = cv2.estimateAffinePartial2D(
+                good_new, good_old, method=cv2.RANSAC, ransacReprojThreshold=3.0
+            )
+            if transform is not None:
+                # Displacement of the image centre under the estimated transform
+                h, w = self.old_gray.shape
+                center = np.array([w / 2, h / 2, 1.0])
+                movement = transform @ center - center[:2]
+                return movement, np.hypot(movement[0], movement[1])
+
+        movement = np.median(displacement, axis=0)
+        return movement, np.hypot(movement[0], movement[1])
+
+    def reset(self):
+        """Forget the previous frame and tracked features, e.g. before a new video"""
+        self.old_gray = None
+        self.old_features = None
+
+    def detect_features(self, frame_gray):
+        features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+
+        if features is None and self.features['mask'] is not None:
+            print("No features found, using default Shi-Tomasi parameters")
             # Fallback to default parameters
             self.features = dict(
                 maxCorners=100,
@@ -73,77 +115,120 @@ class CameraMovementEstimator():
                 blockSize=7,
                 mask=None  # No mask
             )
-            old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)
+            features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+
+        if features is not None:
+            self.detected_features = len(features)
+        return features
+
+    def update(self, frame):
+        """
+        Camera movement (dx, dy) between the previous frame passed to update and
+        this one. The previous frame and the tracked features are kept between
+        calls, so batches can be fed one after another without a reset.
+        """
+        frame_gray = self.to_grayscale(frame)
 
-        if old_features is None:
-            print("Warning: Still no features detected. Camera movement will be zero.")
+        if self.old_gray is None:
+            self.old_gray = frame_gray
+            self.old_features = self.detect_features(frame_gray)
+            return [0, 0]
+
+        # Check if we have features to track
+        if self.old_features is None or len(self.old_features) == 0:
+            self.old_features = self.detect_features(self.old_gray)
+            if self.old_features is None:
+                self.old_gray = frame_gray
+                return [0, 0]
+
+        try:
+            new_features, status, _ = cv2.calcOpticalFlowPyrLK(
+                self.old_gray, frame_gray, self.old_features, None, **self.lk_params
+            )
+
+            # Check if tracking was successful
+            if new_features is None:
+                self.old_features = self.detect_features(frame_gray)
+                self.old_gray = frame_gray
+                return [0, 0]
+
+            # Filter only good points
+            good_new = new_features[status == 1]
+            good_old = self.old_features[status == 1]
+
+            if len(good_new) == 0:
+                self.old_features = self.detect_features(frame_gray)
+                self.old_gray = frame_gray
+                return [0, 0]
+
+            movement, distance = self.estimate_movement(
+                good_old.reshape(-1, 2).astype(np.float64), good_new.reshape(-1, 2).astype(np.float64)
+            )
+
+            if distance * self.scale > self.minimum_distance:
+                camera_movement = [float(movement[0] * self.scale), float(movement[1] * self.scale)]
+            else:
+                camera_movement = [0, 0]
+
+            # Keep following the surviving points and only re-detect once too
+            # many of them have been lost
+            if len(good_new) < max(self.minimum_tracked_features, self.detected_features * self.redetect_ratio):
+                self.old_features = self.detect_features(frame_gray)
+            else:
+                self.old_features = good_new.reshape(-1, 1, 2)
+
+            self.old_gray = frame_gray
             return camera_movement
 
-        print(f"Found {len(old_features)} features for camera movement tracking")
+        except Exception as e:
+            print(f"Error in optical flow: {e}")
+            self.old_features = self.detect_features(frame_gray)
+            self.old_gray = frame_gray
+            return [0, 0]
 
-        for frame_num in range(1, len(frames)):
-            frame_gray = cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
-            
-            # Check if we have features to track
-            if old_features is None or len(old_features) == 0:
-                # Re-detect features
-                old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)
-                if old_features is None:
-                    camera_movement[frame_num] = [0, 0]
-                    old_gray = frame_gray.copy()
-                    continue
+    def cache_params(self, reset):
+        """Everything besides the frames that determines the movement, for AnalysisCache keys"""
+        features = {key: value for key, value in self.features.items() if key != 'mask'}
+        features['masked'] = self.features['mask'] is not None
+        return {
+            "motion_method": self.motion_method,
+            "pyramid_level": self.pyramid_level,
+            "minimum_distance": self.minimum_distance,
+            "lk_params": self.lk_params,
+            "features": features,
+            "redetect": [self.minimum_tracked_features, self.redetect_ratio],
+            "reset": reset,
+        }
 
-            try:
-                new_features, status, _ = cv2.calcOpticalFlowPyrLK(
-                    old_gray, frame_gray, old_features, None, **self.lk_params
-                )
-                
-                # Check if tracking was successful
-                if new_features is None:
-                    camera_movement[frame_num] = [0, 0]
-                    old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-                    old_gray = frame_gray.copy()
-                    continue
-
-                # Filter only good points
-                good_new = new_features[status == 1]
-                good_old = old_features[status == 1]
-
-                if len(good_new) == 0:
-                    camera_movement[frame_num] = [0, 0]
-                    old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-                    old_gray = frame_gray.copy()
-                    continue
-
-                max_distance = 0
-                camera_movement_x, camera_movement_y = 0, 0
-
-                for i, (new, old) in enumerate(zip(good_new, good_old)):
-                    new_features_point = new.ravel()
-                    old_features_point = old.ravel()
-
-                    distance = measure_distance(new_features_point, old_features_point)
-                    if distance > max_distance:
-                        max_distance = distance
-                        camera_movement_x, camera_movement_y = measure_xy_distance(old_features_point, new_features_point)
-
-                if max_distance > self.minimum_distance:
-                    camera_movement[frame_num] = [camera_movement_x, camera_movement_y]
-                    # Re-detect features periodically
-                    if frame_num % 30 == 0:  # Every 30 frames
-                        old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-                else:
-                    camera_movement[frame_num] = [0, 0]
-                    old_features = good_new.reshape(-1, 1, 2)
-
-                old_gray = frame_gray.copy()
+    def get_camera_movement(self, frames, read_from_stub=False, stub_path=None, reset=True, cache_segment=None):
+        if cache_segment is not None and len(frames) > 0:
+            cache_params = self.cache_params(reset)
+            arrays = cache_segment.get('camera_movement', cache_params)
+            if arrays is not None:
+                # Pick up tracking from the end of the cached segment for the next call
+                self.reset()
+                self.update(frames[-1])
+                return np.asarray(arrays['camera_movement']).tolist()
 
+        # Read the stub 
+        if read_from_stub and stub_path is not None and os.path.exists(stub_path):
+            try:
+                with open(stub_path, 'rb') as f:
+                    camera_movement = pickle.load(f)
+                print(f"Loaded camera movement from stub: {len(camera_movement)} frames")
+                return camera_movement
             except Exception as e:
-                print(f"Error in optical flow at frame {frame_num}: {e}")
-                camera_movement[frame_num] = [0, 0]
-                old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-                old_gray = frame_gray.copy()
-                continue
+                print(f"Error loading camera movement stub: {e}. Regenerating...")
+
+        # With reset=False the movement continues from the last frame of the previous call
+        if reset:
+            self.reset()
+        camera_movement = [self.update(frame) for frame in frames]
+
+        if cache_segment is not None and len(frames) > 0:
+            cache_segment.put('camera_movement', cache_params, {
+                'camera_movement': np.asarray(camera_movement, dtype=np.float64).reshape(-1, 2)
+            })
 
         if stub_path is not None:
             try:
@@ -0,0 +1 @@
+from .frame_compositor import FrameCompositor
\ No newline at end of file
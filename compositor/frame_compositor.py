@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+
+
+class Panel:
+    """A translucent box with a static background, blended over its region of the frame only"""
+
+    def __init__(self, top_left, bottom_right, alpha, color=(255, 255, 255)):
+        self.top_left = top_left
+        self.bottom_right = bottom_right
+        self.alpha = alpha
+        self.color = color
+        self.region = None
+        self.background = None
+
+    def prepare(self, frame_shape):
+        """Clip the panel to the frame and build its background once per frame size"""
+        height, width = frame_shape[:2]
+        x1, y1 = max(self.top_left[0], 0), max(self.top_left[1], 0)
+        x2, y2 = min(self.bottom_right[0] + 1, width), min(self.bottom_right[1] + 1, height)
+        self.region = (slice(y1, y2), slice(x1, x2)) if x2 > x1 and y2 > y1 else None
+        if self.region is not None:
+            self.background = np.empty((y2 - y1, x2 - x1, 3), dtype=np.uint8)
+            self.background[:] = self.color
+
+    def blend(self, frame):
+        if self.region is None:
+            return
+        roi = frame[self.region]
+        cv2.addWeighted(self.background, self.alpha, roi, 1 - self.alpha, 0, dst=roi)
+
+
+class FrameCompositor:
+    """
+    Draws every overlay of a frame in one pass, in place: player and referee
+    ellipses with id tags, ball and possession triangles, the possession panel,
+    the camera movement panel and the speed labels.
+
+    Replaces Tracker.draw_annotations, CameraMovementEstimator.draw_camera_movement
+    and SpeedAndDistance_Estimator.draw_speed_and_distance, which each copied
+    every frame and blended full-frame overlays for their small panels. The
+    layers are drawn in the same order, so the output is the same. Frames are
+    read straight from the columnar TrackStore.
+    """
+
+    def __init__(self, possession_alpha=0.4, camera_alpha=0.6):
+        self.possession_panel = Panel((1350, 850), (1900, 970), possession_alpha)
+        self.camera_panel = Panel((0, 0), (500, 100), camera_alpha)
+        self.frame_shape = None
+
+    def _prepare(self, frame_shape):
+        if frame_shape[:2] == self.frame_shape:
+            return
+        self.frame_shape = frame_shape[:2]
+        self.possession_panel.prepare(frame_shape)
+        self.camera_panel.prepare(frame_shape)
+
+    def compose_batch(self, frames, tracks, possession_shares, camera_movement_per_frame):
+        """
+        Draw the overlays onto frames (modified in place) and return them.
+        possession_shares: (num_frames, 2) team 1/2 share of possession up to
+        each frame, from possession.PossessionStats.update_batch
+        """
+        num_frames = min(len(frames), len(possession_shares), tracks.num_frames, len(camera_movement_per_frame))
+        if num_frames == 0:
+            return []
+        self._prepare(frames[0].shape)
+
+        players = tracks.table('players')
+        referees = tracks.table('referees')
+        ball = tracks.table('ball')
+        for frame_num in range(num_frames):
+            frame = frames[frame_num]
+            self._draw_players(frame, players, frame_num)
+            self._draw_referees(frame, referees, frame_num)
+            self._draw_ball(frame, ball, frame_num)
+            self._draw_possession(frame, possession_shares[frame_num])
+            self._draw_camera_movement(frame, camera_movement_per_frame[frame_num])
+            self._draw_speed_and_distance(frame, players, frame_num)
+        return frames[:num_frames]
+
+    def _draw_players(self, frame, table, frame_num):
+        start, end = table.rows(frame_num)
+        bboxes = table.columns['bbox'][start:end].astype(np.float64)
+        colors = table.columns['team_color'][start:end]
+        has_ball = table.columns['has_ball'][start:end]
+        for index in np.flatnonzero(~np.isnan(bboxes).any(axis=1)):
+            color = (0, 0, 255) if np.isnan(colors[index]).any() else tuple(colors[index].tolist())
+            self.draw_ellipse(frame, bboxes[index], color, int(table.track_id[start + index]))
+            if has_ball[index]:
+                self.draw_triangle(frame, bboxes[index], (0, 0, 255))
+
+    def _draw_referees(self, frame, table, frame_num):
+        start, end = table.rows(frame_num)
+        bboxes = table.columns['bbox'][start:end].astype(np.float64)
+        for bbox in bboxes[~np.isnan(bboxes).any(axis=1)]:
+            self.draw_ellipse(frame, bbox, (0, 255, 255))
+
+    def _draw_ball(self, frame, table, frame_num):
+        start, end = table.rows(frame_num)
+        bboxes = table.columns['bbox'][start:end].astype(np.float64)
+        for bbox in bboxes[~np.isnan(bboxes).any(axis=1)]:
+            self.draw_triangle(frame, bbox, (0, 255, 0))
+
+    def _draw_possession(self, frame, control_share):
+        self.possession_panel.blend(frame)
+        cv2.putText(frame, f"Team 1 Ball Control: {control_share[0]*100:.2f}%", (1400, 900),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+        cv2.putText(frame, f"Team 2 Ball Control: {control_share[1]*100:.2f}%", (1400, 950),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+
+    def _draw_camera_movement(self, frame, camera_movement):
+        self.camera_panel.blend(frame)
+        x_movement, y_movement = camera_movement
+        cv2.putText(frame, f"Camera Movement X: {x_movement:.2f}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+        cv2.putText(frame, f"Camera Movement Y: {y_movement:.2f}", (10, 60),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+
+    def _draw_speed_and_distance(self, frame, table, frame_num):
+        start, end = table.rows(frame_num)
+        speed = table.columns['speed'][start:end]
+        distance = table.columns['distance'][start:end]
+        bboxes = table.columns['bbox'][start:end].astype(np.float64)
+        for index in np.flatnonzero(~np.isnan(speed) & ~np.isnan(distance) & ~np.isnan(bboxes).any(axis=1)):
+            x1, _, x2, y2 = bboxes[index]
+            position = (int((x1 + x2) / 2), int(y2) + 40)
+            cv2.putText(frame, f"{speed[index]:.2f} km/h", position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+            cv2.putText(frame, f"{distance[index]:.2f} m", (position[0], position[1] + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+    @staticmethod
+    def draw_ellipse(frame, bbox, color, track_id=None):
+        x1, _, x2, y2 = bbox
+        y2 = int(y2)
+        x_center = int((x1 + x2) / 2)
+        width = x2 - x1
+        cv2.ellipse(frame, center=(x_center, y2), axes=(int(width), int(0.35 * width)), angle=0.0,
+                    startAngle=-45, endAngle=235, color=color, thickness=2, lineType=cv2.LINE_4)
+
+        if track_id is not None:
+            y1_rect = y2 - 10 + 15
+            cv2.rectangle(frame, (x_center - 20, y1_rect), (x_center + 20, y2 + 10 + 15), color, cv2.FILLED)
+            x1_text = x_center - 20 + 12
+            if track_id > 99:
+                x1_text -= 10
+            cv2.putText(frame, f"{track_id}", (x1_text, y1_rect + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+
+    @staticmethod
+    def draw_triangle(frame, bbox, color):
+        y = int(bbox[1])
+        x = int((bbox[0] + bbox[2]) / 2)
+        triangle_points = np.array([[x, y], [x - 10, y - 20], [x + 10, y - 20]])
+        cv2.drawContours(frame, [triangle_points], 0, color, cv2.FILLED)
+        cv2.drawContours(frame, [triangle_points], 0, (0, 0, 0), 2)
@@ -0,0 +1 @@
+from .pitch_heatmaps import PitchHeatmaps
\ No newline at end of file
@@ -0,0 +1,200 @@
+import os
+
+import cv2
+import numpy as np
+
+
+class PitchHeatmaps:
+    """
+    Pitch occupancy grids of every player, both teams and the ball, updated batch by batch.
+
+    Pitch positions in metres (position_transformed) are binned into square
+    cells of cell_size metres, counting the frames spent in each cell. The
+    tracks are not kept, so memory depends on the grid size, not on the
+    length of the match. Player grids are sparse (only the cells a player
+    visited) and kept for at most max_players ids: once more ids appear, the
+    ones with the least time that are no longer on screen are dropped, which
+    are mostly fragments left by id switches. Team and ball grids are also
+    accumulated per window of window_seconds; a snapshot of each window is
+    kept when it ends. Grids are returned in seconds.
+    """
+
+    def __init__(self, fps=24, pitch_size=(23.32, 68), cell_size=0.5, window_seconds=900, max_players=200):
+        self.fps = fps
+        self.pitch_size = pitch_size
+        self.cell_size = cell_size
+        # Rows along the pitch width (y), columns along its length (x), as in the pitch coordinates
+        self.shape = (int(np.ceil(pitch_size[1] / cell_size)), int(np.ceil(pitch_size[0] / cell_size)))
+        self.num_cells = self.shape[0] * self.shape[1]
+        self.window_frames = max(1, int(round(fps * window_seconds)))
+        self.max_players = max_players
+
+        # Index 0 collects players without a team so team numbers index directly
+        self.team_counts = np.zeros((3, self.num_cells), dtype=np.int64)
+        self.ball_counts = np.zeros(self.num_cells, dtype=np.int64)
+        # Track id -> (visited cells, frames in each), both sorted by cell
+        self.player_counts = {}
+        self.window_team_counts = np.zeros((3, self.num_cells), dtype=np.int64)
+        self.window_ball_counts = np.zeros(self.num_cells, dtype=np.int64)
+        self.window_start = 0
+        self.snapshots = []
+        self.num_frames = 0
+
+    def _cells(self, positions):
+        """Flat grid cell of every (x, y) pitch position, -1 where it is missing or off the pitch"""
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        x, y = positions[:, 0], positions[:, 1]
+        valid = np.isfinite(positions).all(axis=1)
+        valid[valid] = (x[valid] >= 0) & (x[valid] <= self.pitch_size[0]) & \
+                       (y[valid] >= 0) & (y[valid] <= self.pitch_size[1])
+
+        # Points on the far edges belong to the last row or column
+        row = np.minimum(np.floor(y[valid] / self.cell_size).astype(np.int64), self.shape[0] - 1)
+        column = np.minimum(np.floor(x[valid] / self.cell_size).astype(np.int64), self.shape[1] - 1)
+        cells = np.full(len(positions), -1, dtype=np.int64)
+        cells[valid] = row * self.shape[1] + column
+        return cells
+
+    def _team_counts(self, team, cells):
+        rows = cells >= 0
+        return np.bincount(
+            team[rows] * self.num_cells + cells[rows], minlength=3 * self.num_cells
+        ).reshape(3, self.num_cells)
+
+    def _ball_counts(self, cells):
+        return np.bincount(cells[cells >= 0], minlength=self.num_cells)
+
+    def update_batch(self, tracks):
+        """Add the next batch of tracks, after teams have been assigned"""
+        num_frames = tracks.num_frames
+        players = tracks.table("players")
+        ball = tracks.table("ball")
+        player_cells = self._cells(players.columns["position_transformed"])
+        player_team = players.columns["team"].astype(np.int64)
+        ball_cells = self._cells(ball.columns["position_transformed"])
+
+        self.team_counts += self._team_counts(player_team, player_cells)
+        self.ball_counts += self._ball_counts(ball_cells)
+
+        self._update_players(players.track_id[player_cells >= 0], player_cells[player_cells >= 0])
+
+        # Window grids, split where a window ends inside the batch
+        frame = 0
+        while frame < num_frames:
+            window_position = self.num_frames + frame - self.window_start
+            end = min(num_frames, frame + self.window_frames - window_position)
+            player_rows = (players.frame >= frame) & (players.frame < end)
+            ball_rows = (ball.frame >= frame) & (ball.frame < end)
+            self.window_team_counts += self._team_counts(player_team[player_rows], player_cells[player_rows])
+            self.window_ball_counts += self._ball_counts(ball_cells[ball_rows])
+            if window_position + end - frame == self.window_frames:
+                self._close_window(self.num_frames + end)
+            frame = end
+        self.num_frames += num_frames
+
+    def _update_players(self, track_ids, cells):
+        """Add the (track id, cell) pairs of a batch to the sparse player grids"""
+        # Frames per visited (track id, cell) of the batch, sorted by track id and then cell
+        keys, counts = np.unique(track_ids.astype(np.int64) * self.num_cells + cells, return_counts=True)
+        batch_ids = keys // self.num_cells
+        id_starts = np.flatnonzero(np.r_[True, batch_ids[1:] != batch_ids[:-1]])
+        for start, end in zip(id_starts, np.r_[id_starts[1:], len(keys)]):
+            track_id = int(batch_ids[start])
+            new_cells = (keys[start:end] % self.num_cells).astype(np.int32)
+            new_counts = counts[start:end].astype(np.int32)
+            if track_id in self.player_counts:
+                old_cells, old_counts = self.player_counts[track_id]
+                new_cells, index = np.unique(np.concatenate([old_cells, new_cells]), return_inverse=True)
+                new_counts = np.bincount(index, weights=np.concatenate([old_counts, new_counts])).astype(np.int32)
+            self.player_counts[track_id] = (new_cells, new_counts)
+
+        if self.max_players is not None and len(self.player_counts) > self.max_players:
+            on_screen = set(batch_ids.tolist())
+            dropped = sorted(
+                (track_id for track_id in self.player_counts if track_id not in on_screen),
+                key=lambda track_id: self.player_counts[track_id][1].sum()
+            )[:len(self.player_counts) - self.max_players]
+            for track_id in dropped:
+                del self.player_counts[track_id]
+
+    def _snapshot(self, frame_end):
+        return {
+            "frame_start": self.window_start,
+            "frame_end": frame_end,
+            "teams": self._grid(self.window_team_counts[1:]),
+            "ball": self._grid(self.window_ball_counts),
+        }
+
+    def _close_window(self, frame_end):
+        self.snapshots.append(self._snapshot(frame_end))
+        self.window_team_counts[:] = 0
+        self.window_ball_counts[:] = 0
+        self.window_start = frame_end
+
+    def _grid(self, counts):
+        """Counts in frames as grid(s) in seconds"""
+        return counts.reshape(counts.shape[:-1] + self.shape) / self.fps
+
+    def team_grid(self, team):
+        return self._grid(self.team_counts[team])
+
+    def ball_grid(self):
+        return self._grid(self.ball_counts)
+
+    def player_grid(self, track_id):
+        counts = np.zeros(self.num_cells, dtype=np.int64)
+        if track_id in self.player_counts:
+            cells, cell_counts = self.player_counts[track_id]
+            counts[cells] = cell_counts
+        return self._grid(counts)
+
+    def window_snapshots(self, include_current=True):
+        """Snapshots of the ended windows, plus the window in progress when it has frames"""
+        if include_current and self.num_frames > self.window_start:
+            return self.snapshots + [self._snapshot(self.num_frames)]
+        return list(self.snapshots)
+
+    def to_arrays(self):
+        """All grids as named arrays, in seconds, e.g. for np.savez"""
+        arrays = {
+            "team_1": self.team_grid(1),
+            "team_2": self.team_grid(2),
+            "ball": self.ball_grid(),
+            "cell_size": np.float64(self.cell_size),
+        }
+        snapshots = self.window_snapshots()
+        arrays["window_frames"] = np.array(
+            [(snapshot["frame_start"], snapshot["frame_end"]) for snapshot in snapshots], dtype=np.int64
+        ).reshape(-1, 2)
+        arrays["window_teams"] = np.array([snapshot["teams"] for snapshot in snapshots]).reshape((-1, 2) + self.shape)
+        arrays["window_ball"] = np.array([snapshot["ball"] for snapshot in snapshots]).reshape((-1,) + self.shape)
+        for track_id in sorted(self.player_counts):
+            arrays[f"player_{track_id}"] = self.player_grid(track_id)
+        return arrays
+
+    @staticmethod
+    def render(grid, scale=8, colormap=cv2.COLORMAP_JET):
+        """BGR image of a grid, scaled to its maximum; cells never visited stay black"""
+        grid = np.asarray(grid, dtype=np.float64)
+        peak = grid.max(initial=0)
+        levels = np.zeros(grid.shape, dtype=np.uint8) if peak == 0 else np.round(grid / peak * 255).astype(np.uint8)
+        image = cv2.applyColorMap(levels, colormap)
+        image[grid == 0] = 0
+        return cv2.resize(image, (grid.shape[1] * scale, grid.shape[0] * scale), interpolation=cv2.INTER_NEAREST)
+
+    def save(self, output_dir):
+        """Write heatmaps.npz with all grids and PNG images of the team, ball and window grids"""
+        os.makedirs(output_dir, exist_ok=True)
+        np.savez_compressed(os.path.join(output_dir, "heatmaps.npz"), **self.to_arrays())
+        cv2.imwrite(os.path.join(output_dir, "team_1.png"), self.render(self.team_grid(1)))
+        cv2.imwrite(os.path.join(output_dir, "team_2.png"), self.render(self.team_grid(2)))
+        cv2.imwrite(os.path.join(output_dir, "ball.png"), self.render(self.ball_grid()))
+        for window, snapshot in enumerate(self.window_snapshots()):
+            for team in (1, 2):
+                cv2.imwrite(os.path.join(output_dir, f"window_{window:02d}_team_{team}.png"),
+                            self.render(snapshot["teams"][team - 1]))
+            cv2.imwrite(os.path.join(output_dir, f"window_{window:02d}_ball.png"), self.render(snapshot["ball"]))
+
+    def report(self):
+        return (f"Heatmaps: {self.num_frames} frames, {len(self.player_counts)} players, "
+                f"{len(self.window_snapshots())} windows")
@@ -1,5 +1,9 @@
-from utils import read_video, save_video
+from utils import read_video, read_sampled_frames, save_video, get_video_properties, create_video_writer, get_video_fingerprint
 from trackers.tracker import Tracker
+from trackers.detection_store import DetectionStore
+from trackers.keyframe_scheduler import KeyframeScheduler
+from trackers.ball_roi_detector import BallROIDetector
+from trackers.inference_backend import BACKENDS, export_model
 import cv2
 import numpy as np
 from team_assigner.team_assigner import TeamAssigner
@@ -7,19 +11,137 @@ from player_ball_assigner.player_ball_assigner import PlayerBallAssigner
 from camera_movement_estimator.camera_movement_estimator import CameraMovementEstimator
 from view_transformer.view_transformer import ViewTransformer
 from speed_and_distance_estimator.speed_and_distance_estimator import SpeedAndDistance_Estimator
+from pipeline.video_pipeline import VideoPipeline
+from pipeline.segment_parallel import SegmentParallelAnalyzer
+from pipeline.ball_lookahead import BallLookahead
+from analysis_cache.analysis_cache import AnalysisCache, hash_file
+from autotuner.batch_autotuner import BatchAutotuner
+from compositor.frame_compositor import FrameCompositor
+from possession.possession_stats import PossessionStats
+from metrics_writer.metrics_writer import MetricsWriter
+from track_export.track_export import TrackExporter
+from heatmaps.pitch_heatmaps import PitchHeatmaps
 import os
+import sys
+import time
 
 
-def process_video_in_batches(input_path, output_path, batch_size=50):
+def team_model_file(team_model_dir, fingerprint):
+    """Saved team model of the video with this fingerprint"""
+    return os.path.join(team_model_dir, f"{fingerprint}.npz")
+
+
+def prepare_team_assigner(input_path, tracker, team_assigner, team_model_dir=None, team_sample_frames=0,
+                          team_model_source=None):
+    """
+    Warm-start the team colour model from disk, or fit it on frames spread over the match.
+    team_model_source names the model of another video (e.g. the first half) to start from, so
+    team 1 and team 2 keep their labels; it is a saved .npz model or the video it was saved for.
+    """
+    fingerprint = get_video_fingerprint(input_path)
+    team_assigner.fingerprint = fingerprint
+    
+    if team_model_source is not None:
+        source_path = team_model_source
+        if not team_model_source.endswith('.npz'):
+            if team_model_dir is None:
+                raise ValueError("A team model source video needs a team model directory to look it up in")
+            source_path = team_model_file(team_model_dir, get_video_fingerprint(team_model_source))
+        if not os.path.exists(source_path):
+            raise ValueError(f"No saved team model for {team_model_source} at {source_path}")
+        if team_assigner.load_model(source_path, fingerprint, allow_other_video=True):
+            return
+    elif team_model_dir is not None:
+        if team_assigner.load_model(team_model_file(team_model_dir, fingerprint), fingerprint):
+            return
+    
+    if team_sample_frames > 0:
+        sample_frames = read_sampled_frames(input_path, team_sample_frames)
+        print(f"Fitting team colours on {len(sample_frames)} frames sampled across the video...")
+        team_assigner.fit_from_samples(sample_frames, tracker.detect_player_bboxes(sample_frames))
+    
+    # Otherwise process_batch fits the model on the first frame with players
+
+
+def tune_batch_sizes(input_path, autotuner, model_path='models/best.pt', backend="pytorch", camera_params=None):
+    """Inference and pipeline batch sizes for this machine, model and resolution, calibrated on the first frames"""
+    cap = cv2.VideoCapture(input_path)
+    _, frame_size = get_video_properties(cap)
+    tracker = Tracker(model_path, backend=backend)
+    model_key = f"{tracker.cache_params()['model']}-{backend}"
+    
+    cached = autotuner.lookup(model_key, frame_size)
+    if cached is not None:
+        cap.release()
+        return cached
+    
+    frames = []
+    for i in range(max(autotuner.pipeline_candidates)):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    
+    def run_inference(batch_frames, inference_batch_size):
+        tracker.inference_batch_size = inference_batch_size
+        tracker.detect_frames(batch_frames)
+    
+    def run_pipeline(batch_frames, inference_batch_size):
+        tracker.inference_batch_size = inference_batch_size
+        process_batch(
+            batch_frames, 0, tracker, TeamAssigner(), PlayerBallAssigner(),
+            CameraMovementEstimator(batch_frames[0], **(camera_params or {})),
+            ViewTransformer(), SpeedAndDistance_Estimator()
+        )
+    
+    return autotuner.tune(frames, run_inference, run_pipeline, model_key, frame_size)
+
+
+def video_detection_store(detection_store, input_path, video_hash, tracker):
+    """The part of the detection store for this video, weights and backend, so chunks of other runs never mix"""
+    if detection_store is None:
+        return None
+    detection_store = detection_store.for_video(
+        video_hash or hash_file(input_path), tracker.cache_params()['model'], tracker.backend
+    )
+    print(f"Storing raw detections in {detection_store.directory}")
+    return detection_store
+
+
+def save_team_model(team_assigner, team_model_dir):
+    """Save the team model under the current video, next to the models of other videos"""
+    if team_model_dir is not None and team_assigner.is_fitted():
+        team_assigner.save_model(team_model_file(team_model_dir, team_assigner.fingerprint))
+
+
+def save_heatmaps(heatmaps, heatmap_dir):
+    """Write the pitch heatmaps of a run, if it built any"""
+    if heatmaps is None:
+        return
+    heatmaps.save(heatmap_dir)
+    print(f"{heatmaps.report()}, saved to {heatmap_dir}")
+
+
+def process_video_in_batches(input_path, output_path, batch_size=50, team_model_dir=None, team_sample_frames=0,
+                             team_model_source=None, analysis_cache=None, detection_store=None,
+                             keyframe_scheduler=None, ball_roi=False, inference_batch_size=20,
+                             backend="pytorch", track_exporter=None, heatmap_dir=None,
+                             camera_params=None):
     """Process video in batches to avoid memory issues"""
     
     print(f"Processing video in batches of {batch_size} frames...")
     
     # Initialize components
-    tracker = Tracker('models/best.pt')
+    tracker = Tracker('models/best.pt', inference_batch_size, backend)
     team_assigner = TeamAssigner()
     player_assigner = PlayerBallAssigner()
-    speed_and_distance_estimator = SpeedAndDistance_Estimator()
+    # Follow the ball in crops around its predicted position to fill full-frame misses
+    ball_detector = BallROIDetector(tracker.model) if ball_roi else None
+    prepare_team_assigner(input_path, tracker, team_assigner, team_model_dir, team_sample_frames,
+                          team_model_source)
+    video_hash = analysis_cache.file_hash(input_path) if analysis_cache is not None else None
+    detection_store = video_detection_store(detection_store, input_path, video_hash, tracker)
     
     # Read first frame to initialize camera movement estimator
     cap = cv2.VideoCapture(input_path)
@@ -28,16 +150,33 @@ def process_video_in_batches(input_path, output_path, batch_size=50):
         print("Error reading first frame")
         return
     
-    camera_movement_estimator = CameraMovementEstimator(first_frame)
+    camera_movement_estimator = CameraMovementEstimator(first_frame, **(camera_params or {}))
+    # Rewind, so batches start at frame 0 and cache keys number frames as the parallel workers do
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
     view_transformer = ViewTransformer()
     
     # Get total frame count
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     print(f"Total frames: {total_frames}")
     
+    # Open the writer once and stream every batch into it, so peak memory
+    # is bounded by the batch size rather than by the match length
+    fps, frame_size = get_video_properties(cap)
+    print(f"Writing output at {fps:.2f} fps, {frame_size[0]}x{frame_size[1]}")
+    writer = create_video_writer(output_path, fps, frame_size)
+    # Speeds use the real frame rate; distances carry over from batch to batch
+    speed_and_distance_estimator = SpeedAndDistance_Estimator(fps)
+    
     # Process video batch by batch
-    all_output_frames = []
+    frames_written = 0
     frame_offset = 0
+    # Possession counts run over the whole match, not per batch
+    possession = PossessionStats(fps)
+    heatmaps = PitchHeatmaps(fps) if heatmap_dir is not None else None
+    # Panel backgrounds are prepared once and every overlay is drawn in place
+    compositor = FrameCompositor()
+    # Frames after the last ball detection wait for the next one, across batches
+    ball_lookahead = BallLookahead(tracker.ball_interpolator)
     
     while frame_offset < total_frames:
         print(f"Processing batch: frames {frame_offset} to {min(frame_offset + batch_size, total_frames)}")
@@ -53,131 +192,639 @@ def process_video_in_batches(input_path, output_path, batch_size=50):
         if not batch_frames:
             break
             
+        cache_segment = None
+        if analysis_cache is not None:
+            cache_segment = analysis_cache.segment(video_hash, frame_offset, frame_offset + len(batch_frames))
+            
         # Process this batch
         output_batch = process_batch(
             batch_frames, frame_offset, tracker, team_assigner, player_assigner,
-            camera_movement_estimator, view_transformer, speed_and_distance_estimator
+            camera_movement_estimator, view_transformer, speed_and_distance_estimator,
+            cache_segment=cache_segment, detection_store=detection_store,
+            keyframe_scheduler=keyframe_scheduler, ball_detector=ball_detector, possession=possession,
+            compositor=compositor, track_exporter=track_exporter, heatmaps=heatmaps, ball_lookahead=ball_lookahead
         )
         
-        all_output_frames.extend(output_batch)
+        for output_frame in output_batch:
+            writer.write(output_frame)
+        frames_written += len(output_batch)
         frame_offset += len(batch_frames)
         
         # Clear memory
         del batch_frames
         del output_batch
+    
+    # Frames still waiting for a ball detection keep the last one
+    output_batch = process_batch(
+        [], frame_offset, tracker, team_assigner, player_assigner,
+        camera_movement_estimator, view_transformer, speed_and_distance_estimator,
+        possession=possession, compositor=compositor, track_exporter=track_exporter, heatmaps=heatmaps,
+        ball_lookahead=ball_lookahead, flush=True
+    )
+    for output_frame in output_batch:
+        writer.write(output_frame)
+    frames_written += len(output_batch)
+        
+    cap.release()
+    writer.release()
+    save_team_model(team_assigner, team_model_dir)
+    if keyframe_scheduler is not None:
+        print(keyframe_scheduler.report())
+    if ball_detector is not None:
+        print(ball_detector.report())
+    
+    print(possession.report())
+    save_heatmaps(heatmaps, heatmap_dir)
+    print(f"Wrote {frames_written} frames to {output_path}")
+    print("Video processing completed successfully!")
+
+
+def process_video_pipelined(input_path, output_path, batch_size=50, queue_size=2, team_model_dir=None, team_sample_frames=0,
+                            team_model_source=None, analysis_cache=None, detection_store=None,
+                            inference_batch_size=20, backend="pytorch", track_exporter=None,
+                            heatmap_dir=None, camera_params=None):
+    """Process video with decode, inference, post-processing and encode overlapped in threads"""
+    
+    print(f"Processing video in pipelined mode, batches of {batch_size} frames...")
+    
+    # Initialize components
+    tracker = Tracker('models/best.pt', inference_batch_size, backend)
+    team_assigner = TeamAssigner()
+    player_assigner = PlayerBallAssigner()
+    prepare_team_assigner(input_path, tracker, team_assigner, team_model_dir, team_sample_frames,
+                          team_model_source)
+    video_hash = analysis_cache.file_hash(input_path) if analysis_cache is not None else None
+    detection_store = video_detection_store(detection_store, input_path, video_hash, tracker)
+    
+    # Read first frame to initialize camera movement estimator
+    cap = cv2.VideoCapture(input_path)
+    ret, first_frame = cap.read()
+    if not ret:
+        print("Error reading first frame")
+        return
+    
+    camera_movement_estimator = CameraMovementEstimator(first_frame, **(camera_params or {}))
+    # Rewind, so batches start at frame 0 and cache keys number frames as the parallel workers do
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    view_transformer = ViewTransformer()
+    
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"Total frames: {total_frames}")
+    
+    fps, frame_size = get_video_properties(cap)
+    writer = create_video_writer(output_path, fps, frame_size)
+    # Speeds use the real frame rate; distances carry over from batch to batch
+    speed_and_distance_estimator = SpeedAndDistance_Estimator(fps)
+    
+    state = {"frame_offset": 0, "frames_written": 0}
+    # Possession counts run over the whole match, not per batch
+    possession = PossessionStats(fps)
+    heatmaps = PitchHeatmaps(fps) if heatmap_dir is not None else None
+    # Panel backgrounds are prepared once and every overlay is drawn in place
+    compositor = FrameCompositor()
+    # Frames after the last ball detection wait for the next one, across batches
+    ball_lookahead = BallLookahead(tracker.ball_interpolator)
+    
+    def read_batch():
+        batch_frames = []
+        for i in range(batch_size):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            batch_frames.append(frame)
+        if not batch_frames:
+            return None
+        frame_offset = state["frame_offset"]
+        state["frame_offset"] += len(batch_frames)
+        return frame_offset, batch_frames
+    
+    def infer_batch(batch):
+        frame_offset, batch_frames = batch
+        cache_segment = None
+        if analysis_cache is not None:
+            cache_segment = analysis_cache.segment(video_hash, frame_offset, frame_offset + len(batch_frames))
+        
+        # Segments with cached tracks skip inference entirely
+        if cache_segment is not None and cache_segment.contains('tracks', tracker.cache_params()):
+            detections = None
+        else:
+            detections = tracker.detect_frames(batch_frames)
+        return frame_offset, batch_frames, detections, cache_segment
+    
+    def postprocess_batch(batch):
+        frame_offset, batch_frames, detections, cache_segment = batch
+        print(f"Processing batch: frames {frame_offset} to {frame_offset + len(batch_frames)}")
+        return process_batch(
+            batch_frames, frame_offset, tracker, team_assigner, player_assigner,
+            camera_movement_estimator, view_transformer, speed_and_distance_estimator,
+            detections=detections, cache_segment=cache_segment, detection_store=detection_store,
+            possession=possession, compositor=compositor, track_exporter=track_exporter,
+            heatmaps=heatmaps, ball_lookahead=ball_lookahead
+        )
+    
+    def write_batch(output_batch):
+        for output_frame in output_batch:
+            writer.write(output_frame)
+        state["frames_written"] += len(output_batch)
+    
+    video_pipeline = VideoPipeline(read_batch, infer_batch, postprocess_batch, write_batch, queue_size=queue_size)
+    try:
+        video_pipeline.run()
+        # Frames still waiting for a ball detection keep the last one
+        write_batch(process_batch(
+            [], state["frame_offset"], tracker, team_assigner, player_assigner,
+            camera_movement_estimator, view_transformer, speed_and_distance_estimator,
+            possession=possession, compositor=compositor, track_exporter=track_exporter, heatmaps=heatmaps,
+            ball_lookahead=ball_lookahead, flush=True
+        ))
+    finally:
+        cap.release()
+        writer.release()
+        print(video_pipeline.report())
+    save_team_model(team_assigner, team_model_dir)
+    
+    print(possession.report())
+    save_heatmaps(heatmaps, heatmap_dir)
+    print(f"Wrote {state['frames_written']} frames to {output_path}")
+    print("Video processing completed successfully!")
+
+
+def process_video_parallel(input_path, output_path, num_workers=None, overlap=25, batch_size=50, team_model_dir=None,
+                           team_sample_frames=0, team_model_source=None, analysis_cache=None,
+                           inference_batch_size=20, backend="pytorch", track_exporter=None,
+                           heatmap_dir=None, camera_params=None):
+    """Analyse time segments of the video in a process pool, then annotate and write it in one pass"""
+    
+    print(f"Processing video in parallel segments, batches of {batch_size} frames...")
+    
+    # Initialize components
+    tracker = Tracker('models/best.pt', inference_batch_size, backend)
+    team_assigner = TeamAssigner()
+    player_assigner = PlayerBallAssigner()
+    prepare_team_assigner(input_path, tracker, team_assigner, team_model_dir, team_sample_frames,
+                          team_model_source)
+    video_hash = analysis_cache.file_hash(input_path) if analysis_cache is not None else None
+    
+    cap = cv2.VideoCapture(input_path)
+    ret, first_frame = cap.read()
+    if not ret:
+        print("Error reading first frame")
+        return
+    camera_movement_estimator = CameraMovementEstimator(first_frame, **(camera_params or {}))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"Total frames: {total_frames}")
+    cap.release()
+    
+    # Tracking, camera movement, view transform and speed run per segment in worker processes
+    segment_analyzer = SegmentParallelAnalyzer(
+        input_path, tracker.model_path, num_workers=num_workers, overlap=overlap, batch_size=batch_size,
+        cache_dir=analysis_cache.cache_dir if analysis_cache is not None else None, video_hash=video_hash,
+        camera_params=camera_params, inference_batch_size=inference_batch_size,
+        backend=backend
+    )
+    tracks, camera_movement_per_frame = segment_analyzer.run(total_frames)
+    print(segment_analyzer.report())
+    
+    # Teams, possession and drawing need the pixels again, so the video is streamed once more
+    cap = cv2.VideoCapture(input_path)
+    fps, frame_size = get_video_properties(cap)
+    writer = create_video_writer(output_path, fps, frame_size)
+    
+    frames_written = 0
+    # Possession counts run over the whole match, not per batch
+    possession = PossessionStats(fps)
+    heatmaps = PitchHeatmaps(fps) if heatmap_dir is not None else None
+    # Panel backgrounds are prepared once and every overlay is drawn in place
+    compositor = FrameCompositor()
+    while frames_written < tracks.num_frames:
+        batch_frames = []
+        for i in range(min(batch_size, tracks.num_frames - frames_written)):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            batch_frames.append(frame)
+        if not batch_frames:
+            break
         
+        frame_end = frames_written + len(batch_frames)
+        batch_tracks = tracks.slice_frames(frames_written, frame_end)
+        output_batch = annotate_batch(
+            batch_frames, batch_tracks, camera_movement_per_frame[frames_written:frame_end],
+            team_assigner, player_assigner, possession, compositor
+        )
+        if track_exporter is not None:
+            track_exporter.write_batch(frames_written, batch_tracks)
+        if heatmaps is not None:
+            heatmaps.update_batch(batch_tracks)
+        for output_frame in output_batch:
+            writer.write(output_frame)
+        frames_written += len(output_batch)
+    
     cap.release()
+    writer.release()
+    save_team_model(team_assigner, team_model_dir)
     
-    # Save final video
-    print(f"Saving output video with {len(all_output_frames)} frames...")
-    save_video(all_output_frames, output_path)
+    print(possession.report())
+    save_heatmaps(heatmaps, heatmap_dir)
+    print(f"Wrote {frames_written} frames to {output_path}")
     print("Video processing completed successfully!")
 
 
+def process_video_headless(input_path, metrics_dir, batch_size=50, team_model_dir=None, team_sample_frames=0,
+                           team_model_source=None, analysis_cache=None, detection_store=None,
+                           keyframe_scheduler=None, ball_roi=False, inference_batch_size=20, backend="pytorch",
+                           track_exporter=None, heatmap_dir=None, camera_params=None):
+    """Analyse the video in batches and write the metrics as CSV, without drawing or encoding any frame"""
+    
+    print(f"Analysing video headless in batches of {batch_size} frames...")
+    start_time = time.perf_counter()
+    
+    # Initialize components
+    tracker = Tracker('models/best.pt', inference_batch_size, backend)
+    team_assigner = TeamAssigner()
+    player_assigner = PlayerBallAssigner()
+    ball_detector = BallROIDetector(tracker.model) if ball_roi else None
+    prepare_team_assigner(input_path, tracker, team_assigner, team_model_dir, team_sample_frames,
+                          team_model_source)
+    video_hash = analysis_cache.file_hash(input_path) if analysis_cache is not None else None
+    detection_store = video_detection_store(detection_store, input_path, video_hash, tracker)
+    
+    cap = cv2.VideoCapture(input_path)
+    ret, first_frame = cap.read()
+    if not ret:
+        print("Error reading first frame")
+        return
+    
+    camera_movement_estimator = CameraMovementEstimator(first_frame, **(camera_params or {}))
+    # Rewind, so batches start at frame 0 and cache keys number frames as the parallel workers do
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    view_transformer = ViewTransformer()
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"Total frames: {total_frames}")
+    fps, _ = get_video_properties(cap)
+    speed_and_distance_estimator = SpeedAndDistance_Estimator(fps)
+    possession = PossessionStats(fps)
+    heatmaps = PitchHeatmaps(fps) if heatmap_dir is not None else None
+    metrics_writer = MetricsWriter(metrics_dir)
+    # Frames after the last ball detection wait for the next one, across batches
+    ball_lookahead = BallLookahead(tracker.ball_interpolator)
+    
+    def write_analysed(analysed):
+        if analysed is None:
+            return
+        analysed_offset, analysed_frames, tracks, camera_movement_per_frame = analysed
+        team_ball_control, match_shares, window_shares = assign_teams_and_possession(
+            analysed_frames, tracks, team_assigner, player_assigner, possession
+        )
+        metrics_writer.write_batch(analysed_offset, tracks, camera_movement_per_frame, team_ball_control,
+                                   match_shares, window_shares)
+        if track_exporter is not None:
+            track_exporter.write_batch(analysed_offset, tracks)
+        if heatmaps is not None:
+            heatmaps.update_batch(tracks)
+    
+    frame_offset = 0
+    while frame_offset < total_frames:
+        batch_frames = []
+        for i in range(batch_size):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            batch_frames.append(frame)
+        if not batch_frames:
+            break
+        
+        cache_segment = None
+        if analysis_cache is not None:
+            cache_segment = analysis_cache.segment(video_hash, frame_offset, frame_offset + len(batch_frames))
+        
+        # The frames are only read by the detector and the team colour model, never copied or drawn on
+        write_analysed(analyze_batch(
+            batch_frames, frame_offset, tracker, camera_movement_estimator, view_transformer,
+            speed_and_distance_estimator, cache_segment=cache_segment, detection_store=detection_store,
+            keyframe_scheduler=keyframe_scheduler, ball_detector=ball_detector, ball_lookahead=ball_lookahead
+        ))
+        frame_offset += len(batch_frames)
+    
+    # Frames still waiting for a ball detection keep the last one
+    write_analysed(analyze_batch(
+        [], frame_offset, tracker, camera_movement_estimator, view_transformer, speed_and_distance_estimator,
+        ball_lookahead=ball_lookahead, flush=True
+    ))
+    
+    cap.release()
+    metrics_writer.close()
+    save_team_model(team_assigner, team_model_dir)
+    
+    elapsed = time.perf_counter() - start_time
+    print(possession.report())
+    print(metrics_writer.report())
+    save_heatmaps(heatmaps, heatmap_dir)
+    print(f"Analysed {frame_offset} frames in {elapsed:.1f} s ({frame_offset / max(elapsed, 1e-9):.1f} fps)")
+    return frame_offset
+
+
 def process_batch(batch_frames, frame_offset, tracker, team_assigner, player_assigner,
-                  camera_movement_estimator, view_transformer, speed_and_distance_estimator):
-    """Process a single batch of frames"""
+                  camera_movement_estimator, view_transformer, speed_and_distance_estimator,
+                  detections=None, cache_segment=None, detection_store=None, keyframe_scheduler=None,
+                  ball_detector=None, possession=None, compositor=None, track_exporter=None,
+                  heatmaps=None, ball_lookahead=None, flush=False):
+    """
+    Process a single batch of frames. With a ball_lookahead the frames returned
+    are the ones whose ball is final, see analyze_batch.
+    """
     
-    # Get tracks for this batch
-    tracks = tracker.get_object_tracks(
-        batch_frames,
-        read_from_stub=False,
-        stub_path=None  # Don't use stubs for batch processing
+    analysed = analyze_batch(
+        batch_frames, frame_offset, tracker, camera_movement_estimator, view_transformer,
+        speed_and_distance_estimator, detections, cache_segment, detection_store, keyframe_scheduler, ball_detector,
+        ball_lookahead, flush
     )
+    if analysed is None:
+        return []
+    frame_offset, batch_frames, tracks, camera_movement_per_frame = analysed
+    output_frames = annotate_batch(batch_frames, tracks, camera_movement_per_frame, team_assigner, player_assigner,
+                                   possession, compositor)
+    
+    # Tracks now carry teams and ball possession too
+    if track_exporter is not None:
+        track_exporter.write_batch(frame_offset, tracks)
+    if heatmaps is not None:
+        heatmaps.update_batch(tracks)
+    return output_frames
+
+
+def analyze_batch(batch_frames, frame_offset, tracker, camera_movement_estimator, view_transformer,
+                  speed_and_distance_estimator, detections=None, cache_segment=None, detection_store=None,
+                  keyframe_scheduler=None, ball_detector=None, ball_lookahead=None, flush=False):
+    """
+    Tracks with positions, speeds and distances, and the camera movement of a batch, without drawing.
+    Returns (frame_offset, frames, tracks, camera movement). With a ball_lookahead,
+    frames after the last ball detection are held back until a later batch
+    detects the ball, so the frames returned can start in an earlier batch
+    and end before the last frame of this one; None when all are held back.
+    flush=True returns the frames still held back at the end of the video.
+    """
     
-    # Ensure tracks have same number of frames
-    num_frames = len(batch_frames)
-    for track_type in ['players', 'referees', 'ball']:
-        current_len = len(tracks[track_type])
-        if current_len != num_frames:
-            if current_len < num_frames:
-                tracks[track_type].extend([{}] * (num_frames - current_len))
-            else:
-                tracks[track_type] = tracks[track_type][:num_frames]
+    if flush:
+        analysed = ball_lookahead.flush()
+    else:
+        analysed = track_batch(
+            batch_frames, frame_offset, tracker, camera_movement_estimator, detections, cache_segment,
+            detection_store, keyframe_scheduler, ball_detector, ball_lookahead
+        )
+    if analysed is None:
+        return None
+    _, _, tracks, camera_movement_per_frame = analysed
     
     # Add positions to tracks
     tracker.add_position_to_tracks(tracks)
     
-    # Camera movement estimation for this batch
-    camera_movement_per_frame = camera_movement_estimator.get_camera_movement(
-        batch_frames,
-        read_from_stub=False,
-        stub_path=None
-    )
     camera_movement_estimator.add_adjust_positions_to_tracks(tracks, camera_movement_per_frame)
     
     # View transformation
     view_transformer.add_transformed_position_to_tracks(tracks)
     
-    # Interpolate ball positions
-    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
-    
     # Speed and distance estimation
     speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)
     
-    # Team assignment (only for first batch or when needed)
-    if frame_offset == 0:
-        team_assigner.assign_team_color(batch_frames[0], tracks['players'][0])
-    
-    # Assign teams to players
-    for frame_num, player_track in enumerate(tracks['players']):
-        for player_id, track in player_track.items():
-            team = team_assigner.get_player_team(
-                batch_frames[frame_num],
-                track['bbox'],
-                player_id
-            )
-            tracks['players'][frame_num][player_id]['team'] = team
-            tracks['players'][frame_num][player_id]['team_color'] = team_assigner.team_colors[team]
-    
-    # Ball assignment with NaN checking
-    team_ball_control = []
-    for frame_num, player_track in enumerate(tracks['players']):
-        # Safely get ball bbox
-        ball_bbox = None
-        if (1 in tracks['ball'][frame_num] and 
-            'bbox' in tracks['ball'][frame_num][1] and
-            len(tracks['ball'][frame_num][1]['bbox']) == 4):
-            ball_bbox = tracks['ball'][frame_num][1]['bbox']
-            # Check for NaN values
-            import numpy as np
-            if any(np.isnan(coord) for coord in ball_bbox):
-                ball_bbox = None
-        
-        if ball_bbox is not None:
-            assigned_player = player_assigner.assign_ball_to_player(player_track, ball_bbox)
-            if assigned_player != -1:
-                tracks['players'][frame_num][assigned_player]['has_ball'] = True
-                team_ball_control.append(tracks['players'][frame_num][assigned_player]['team'])
-            else:
-                team_ball_control.append(team_ball_control[-1] if team_ball_control else 1)
-        else:
-            team_ball_control.append(team_ball_control[-1] if team_ball_control else 1)
+    return analysed
+
+
+def track_batch(batch_frames, frame_offset, tracker, camera_movement_estimator, detections=None,
+                cache_segment=None, detection_store=None, keyframe_scheduler=None, ball_detector=None,
+                ball_lookahead=None):
+    """Camera movement, tracks and ball interpolation of a batch, before the position stages"""
+    
+    # Camera movement estimation for this batch
+    camera_movement_per_frame = camera_movement_estimator.get_camera_movement(
+        batch_frames,
+        read_from_stub=False,
+        stub_path=None,
+        reset=False,  # Carry the previous frame and features over from the last batch
+        cache_segment=cache_segment
+    )
+    
+    # Get tracks for this batch
+    if keyframe_scheduler is not None:
+        # Detect on keyframes only and propagate boxes in between with the camera movement
+        tracks = tracker.get_object_tracks_keyframes(
+            batch_frames, keyframe_scheduler, camera_movement_per_frame, ball_detector=ball_detector
+        )
+    else:
+        tracks = tracker.get_object_tracks(
+            batch_frames,
+            read_from_stub=False,
+            stub_path=None,  # Don't use stubs for batch processing
+            detections=detections,
+            columnar=True,
+            cache_segment=cache_segment,
+            detection_store=detection_store,
+            frame_offset=frame_offset,
+            ball_detector=ball_detector
+        )
+    
+    # Interpolate ball positions, before the position stages so filled frames get pitch positions too
+    if ball_lookahead is not None:
+        return ball_lookahead.push(frame_offset, batch_frames, tracks, camera_movement_per_frame)
+    # Without a lookahead, frames after the last detection hold it provisionally
+    tracks["ball"] = tracker.interpolate_ball_positions(tracks.table("ball"))
+    return frame_offset, batch_frames, tracks, camera_movement_per_frame
+
+
+def annotate_batch(batch_frames, tracks, camera_movement_per_frame, team_assigner, player_assigner,
+                   possession=None, compositor=None):
+    """Assign teams and ball possession to analysed tracks and draw them onto the batch frames, in place"""
     
-    team_ball_control = np.array(team_ball_control)
+    if possession is None:
+        possession = PossessionStats()
+    _, match_shares, _ = assign_teams_and_possession(batch_frames, tracks, team_assigner, player_assigner, possession)
     
     # Draw annotations
-    output_frames = tracker.draw_annotations(batch_frames, tracks, team_ball_control)
+    if compositor is None:
+        compositor = FrameCompositor()
+    return compositor.compose_batch(batch_frames, tracks, match_shares, camera_movement_per_frame)
+
+
+def assign_teams_and_possession(batch_frames, tracks, team_assigner, player_assigner, possession):
+    """
+    Teams, team colours and ball possession of the players in analysed tracks.
+    Returns (team in control, match shares, window shares) per frame, see PossessionStats.update_batch.
+    """
     
-    # Draw camera movement
-    output_frames = camera_movement_estimator.draw_camera_movement(output_frames, camera_movement_per_frame)
+    # Fit the team colour model on the first frame with players, unless it was warm-started
+    if not team_assigner.is_fitted():
+        for frame_num, player_track in enumerate(tracks['players']):
+            if len(player_track) >= 2:
+                team_assigner.assign_team_color(batch_frames[frame_num], player_track)
+                break
     
-    # Draw speed and distance
-    output_frames = speed_and_distance_estimator.draw_speed_and_distance(output_frames, tracks)
+    # Assign teams to players, extracting colours only for players not seen before
+    player_table = tracks.table('players')
+    for frame_num in range(player_table.num_frames):
+        start, end = player_table.rows(frame_num)
+        if start == end or not team_assigner.is_fitted():
+            continue
+        player_table.columns['team'][start:end] = team_assigner.get_player_teams(
+            batch_frames[frame_num],
+            player_table.track_id[start:end],
+            player_table.columns['bbox'][start:end]
+        )
+    team_color_lookup = np.full((3, 3), np.nan, dtype=np.float32)
+    for team, color in team_assigner.team_colors.items():
+        team_color_lookup[team] = color
+    player_table.columns['team_color'][:] = team_color_lookup[player_table.columns['team']]
     
-    return output_frames
+    # Ball assignment for the whole batch in one distance computation
+    num_frames = player_table.num_frames
+    _, player_bboxes = player_table.padded('bbox')
+    _, ball_bboxes = tracks.table('ball').padded('bbox')
+    if ball_bboxes.shape[1] > 0:
+        ball_bboxes = ball_bboxes[:num_frames, 0]
+    else:
+        ball_bboxes = np.full((num_frames, 4), np.nan)
+    
+    closest_player = player_assigner.get_closest_player_indices(player_bboxes, ball_bboxes)
+    has_ball = closest_player >= 0
+    ball_rows = player_table.frame_offsets[:-1][has_ball] + closest_player[has_ball]
+    player_table.columns['has_ball'][ball_rows] = True
+    
+    # Frames without an assigned player keep the previous team in control
+    assigned_team = np.zeros(num_frames, dtype=np.int64)
+    assigned_team[has_ball] = player_table.columns['team'][ball_rows]
+    return possession.update_batch(assigned_team)
+
 
+def main(pipelined=False, keyframes=False, ball_roi=False, parallel=False, autotune=True, backend="pytorch",
+         headless=False, export_tracks=False, heatmaps=False, team_sample_frames=0, team_model_source=None,
+         camera_motion="max", camera_pyramid_level=0):
+    # Keyframe detection and the ball ROI pass run inside the sequential and headless batch loops only
+    if not headless and (parallel or pipelined):
+        mode = 'parallel' if parallel else 'pipelined'
+        unsupported = [flag for flag, enabled in (('--keyframes', keyframes), ('--ball-roi', ball_roi)) if enabled]
+        if unsupported:
+            raise ValueError(f"{' and '.join(unsupported)} not supported in {mode} mode, "
+                             f"run sequentially or with --headless instead")
 
-def main():
     input_path = 'input_videos/Data-1.mp4'
     output_path = 'output_videos/output_video.avi'
+    # Headless runs write per-frame and per-player CSVs here instead of a video
+    metrics_dir = 'output_videos/metrics'
+    # Team, player and ball occupancy grids of the pitch, as arrays and images
+    heatmap_dir = 'output_videos/heatmaps' if heatmaps else None
+    # Saved team colours, one file per video, keep team 1/2 consistent across runs and match halves
+    team_model_dir = 'stubs/team_models'
+    # Per-segment tracks and camera movement, reused when the footage, weights and parameters match
+    analysis_cache = AnalysisCache('stubs/analysis_cache')
+    # Raw detections, so tracking can be re-run with retrack.py without inference, one directory per video and model
+    detection_store = DetectionStore('stubs/detections')
+    # Camera movement: the largest feature displacement on full-resolution frames unless chosen otherwise
+    camera_params = dict(motion_method=camera_motion, pyramid_level=camera_pyramid_level)
+    # Enriched tracks as columnar files, for loading frame ranges or players without the whole match
+    track_exporter = TrackExporter('output_videos/tracks') if export_tracks else None
     
     # Create output directory if it doesn't exist
     os.makedirs('output_videos', exist_ok=True)
     
-    # Process video in batches to avoid memory issues
-    process_video_in_batches(input_path, output_path, batch_size=50)
+    # Export the weights for a CPU backend once, before any worker loads them.
+    # The INT8 variant is calibrated on frames from the same footage.
+    if backend != "pytorch":
+        calibration_frames = read_sampled_frames(input_path, 64) if backend == "onnx-int8" else None
+        export_model('models/best.pt', backend, calibration_frames=calibration_frames)
+    
+    # Batches waiting between two pipeline stages
+    queue_size = 2
+    # Batch sizes calibrated once per machine, model and resolution
+    inference_batch_size, batch_size = 20, 50
+    if autotune:
+        # Batches held in memory at once: one per worker, or every queue slot and stage of the pipeline
+        in_flight_batches = os.cpu_count() if parallel else (
+            VideoPipeline.max_batches_in_flight(queue_size) if pipelined else 1
+        )
+        inference_batch_size, batch_size = tune_batch_sizes(
+            input_path, BatchAutotuner('stubs/batch_tuning.json', in_flight_batches=in_flight_batches),
+            backend=backend, camera_params=camera_params
+        )
+    
+    if headless:
+        # Numbers only: no drawing and no encoding
+        keyframe_scheduler = KeyframeScheduler() if keyframes else None
+        process_video_headless(input_path, metrics_dir, batch_size=batch_size, team_model_dir=team_model_dir,
+                               team_sample_frames=team_sample_frames,
+                               team_model_source=team_model_source,
+                               analysis_cache=analysis_cache, detection_store=detection_store,
+                               keyframe_scheduler=keyframe_scheduler, ball_roi=ball_roi,
+                               inference_batch_size=inference_batch_size, backend=backend,
+                               track_exporter=track_exporter, heatmap_dir=heatmap_dir, camera_params=camera_params)
+    elif parallel:
+        # Analyse time segments in a process pool and stitch the track ids
+        process_video_parallel(input_path, output_path, batch_size=batch_size, team_model_dir=team_model_dir,
+                               team_sample_frames=team_sample_frames,
+                               team_model_source=team_model_source,
+                               analysis_cache=analysis_cache, inference_batch_size=inference_batch_size,
+                               backend=backend, track_exporter=track_exporter, heatmap_dir=heatmap_dir,
+                               camera_params=camera_params)
+    elif pipelined:
+        # Overlap decode, inference, post-processing and encode across threads
+        process_video_pipelined(input_path, output_path, batch_size=batch_size, queue_size=queue_size,
+                                team_model_dir=team_model_dir,
+                                team_sample_frames=team_sample_frames,
+                                team_model_source=team_model_source,
+                                analysis_cache=analysis_cache, detection_store=detection_store,
+                                inference_batch_size=inference_batch_size, backend=backend,
+                                track_exporter=track_exporter, heatmap_dir=heatmap_dir, camera_params=camera_params)
+    else:
+        # Process video in batches to avoid memory issues
+        # Keyframe mode runs the detector on a subset of frames only
+        keyframe_scheduler = KeyframeScheduler() if keyframes else None
+        process_video_in_batches(input_path, output_path, batch_size=batch_size, team_model_dir=team_model_dir,
+                                 team_sample_frames=team_sample_frames,
+                                 team_model_source=team_model_source,
+                                 analysis_cache=analysis_cache, detection_store=detection_store,
+                                 keyframe_scheduler=keyframe_scheduler, ball_roi=ball_roi,
+                                 inference_batch_size=inference_batch_size, backend=backend,
+                                 track_exporter=track_exporter, heatmap_dir=heatmap_dir, camera_params=camera_params)
+    
+    if track_exporter is not None:
+        track_exporter.close()
+        print(f"Tracks exported to {track_exporter.export_dir}")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # --keyframes runs the detector on keyframes only and propagates boxes in between
+    # --ball-roi re-detects the ball on crops around its last position. In keyframe mode the
+    # crops replace full-frame detection on the frames in between; otherwise they run on top of
+    # it, which improves ball recall but does not reduce cost.
+    # Both work sequentially and with --headless, not with --pipelined or --parallel.
+    # --team-model-from=PATH starts from the saved team colours of another video (e.g. the first half),
+    # so team 1 and team 2 keep their labels. PATH is that video or its model in stubs/team_models.
+    # --export-tracks writes the enriched tracks to output_videos/tracks as Arrow files (needs pyarrow)
+    # --heatmaps writes team, player and ball pitch heatmaps to output_videos/heatmaps
+    # --backend=onnx, --backend=openvino or --backend=onnx-int8 run an export of the weights on the CPU
+    backend = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--backend=')), "pytorch")
+    if backend not in BACKENDS:
+        print(f"Unknown backend {backend}, expected one of {', '.join(BACKENDS)}")
+        sys.exit(1)
+    # --camera-motion=median or --camera-motion=affine estimates camera movement from all tracked features
+    # instead of the single largest displacement (the default, max); --camera-pyramid-level=N runs the
+    # optical flow on frames downscaled N times by 2, which is faster on high-resolution footage
+    camera_motion = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--camera-motion=')), "max")
+    if camera_motion not in CameraMovementEstimator.MOTION_METHODS:
+        print(f"Unknown camera motion method {camera_motion}, expected one of "
+              f"{', '.join(CameraMovementEstimator.MOTION_METHODS)}")
+        sys.exit(1)
+    camera_pyramid_level = int(next(
+        (arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--camera-pyramid-level=')), 0
+    ))
+    # --team-sample-frames=N fits the team colours on N frames spread over the video instead of the first one
+    team_sample_frames = int(next(
+        (arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--team-sample-frames=')), 0
+    ))
+    main(pipelined='--pipelined' in sys.argv, keyframes='--keyframes' in sys.argv, ball_roi='--ball-roi' in sys.argv,
+         parallel='--parallel' in sys.argv, autotune='--no-autotune' not in sys.argv, backend=backend,
+         headless='--headless' in sys.argv, export_tracks='--export-tracks' in sys.argv,
+         heatmaps='--heatmaps' in sys.argv,
+         team_sample_frames=team_sample_frames, camera_motion=camera_motion,
+         camera_pyramid_level=camera_pyramid_level,
+         team_model_source=next(
+             (arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--team-model-from=')), None
+         ))
\ No newline at end of file
@@ -0,0 +1 @@
+from .metrics_writer import MetricsWriter
\ No newline at end of file
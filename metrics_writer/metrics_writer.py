@@ -0,0 +1,107 @@
+import csv
+import os
+
+import numpy as np
+
+
+FRAME_COLUMNS = [
+    "frame", "team_in_control",
+    "team_1_possession", "team_2_possession", "team_1_possession_window", "team_2_possession_window",
+    "camera_movement_x", "camera_movement_y", "ball_x", "ball_y", "players", "referees",
+]
+PLAYER_COLUMNS = [
+    "frame", "track_id", "team", "has_ball", "x", "y", "pitch_x", "pitch_y", "speed_kmh", "distance_m",
+]
+
+
+def _format(values, fmt):
+    """Column of strings for the CSV writer, empty where a float value is missing"""
+    values = np.asarray(values)
+    strings = np.char.mod(fmt, values)
+    if values.dtype.kind == 'f':
+        strings[np.isnan(values)] = ''
+    return strings
+
+
+class MetricsWriter:
+    """
+    Per-frame and per-player analysis results as CSV, for runs that need the
+    numbers but not the annotated video.
+
+    frames.csv has one row per frame: team in control, match and rolling
+    window possession shares, camera movement, ball centre and object counts.
+    players.csv has one row per player and frame: team, ball possession,
+    foot position in pixels and on the pitch (metres), speed and distance.
+    Rows are written batch by batch straight from the TrackStore columns.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.frames_path = os.path.join(output_dir, "frames.csv")
+        self.players_path = os.path.join(output_dir, "players.csv")
+        self._frames_file = open(self.frames_path, "w", newline="")
+        self._players_file = open(self.players_path, "w", newline="")
+        self._frames_writer = csv.writer(self._frames_file)
+        self._players_writer = csv.writer(self._players_file)
+        self._frames_writer.writerow(FRAME_COLUMNS)
+        self._players_writer.writerow(PLAYER_COLUMNS)
+        self.frames_written = 0
+        self.player_rows_written = 0
+
+    def write_batch(self, frame_offset, tracks, camera_movement_per_frame, team_ball_control, match_shares,
+                    window_shares):
+        """Append a batch; the shares are (num_frames, 2) arrays from PossessionStats.update_batch"""
+        num_frames = len(team_ball_control)
+        frames = np.arange(frame_offset, frame_offset + num_frames)
+        camera_movement = np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)[:num_frames]
+
+        ball = tracks.table("ball")
+        ball_center = np.full((num_frames, 2), np.nan)
+        ball_bbox = ball.columns["bbox"].astype(np.float64)
+        rows = ball.frame < num_frames
+        ball_center[ball.frame[rows]] = (ball_bbox[rows, :2] + ball_bbox[rows, 2:]) / 2
+
+        players = tracks.table("players")
+        referees = tracks.table("referees")
+        self._frames_writer.writerows(np.column_stack([
+            _format(frames, "%d"),
+            _format(team_ball_control, "%d"),
+            _format(match_shares[:, 0], "%.4f"),
+            _format(match_shares[:, 1], "%.4f"),
+            _format(window_shares[:, 0], "%.4f"),
+            _format(window_shares[:, 1], "%.4f"),
+            _format(camera_movement[:, 0], "%.2f"),
+            _format(camera_movement[:, 1], "%.2f"),
+            _format(ball_center[:, 0], "%.1f"),
+            _format(ball_center[:, 1], "%.1f"),
+            _format(np.diff(players.frame_offsets)[:num_frames], "%d"),
+            _format(np.diff(referees.frame_offsets)[:num_frames], "%d"),
+        ]).tolist())
+
+        rows = players.frame < num_frames
+        if rows.any():
+            position = players.columns["position"][rows].astype(np.float64)
+            pitch_position = players.columns["position_transformed"][rows].astype(np.float64)
+            self._players_writer.writerows(np.column_stack([
+                _format(players.frame[rows] + frame_offset, "%d"),
+                _format(players.track_id[rows], "%d"),
+                _format(players.columns["team"][rows], "%d"),
+                _format(players.columns["has_ball"][rows].astype(np.int8), "%d"),
+                _format(position[:, 0], "%.1f"),
+                _format(position[:, 1], "%.1f"),
+                _format(pitch_position[:, 0], "%.2f"),
+                _format(pitch_position[:, 1], "%.2f"),
+                _format(players.columns["speed"][rows].astype(np.float64), "%.2f"),
+                _format(players.columns["distance"][rows].astype(np.float64), "%.2f"),
+            ]).tolist())
+        self.frames_written += num_frames
+        self.player_rows_written += int(rows.sum())
+
+    def close(self):
+        self._frames_file.close()
+        self._players_file.close()
+
+    def report(self):
+        return (f"Metrics: {self.frames_written} frames to {self.frames_path}, "
+                f"{self.player_rows_written} player rows to {self.players_path}")
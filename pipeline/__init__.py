@@ -0,0 +1,3 @@
+from .video_pipeline import VideoPipeline
+from .segment_parallel import SegmentParallelAnalyzer
+from .ball_lookahead import BallLookahead
\ No newline at end of file
@@ -0,0 +1,72 @@
+import numpy as np
+
+from trackers.track_store import TrackStore, TrackTable
+
+
+class BallLookahead:
+    """
+    Holds back the frames after the last ball detection of a batch until a
+    later batch detects the ball again, so gaps across batch boundaries are
+    filled linearly by the BallInterpolator instead of holding the last box.
+
+    push() takes a tracked batch (frames, tracks before the position stages
+    and camera movement) and returns the frames whose ball is final: the
+    held back ones first, then the new ones up to the last detection.
+    Gaps longer than the interpolator's max_gap are released at once, so at
+    most max_gap frames are ever held back. flush() returns the rest at the
+    end of the video.
+    """
+
+    def __init__(self, ball_interpolator):
+        self.ball_interpolator = ball_interpolator
+        self.frame_offset = 0
+        self.frames = []
+        self.tracks = None
+        self.camera_movement = []
+
+    @staticmethod
+    def _ball_bboxes(ball_table):
+        ball_bboxes = np.full((ball_table.num_frames, 4), np.nan)
+        rows = ball_table.track_id == 1
+        # Like the dict tracks, a later row of the same frame wins
+        ball_bboxes[ball_table.frame[rows]] = ball_table.columns['bbox'][rows]
+        return ball_bboxes
+
+    def _release(self, ball_bboxes):
+        """Hand out the first len(ball_bboxes) held back frames with their final ball boxes"""
+        num_ready = len(ball_bboxes)
+        if num_ready == 0:
+            return None
+
+        ready = (
+            self.frame_offset,
+            self.frames[:num_ready],
+            self.tracks.slice_frames(0, num_ready),
+            self.camera_movement[:num_ready],
+        )
+        ready[2]["ball"] = TrackTable(np.arange(num_ready + 1), np.ones(num_ready, dtype=np.int64), ball_bboxes)
+
+        self.frame_offset += num_ready
+        self.frames = self.frames[num_ready:]
+        self.tracks = self.tracks.slice_frames(num_ready, self.tracks.num_frames) if self.frames else None
+        self.camera_movement = self.camera_movement[num_ready:]
+        return ready
+
+    def push(self, frame_offset, batch_frames, tracks, camera_movement_per_frame):
+        """
+        Add a tracked batch. Returns (frame_offset, frames, tracks, camera
+        movement) of the frames whose ball is final, or None while all of
+        them are still held back.
+        """
+        if not self.frames:
+            self.frame_offset = frame_offset
+        self.frames = self.frames + list(batch_frames)
+        self.tracks = tracks if self.tracks is None else TrackStore.concatenate([self.tracks, tracks])
+        self.camera_movement = self.camera_movement + list(camera_movement_per_frame)
+        return self._release(self.ball_interpolator.push(self._ball_bboxes(tracks.table("ball"))))
+
+    def flush(self):
+        """The frames still held back at the end of the video, holding the last ball box"""
+        if not self.frames:
+            return None
+        return self._release(self.ball_interpolator.flush())
@@ -0,0 +1,282 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+
+from trackers.tracker import Tracker
+from trackers.track_store import TrackStore
+from camera_movement_estimator.camera_movement_estimator import CameraMovementEstimator
+from view_transformer.view_transformer import ViewTransformer
+from speed_and_distance_estimator.speed_and_distance_estimator import SpeedAndDistance_Estimator
+from analysis_cache.analysis_cache import AnalysisCache
+from utils.bbox_utils import get_iou_matrix
+from utils.video_utils import get_video_properties
+
+
+def split_segments(total_frames, num_segments, overlap):
+    """
+    (frame_start, core_start, frame_end) of every segment. Frames from frame_start
+    to core_start also belong to the previous segment and are only used to warm
+    up the tracker and to stitch track ids.
+    """
+    bounds = np.linspace(0, total_frames, num_segments + 1).astype(int)
+    return [
+        (max(0, int(start) - overlap), int(start), int(end))
+        for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+    ]
+
+
+def analyze_segment(job):
+    """Tracks, camera movement, view transform and speed for one segment, run in a worker process"""
+    start_time = time.perf_counter()
+    # Every worker gets its share of the cores instead of torch and OpenCV each using all of them
+    torch.set_num_threads(job["threads"])
+    cv2.setNumThreads(job["threads"])
+
+    tracker = Tracker(job["model_path"], job["inference_batch_size"], job["backend"])
+    view_transformer = ViewTransformer()
+    analysis_cache = AnalysisCache(job["cache_dir"]) if job["cache_dir"] is not None else None
+    camera_movement_estimator = None
+
+    cap = cv2.VideoCapture(job["input_path"])
+    fps, _ = get_video_properties(cap)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, job["frame_start"])
+
+    batch_tracks = []
+    camera_movement = []
+    frame_num = job["frame_start"]
+    while frame_num < job["frame_end"]:
+        batch_frames = []
+        for _ in range(min(job["batch_size"], job["frame_end"] - frame_num)):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            batch_frames.append(frame)
+        if not batch_frames:
+            break
+
+        if camera_movement_estimator is None:
+            camera_movement_estimator = CameraMovementEstimator(batch_frames[0], **job["camera_params"])
+        cache_segment = None
+        if analysis_cache is not None:
+            # The tracker and camera estimator start cold at frame_start, which is part of the key
+            cache_segment = analysis_cache.segment(job["video_hash"], frame_num, frame_num + len(batch_frames),
+                                                   tracking_start=job["frame_start"])
+
+        tracks = tracker.get_object_tracks(batch_frames, columnar=True, cache_segment=cache_segment)
+        movement = camera_movement_estimator.get_camera_movement(batch_frames, reset=False, cache_segment=cache_segment)
+
+        batch_tracks.append(tracks)
+        camera_movement.extend(movement)
+        frame_num += len(batch_frames)
+    cap.release()
+
+    if not batch_tracks:
+        return None
+
+    # Ball gaps and speed windows span the whole segment rather than one batch
+    tracks = TrackStore.concatenate(batch_tracks)
+    tracks["ball"] = tracker.interpolate_ball_positions(tracks.table("ball"))
+    # Positions after the interpolation, so filled ball frames get them too
+    tracker.add_position_to_tracks(tracks)
+    camera_movement_estimator.add_adjust_positions_to_tracks(tracks, camera_movement)
+    view_transformer.add_transformed_position_to_tracks(tracks)
+    SpeedAndDistance_Estimator(fps).add_speed_and_distance_to_tracks(tracks)
+
+    return {
+        "frame_start": job["frame_start"],
+        "core_start": job["core_start"],
+        "tracks": tracks.to_arrays(),
+        "camera_movement": np.asarray(camera_movement, dtype=np.float64).reshape(-1, 2),
+        "elapsed": time.perf_counter() - start_time,
+    }
+
+
+def stitch_track_ids(previous_table, next_table, min_iou=0.5):
+    """
+    Match the ids of next_table to those of previous_table, two tables covering
+    the same overlap frames, by box IoU accumulated over those frames.
+    Returns {next id: previous id} for the ids that matched.
+    """
+    previous_ids = np.unique(previous_table.track_id)
+    next_ids = np.unique(next_table.track_id)
+    iou_sum = np.zeros((len(previous_ids), len(next_ids)))
+    together = np.zeros((len(previous_ids), len(next_ids)))
+
+    for frame_num in range(min(previous_table.num_frames, next_table.num_frames)):
+        previous_start, previous_end = previous_table.rows(frame_num)
+        next_start, next_end = next_table.rows(frame_num)
+        if previous_start == previous_end or next_start == next_end:
+            continue
+        ious = get_iou_matrix(
+            previous_table.columns['bbox'][previous_start:previous_end],
+            next_table.columns['bbox'][next_start:next_end]
+        )
+        rows = np.searchsorted(previous_ids, previous_table.track_id[previous_start:previous_end])
+        columns = np.searchsorted(next_ids, next_table.track_id[next_start:next_end])
+        np.add.at(iou_sum, (rows[:, None], columns[None, :]), ious)
+        np.add.at(together, (rows[:, None], columns[None, :]), 1)
+
+    # Greedy one-to-one assignment, pairs seen together longest with high IoU first
+    mean_iou = iou_sum / np.maximum(together, 1)
+    mapping = {}
+    used_previous = set()
+    for index in np.argsort(-iou_sum, axis=None):
+        row, column = np.unravel_index(index, iou_sum.shape)
+        if iou_sum[row, column] <= 0:
+            break
+        if mean_iou[row, column] < min_iou or row in used_previous or int(next_ids[column]) in mapping:
+            continue
+        mapping[int(next_ids[column])] = int(previous_ids[row])
+        used_previous.add(row)
+    return mapping
+
+
+def _remap_ids(track_id, mapping):
+    unique_ids, inverse = np.unique(track_id, return_inverse=True)
+    return np.array([mapping[int(unique_id)] for unique_id in unique_ids], dtype=np.int64)[inverse].reshape(-1)
+
+
+class SegmentParallelAnalyzer:
+    """
+    Runs the per-frame analysis (tracker, camera movement, view transform and
+    speed) of time segments of a video in a pool of processes.
+
+    Each segment starts `overlap` frames before its own range, so the ByteTrack
+    ids of consecutive segments can be matched by box IoU on those shared
+    frames. The stitched tracks use one set of ids for the whole video, and
+    distance totals continue from the previous segment.
+    """
+
+    def __init__(self, input_path, model_path, num_workers=None, overlap=25, batch_size=50, cache_dir=None,
+                 video_hash=None, camera_params=None, min_stitch_iou=0.5, inference_batch_size=20,
+                 backend="pytorch"):
+        self.input_path = input_path
+        self.model_path = model_path
+        self.num_workers = num_workers or os.cpu_count()
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.cache_dir = cache_dir
+        self.video_hash = video_hash
+        # CameraMovementEstimator arguments, its defaults when None
+        self.camera_params = camera_params or {}
+        self.min_stitch_iou = min_stitch_iou
+        self.inference_batch_size = inference_batch_size
+        self.backend = backend
+
+        self.segment_times = []
+        self.wall_time = 0.0
+        self.stitched_ids = 0
+        self.distinct_ids = 0
+
+    def run(self, total_frames):
+        """Stitched TrackStore and per-frame camera movement of the whole video"""
+        start_time = time.perf_counter()
+        threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+        jobs = [
+            {
+                "input_path": self.input_path,
+                "model_path": self.model_path,
+                "frame_start": frame_start,
+                "core_start": core_start,
+                "frame_end": frame_end,
+                "batch_size": self.batch_size,
+                "inference_batch_size": self.inference_batch_size,
+                "backend": self.backend,
+                "cache_dir": self.cache_dir,
+                "video_hash": self.video_hash,
+                "camera_params": self.camera_params,
+                "threads": threads,
+            }
+            for frame_start, core_start, frame_end in split_segments(total_frames, self.num_workers, self.overlap)
+        ]
+        print(f"Analysing {len(jobs)} segments in {self.num_workers} processes ({threads} threads each)...")
+
+        # Spawned workers do not inherit torch or OpenCV thread pools from the parent
+        with ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = [result for result in executor.map(analyze_segment, jobs) if result is not None]
+
+        tracks, camera_movement = self.stitch(results)
+        self.wall_time = time.perf_counter() - start_time
+        return tracks, camera_movement
+
+    def stitch(self, results):
+        self.segment_times = [result["elapsed"] for result in results]
+        stitched = []
+        camera_movement = []
+        previous_tracks = None
+        total_distance = {}
+        next_id = 1
+
+        for result in results:
+            tracks = TrackStore.from_arrays(result["tracks"])
+            warm_up = result["core_start"] - result["frame_start"]
+
+            for object_type in ("players", "referees"):
+                table = tracks.table(object_type)
+                mapping = {}
+                if previous_tracks is not None and warm_up > 0:
+                    previous_table = previous_tracks.table(object_type)
+                    overlap = min(warm_up, previous_table.num_frames)
+                    mapping = stitch_track_ids(
+                        previous_table.slice_frames(previous_table.num_frames - overlap, previous_table.num_frames),
+                        table.slice_frames(warm_up - overlap, warm_up),
+                        self.min_stitch_iou
+                    )
+                self.stitched_ids += len(mapping)
+
+                # Ids without a match in the previous segment get fresh ones
+                for track_id in np.unique(table.track_id):
+                    if int(track_id) not in mapping:
+                        mapping[int(track_id)] = next_id
+                        next_id += 1
+                table.track_id = _remap_ids(table.track_id, mapping)
+
+            self._continue_distance(tracks.table("players"), warm_up, total_distance)
+
+            core = tracks.slice_frames(warm_up, tracks.num_frames)
+            stitched.append(core)
+            camera_movement.append(result["camera_movement"][warm_up:])
+            # The previous segment's overlap is matched against its stitched ids
+            previous_tracks = core
+
+        if not stitched:
+            return TrackStore.from_frame_arrays({"players": [], "referees": [], "ball": []}), []
+        tracks = TrackStore.concatenate(stitched)
+        self.distinct_ids = len(np.unique(np.concatenate([
+            tracks.table(object_type).track_id for object_type in ("players", "referees")
+        ])))
+        return tracks, np.concatenate(camera_movement).tolist()
+
+    def _continue_distance(self, table, warm_up, total_distance):
+        """Shift a segment's cumulative distances so they continue from the previous segment"""
+        distance = table.columns["distance"]
+        warm_up_rows = table.frame_offsets[warm_up] if warm_up < len(table.frame_offsets) else len(table)
+
+        for track_id in np.unique(table.track_id):
+            rows = table.track_id == track_id
+            # Distance the segment already covered during the warm-up was counted before
+            warm_up_distance = distance[:warm_up_rows][rows[:warm_up_rows]]
+            warm_up_total = np.nanmax(warm_up_distance) if np.isfinite(warm_up_distance).any() else 0.0
+            offset = total_distance.get(int(track_id), warm_up_total) - warm_up_total
+
+            core_rows = rows.copy()
+            core_rows[:warm_up_rows] = False
+            distance[core_rows] += offset
+            if np.isfinite(distance[core_rows]).any():
+                total_distance[int(track_id)] = float(np.nanmax(distance[core_rows]))
+
+    def report(self):
+        if not self.segment_times:
+            return "Segment-parallel analysis: no segments processed"
+        busy_time = sum(self.segment_times)
+        return "\n".join([
+            f"Segment-parallel analysis: {len(self.segment_times)} segments in {self.wall_time:.1f} s "
+            f"(sum of segment times {busy_time:.1f} s, {busy_time / max(self.wall_time, 1e-9):.1f}x parallel)",
+            f"  Slowest segment: {max(self.segment_times):.1f} s, fastest: {min(self.segment_times):.1f} s",
+            f"  Track ids: {self.stitched_ids} stitched across segment boundaries, {self.distinct_ids} distinct",
+        ])
@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+
+
+_END_OF_STREAM = object()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.busy_time = 0.0
+        self.wait_input_time = 0.0
+        self.wait_output_time = 0.0
+        self.items = 0
+
+    def utilisation(self, wall_time):
+        if wall_time <= 0:
+            return 0.0
+        return self.busy_time / wall_time
+
+
+class VideoPipeline:
+    """
+    Runs decode -> inference -> post-processing -> encode as overlapped stages.
+
+    Each stage runs in its own thread and hands batches to the next one through
+    a bounded queue, so a slow stage applies backpressure to the stages before it
+    instead of letting decoded frames pile up in memory. Every stage consumes its
+    queue in FIFO order, which keeps batches (and ByteTrack state) in frame order.
+    """
+
+    # decode, inference, postprocess and encode, with a queue between each pair
+    NUM_STAGES = 4
+
+    @classmethod
+    def max_batches_in_flight(cls, queue_size):
+        """Batches held in memory at most: every queue full and one batch in each stage"""
+        return (cls.NUM_STAGES - 1) * queue_size + cls.NUM_STAGES
+
+    def __init__(self, read_batch, infer_batch, process_batch, write_batch, queue_size=2):
+        # read_batch() -> batch or None at end of video
+        # infer_batch(batch) -> batch, process_batch(batch) -> batch
+        # write_batch(batch) -> None
+        self.stage_functions = [
+            ("decode", read_batch),
+            ("inference", infer_batch),
+            ("postprocess", process_batch),
+            ("encode", write_batch),
+        ]
+        self.queue_size = queue_size
+        self.stats = [StageStats(name) for name, _ in self.stage_functions]
+        self.wall_time = 0.0
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, output_queue, item, stats):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                output_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.wait_output_time += time.perf_counter() - start
+
+    def _get(self, input_queue, stats):
+        start = time.perf_counter()
+        item = _END_OF_STREAM
+        while not self._stop.is_set():
+            try:
+                item = input_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stats.wait_input_time += time.perf_counter() - start
+        return item
+
+    def _run_stage(self, stage_index, function, input_queue, output_queue):
+        stats = self.stats[stage_index]
+        try:
+            while not self._stop.is_set():
+                if input_queue is None:
+                    item = None
+                else:
+                    item = self._get(input_queue, stats)
+                    if item is _END_OF_STREAM:
+                        break
+
+                start = time.perf_counter()
+                result = function() if input_queue is None else function(item)
+                stats.busy_time += time.perf_counter() - start
+
+                # The source stage signals the end of the video by returning None
+                if input_queue is None and result is None:
+                    break
+                stats.items += 1
+
+                if output_queue is not None:
+                    self._put(output_queue, result, stats)
+        except Exception as e:
+            print(f"Error in pipeline stage '{stats.name}': {e}")
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            if output_queue is not None and not self._stop.is_set():
+                self._put(output_queue, _END_OF_STREAM, stats)
+
+    def run(self):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stage_functions) - 1)]
+
+        threads = []
+        for stage_index, (name, function) in enumerate(self.stage_functions):
+            input_queue = queues[stage_index - 1] if stage_index > 0 else None
+            output_queue = queues[stage_index] if stage_index < len(queues) else None
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(stage_index, function, input_queue, output_queue),
+                name=f"pipeline-{name}",
+                daemon=True
+            )
+            threads.append(thread)
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+
+        return self.stats
+
+    def report(self):
+        lines = [f"Pipeline stage utilisation over {self.wall_time:.2f}s:"]
+        for stats in self.stats:
+            lines.append(
+                f"  {stats.name:<12} busy {stats.busy_time:8.2f}s "
+                f"({stats.utilisation(self.wall_time)*100:5.1f}%), "
+                f"waiting for input {stats.wait_input_time:8.2f}s, "
+                f"blocked on output {stats.wait_output_time:8.2f}s, "
+                f"{stats.items} batches"
+            )
+        if any(stats.items for stats in self.stats):
+            bottleneck = max(self.stats, key=lambda s: s.busy_time)
+            lines.append(f"  Throughput is limited by the '{bottleneck.name}' stage")
+        return "\n".join(lines)
@@ -35,4 +35,50 @@ class PlayerBallAssigner():
                     minimum_distance = distance
                     assigned_player = player_id
 
-        return assigned_player
\ No newline at end of file
+        return assigned_player
+
+    def get_closest_player_indices(self, player_bboxes, ball_bboxes):
+        """
+        Vectorized assign_ball_to_player over a whole batch.
+
+        player_bboxes: (F, P, 4) player boxes per frame, padded with NaN
+        ball_bboxes: (F, 4) ball box per frame, NaN where there is no ball
+        Returns the (F,) index of the assigned player slot per frame, -1 if none.
+        """
+        player_bboxes = np.asarray(player_bboxes, dtype=np.float64)
+        ball_bboxes = np.asarray(ball_bboxes, dtype=np.float64).reshape(-1, 4)
+        num_frames = ball_bboxes.shape[0]
+        if player_bboxes.size == 0:
+            return np.full(num_frames, -1, dtype=np.int64)
+
+        # Same truncation as get_center_of_bbox
+        ball_x = np.trunc((ball_bboxes[:, 0] + ball_bboxes[:, 2]) / 2)[:, None]
+        ball_y = np.trunc((ball_bboxes[:, 1] + ball_bboxes[:, 3]) / 2)[:, None]
+
+        # Distance from the ball to the bottom-left and bottom-right corners of each player
+        foot_y = player_bboxes[:, :, 3]
+        distance_left = np.hypot(player_bboxes[:, :, 0] - ball_x, foot_y - ball_y)
+        distance_right = np.hypot(player_bboxes[:, :, 2] - ball_x, foot_y - ball_y)
+        distance = np.fmin(distance_left, distance_right)
+
+        # NaN boxes (padding, missing ball) never get the ball
+        distance = np.where(np.isnan(distance), np.inf, distance)
+        distance[distance >= self.max_player_ball_distance] = np.inf
+
+        closest = np.argmin(distance, axis=1)
+        has_player = np.isfinite(distance[np.arange(num_frames), closest])
+        return np.where(has_player, closest, -1)
+
+    def assign_ball_to_players_batch(self, player_ids, player_bboxes, ball_bboxes):
+        """
+        Batch version of assign_ball_to_player.
+
+        player_ids: (F, P) track ids matching player_bboxes, padded with -1
+        Returns the (F,) assigned player id per frame, -1 if none.
+        """
+        player_ids = np.asarray(player_ids)
+        closest = self.get_closest_player_indices(player_bboxes, ball_bboxes)
+        if player_ids.size == 0:
+            return closest
+        assigned = player_ids[np.arange(len(closest)), np.maximum(closest, 0)]
+        return np.where(closest >= 0, assigned, -1)
\ No newline at end of file
@@ -0,0 +1 @@
+from .possession_stats import PossessionStats
\ No newline at end of file
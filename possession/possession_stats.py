@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class PossessionStats:
+    """
+    Match-wide ball possession, updated once per frame.
+
+    Keeps running frame counts per team for the whole match plus a ring
+    buffer of the team in control over the last window_seconds, so both the
+    match totals and the rolling-window shares are O(1) to update and read.
+    Frames where no player is assigned the ball count for the team that
+    last had it.
+    """
+
+    def __init__(self, fps=24, window_seconds=300, initial_team=1):
+        self.fps = fps
+        self.window_seconds = window_seconds
+        self.last_team = initial_team
+        # Index 0 is unused so team numbers index directly
+        self.team_frames = np.zeros(3, dtype=np.int64)
+        self.window_frames = np.zeros(3, dtype=np.int64)
+        self.window = np.zeros(max(1, int(round(fps * window_seconds))), dtype=np.int8)
+        self.window_position = 0
+        self.num_frames = 0
+
+    def update(self, team):
+        """Add one frame; team is the team of the player with the ball, or 0 when nobody has it"""
+        if team in (1, 2):
+            self.last_team = team
+        team = self.last_team
+
+        # The frame leaving the window once it is full
+        if self.num_frames >= len(self.window):
+            self.window_frames[self.window[self.window_position]] -= 1
+        self.window[self.window_position] = team
+        self.window_position = (self.window_position + 1) % len(self.window)
+        self.window_frames[team] += 1
+        self.team_frames[team] += 1
+        self.num_frames += 1
+        return team
+
+    @staticmethod
+    def _shares(frames):
+        total = frames[1] + frames[2]
+        if total == 0:
+            return 0.5, 0.5
+        return frames[1] / total, frames[2] / total
+
+    def match_shares(self):
+        """(team 1, team 2) share of possession over the match so far"""
+        return self._shares(self.team_frames)
+
+    def window_shares(self):
+        """(team 1, team 2) share of possession over the last window_seconds"""
+        return self._shares(self.window_frames)
+
+    def update_batch(self, assigned_team):
+        """
+        Add a batch of frames. assigned_team: team per frame of the player
+        with the ball, 0 where nobody has it.
+        Returns (team in control, match shares, window shares) per frame, the
+        shares as (num_frames, 2) arrays for the overlay.
+        """
+        num_frames = len(assigned_team)
+        team_ball_control = np.zeros(num_frames, dtype=np.int64)
+        match_shares = np.zeros((num_frames, 2))
+        window_shares = np.zeros((num_frames, 2))
+        for frame_num, team in enumerate(np.asarray(assigned_team).tolist()):
+            team_ball_control[frame_num] = self.update(team)
+            match_shares[frame_num] = self.match_shares()
+            window_shares[frame_num] = self.window_shares()
+        return team_ball_control, match_shares, window_shares
+
+    def window_minutes(self):
+        """Length of the window covered so far, shorter than window_seconds early in the match"""
+        return min(self.num_frames, len(self.window)) / self.fps / 60
+
+    def to_dict(self):
+        """
+        Match and window shares as percentages, in the format of
+        match_statistics['ball_possession'] in the LLMExplainer analysis data
+        """
+        team_1, team_2 = self.match_shares()
+        window_1, window_2 = self.window_shares()
+        return {
+            "team_1": f"{team_1*100:.1f}%",
+            "team_2": f"{team_2*100:.1f}%",
+            "frames": self.num_frames,
+            "window_minutes": round(self.window_minutes(), 1),
+            "window_team_1": f"{window_1*100:.1f}%",
+            "window_team_2": f"{window_2*100:.1f}%",
+        }
+
+    def report(self):
+        if self.num_frames == 0:
+            return "Possession: no frames processed"
+        shares = self.to_dict()
+        return (
+            f"Possession over {self.num_frames} frames: team 1 {shares['team_1']}, team 2 {shares['team_2']} "
+            f"(last {shares['window_minutes']:.1f} min: team 1 {shares['window_team_1']}, "
+            f"team 2 {shares['window_team_2']})"
+        )
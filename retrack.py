@@ -0,0 +1,62 @@
+import argparse
+import pickle
+import os
+from trackers.tracker import Tracker
+from trackers.detection_store import DetectionStore
+from analysis_cache.analysis_cache import hash_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild tracks from stored raw detections without running the model")
+    parser.add_argument('--detections', default='stubs/detections', help="DetectionStore directory written by main.py")
+    parser.add_argument('--video', default=None,
+                        help="Video the detections were stored for; picks its directory inside --detections")
+    parser.add_argument('--model', default='models/best.pt', help="Weights the detections were made with, with --video")
+    parser.add_argument('--backend', default='pytorch', help="Inference backend the detections were made with, with --video")
+    parser.add_argument('--output', default='stubs/retracked_tracks.pkl',
+                        help="Where to write the rebuilt tracks, in the track stub layout (a list of dicts per object type)")
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--end', type=int, default=None)
+    parser.add_argument('--min-confidence', type=float, default=None)
+    parser.add_argument('--no-goalkeeper-remap', action='store_true', help="Drop goalkeepers instead of tracking them as players")
+    parser.add_argument('--track-activation-threshold', type=float, default=None)
+    parser.add_argument('--lost-track-buffer', type=int, default=None)
+    parser.add_argument('--minimum-matching-threshold', type=float, default=None)
+    parser.add_argument('--frame-rate', type=int, default=None)
+    args = parser.parse_args()
+
+    tracker_params = {
+        name: value for name, value in {
+            'track_activation_threshold': args.track_activation_threshold,
+            'lost_track_buffer': args.lost_track_buffer,
+            'minimum_matching_threshold': args.minimum_matching_threshold,
+            'frame_rate': args.frame_rate,
+        }.items() if value is not None
+    }
+
+    detection_store = DetectionStore(args.detections)
+    if args.video is not None:
+        detection_store = detection_store.for_video(hash_file(args.video), hash_file(args.model), args.backend)
+
+    tracker = Tracker(None)
+    tracks = tracker.retrack(
+        detection_store,
+        frame_start=args.start,
+        frame_end=args.end,
+        tracker_params=tracker_params,
+        min_confidence=args.min_confidence,
+        goalkeeper_as_player=not args.no_goalkeeper_remap,
+        # Same layout as the track stubs, so the file can be passed as a stub_path
+        columnar=False
+    )
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'wb') as f:
+        pickle.dump(tracks, f)
+    print(f"Saved {len(tracks['players'])} frames of tracks to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,37 @@
 import cv2
+import numpy as np
 import sys 
 sys.path.append('../')
 from utils import measure_distance ,get_foot_position
+from trackers.track_store import TrackStore
 
 class SpeedAndDistance_Estimator():
-    def __init__(self):
-        self.frame_window=5
-        self.frame_rate=24
+    """
+    Speed over windows of frame_window frames and cumulative distance per track.
+
+    The estimator is meant to be fed consecutive batches of one video: the
+    distance totals and the last transformed position of every track carry
+    over from batch to batch, so distances keep growing over the whole match
+    and the movement across a batch boundary is counted too.
+    """
+
+    def __init__(self, frame_rate=24, frame_window=5):
+        self.frame_window=frame_window
+        self.frame_rate=frame_rate
+        # object type -> {track_id: metres covered so far}
+        self.total_distance = {}
+        # object type -> {track_id: position_transformed on the last frame of the previous batch}
+        self.last_positions = {}
     
     def add_speed_and_distance_to_tracks(self,tracks):
-        total_distance= {}
+        if isinstance(tracks, TrackStore):
+            for object, table in tracks.tables.items():
+                if object == "ball" or object == "referees":
+                    continue
+                self._add_to_table(object, table)
+            return
+
+        total_distance = self.total_distance
 
         for object, object_tracks in tracks.items():
             if object == "ball" or object == "referees":
@@ -46,6 +68,53 @@ class SpeedAndDistance_Estimator():
                             continue
                         tracks[object][frame_num_batch][track_id]['speed'] = speed_km_per_hour
                         tracks[object][frame_num_batch][track_id]['distance'] = total_distance[object][track_id]
+
+    def _add_to_table(self, object, table):
+        """Vectorized add_speed_and_distance_to_tracks for one TrackTable, continuing from earlier batches"""
+        num_frames = table.num_frames
+        total_distance = self.total_distance.setdefault(object, {})
+        if num_frames == 0 or len(table) == 0:
+            return
+
+        # Positions as a (frame, track) grid; like the dict tracks, a later row of the same id wins
+        track_ids, track_index = np.unique(table.track_id, return_inverse=True)
+        track_index = track_index.reshape(-1)
+        positions = np.full((num_frames, len(track_ids), 2), np.nan)
+        positions[table.frame, track_index] = table.columns['position_transformed']
+
+        totals = np.array([total_distance.get(int(track_id), 0.0) for track_id in track_ids])
+
+        # Movement between the last frame of the previous batch and the first one of this batch
+        last_positions = self.last_positions.get(object, {})
+        previous = np.array([last_positions.get(int(track_id), (np.nan, np.nan)) for track_id in track_ids])
+        boundary = np.linalg.norm(positions[0] - previous, axis=1)
+        totals += np.where(np.isfinite(boundary), boundary, 0.0)
+
+        # Windows start every frame_window frames and end at the next start, the last one at the last frame
+        starts = np.arange(0, num_frames, self.frame_window)
+        ends = np.minimum(starts + self.frame_window, num_frames - 1)
+        starts, ends = starts[ends > starts], ends[ends > starts]
+
+        if len(starts) > 0:
+            distance = np.linalg.norm(positions[ends] - positions[starts], axis=2)
+            valid = np.isfinite(distance)
+            speed = distance / ((ends - starts) / self.frame_rate)[:, None] * 3.6
+            cumulative = totals + np.cumsum(np.where(valid, distance, 0.0), axis=0)
+
+            # Every frame takes the values of its window; the last frame closes the last window
+            window = np.minimum(table.frame // self.frame_window, len(starts) - 1)
+            rows = valid[window, track_index]
+            table.columns['speed'][rows] = speed[window[rows], track_index[rows]]
+            table.columns['distance'][rows] = cumulative[window[rows], track_index[rows]]
+            totals = cumulative[-1]
+
+        for track_id, total in zip(track_ids.tolist(), totals.tolist()):
+            total_distance[track_id] = total
+        last_frame = positions[-1]
+        self.last_positions[object] = {
+            int(track_id): tuple(position)
+            for track_id, position in zip(track_ids, last_frame.tolist()) if np.isfinite(position).all()
+        }
     
     def draw_speed_and_distance(self,frames,tracks):
         output_frames = []
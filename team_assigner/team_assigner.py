@@ -1,10 +1,28 @@
 from sklearn.cluster import KMeans
+import numpy as np
+import os
 
 class TeamAssigner:
-    def __init__(self):
+    def __init__(self, color_mode="fast"):
+        # "fast": batched NumPy 2-means over all crops of a frame at once
+        # "kmeans": reference sklearn KMeans fit per player crop
+        if color_mode not in ("fast", "kmeans"):
+            raise ValueError(f"Unknown color mode: {color_mode}")
+        self.color_mode = color_mode
         self.team_colors = {}
         self.player_team_dict = {}
-    
+        self.kmeans = None
+        self.team_centers = None
+        self.fingerprint = None
+        # Jersey colours the model was fitted on, kept (bounded) for incremental refits
+        self.color_samples = np.zeros((0, 3))
+        self.max_color_samples = 2000
+
+        # Each top-half crop is sampled on a fixed grid so every crop in a frame
+        # can be clustered together in one array
+        self.sample_size = 16
+        self.color_iterations = 6
+
     def get_clustering_model(self,image):
         # Reshape the image to 2D array
         image_2d = image.reshape(-1,3)
@@ -16,6 +34,9 @@ class TeamAssigner:
         return kmeans
 
     def get_player_color(self,frame,bbox):
+        if self.color_mode == "fast":
+            return self.get_player_colors(frame,[bbox])[0]
+
         image = frame[int(bbox[1]):int(bbox[3]),int(bbox[0]):int(bbox[2])]
 
         top_half_image = image[0:int(image.shape[0]/2),:]
@@ -38,21 +59,175 @@ class TeamAssigner:
 
         return player_color
 
-    def assign_team_color(self,frame, player_detections):
-        
-        player_colors = []
-        for _, player_detection in player_detections.items():
-            bbox = player_detection["bbox"]
-            player_color =  self.get_player_color(frame,bbox)
-            player_colors.append(player_color)
-        
+    def sample_top_half_crops(self,frame,bboxes):
+        """Sample the top half of every bbox on a fixed grid -> (N, S, S, 3) float32"""
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        height, width = frame.shape[:2]
+        x1 = np.clip(np.trunc(bboxes[:, 0]), 0, width - 1)
+        y1 = np.clip(np.trunc(bboxes[:, 1]), 0, height - 1)
+        x2 = np.clip(np.trunc(bboxes[:, 2]), x1 + 1, width)
+        y2 = np.clip(np.trunc(bboxes[:, 3]), y1 + 1, height)
+        # Same top half as get_player_color, at least one row tall
+        y_half = y1 + np.maximum(np.trunc((y2 - y1) / 2), 1)
+
+        # Nearest-neighbour sample positions spanning each crop corner to corner
+        grid = np.linspace(0, 1, self.sample_size)
+        xs = (x1[:, None] + grid[None, :] * (x2 - x1 - 1)[:, None]).astype(np.int64)
+        ys = (y1[:, None] + grid[None, :] * (y_half - y1 - 1)[:, None]).astype(np.int64)
+
+        return frame[ys[:, :, None], xs[:, None, :]].astype(np.float32)
+
+    def get_player_colors(self,frame,bboxes):
+        """Jersey colour of every bbox in a frame -> (N, 3) array"""
+        if len(bboxes) == 0:
+            return np.zeros((0, 3))
+        if self.color_mode == "kmeans":
+            return np.array([self.get_player_color(frame, bbox) for bbox in bboxes])
+
+        crops = self.sample_top_half_crops(frame, bboxes)
+        num_crops, size = crops.shape[0], crops.shape[1]
+        pixels = crops.reshape(num_crops, -1, 3)
+
+        # Fixed-iteration 2-means over all crops at once: cluster 0 starts at the
+        # mean corner colour (background), cluster 1 at the crop centre (jersey)
+        corner_index = [0, size - 1, (size - 1) * size, size * size - 1]
+        centers = np.stack([
+            pixels[:, corner_index].mean(axis=1),
+            crops[:, size // 2, size // 2],
+        ], axis=1)
+
+        for _ in range(self.color_iterations):
+            distances = ((pixels[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=3)
+            labels = distances[:, :, 1] < distances[:, :, 0]
+            for cluster, mask in ((0, ~labels), (1, labels)):
+                counts = mask.sum(axis=1)
+                sums = (pixels * mask[:, :, None]).sum(axis=1)
+                has_pixels = counts > 0
+                centers[has_pixels, cluster] = sums[has_pixels] / counts[has_pixels, None]
+
+        # As in get_player_color, the cluster holding most corners is the background
+        corner_labels = labels[:, corner_index].sum(axis=1)
+        non_player_cluster = (corner_labels > 2).astype(np.int64)
+        player_cluster = 1 - non_player_cluster
+
+        return centers[np.arange(num_crops), player_cluster].astype(np.float64)
+
+    def is_fitted(self):
+        return self.team_centers is not None
+
+    def _set_team_centers(self,team_centers):
+        self.team_centers = np.asarray(team_centers, dtype=np.float64).reshape(2, 3)
+        self.team_colors[1] = self.team_centers[0]
+        self.team_colors[2] = self.team_centers[1]
+
+    def predict_teams(self,player_colors):
+        """Nearest team centre for each colour, as KMeans.predict would give -> team ids 1/2"""
+        player_colors = np.asarray(player_colors, dtype=np.float64).reshape(-1, 3)
+        distances = ((player_colors[:, None, :] - self.team_centers[None, :, :]) ** 2).sum(axis=2)
+        return np.argmin(distances, axis=1) + 1
+
+    def fit_team_colors(self,player_colors):
+        """Fit the two team centres, keeping team 1/2 aligned with any existing model"""
+        player_colors = np.asarray(player_colors, dtype=np.float64).reshape(-1, 3)
+        if len(self.color_samples) > 0:
+            player_colors = np.concatenate([self.color_samples, player_colors])
+        if len(player_colors) > self.max_color_samples:
+            keep = np.random.default_rng(0).choice(len(player_colors), self.max_color_samples, replace=False)
+            player_colors = player_colors[np.sort(keep)]
+        self.color_samples = player_colors
+
         kmeans = KMeans(n_clusters=2, init="k-means++",n_init=10)
         kmeans.fit(player_colors)
 
+        team_centers = kmeans.cluster_centers_
+        if self.team_centers is not None:
+            same_order = np.linalg.norm(team_centers - self.team_centers, axis=1).sum()
+            swapped_order = np.linalg.norm(team_centers[::-1] - self.team_centers, axis=1).sum()
+            if swapped_order < same_order:
+                team_centers = team_centers[::-1]
+
         self.kmeans = kmeans
+        self._set_team_centers(team_centers)
+
+    def assign_team_color(self,frame, player_detections):
+
+        bboxes = [player_detection["bbox"] for _, player_detection in player_detections.items()]
+        player_colors = self.get_player_colors(frame, bboxes)
+
+        self.fit_team_colors(player_colors)
+
+    def fit_from_samples(self,frames,player_bboxes_per_frame):
+        """
+        Fit (or incrementally refit) the team model from players in frames
+        sampled across the match instead of the first frame only. Colours from
+        earlier fits are kept, so calling it again refines the same model.
+        """
+        player_colors = [
+            self.get_player_colors(frame, player_bboxes)
+            for frame, player_bboxes in zip(frames, player_bboxes_per_frame)
+            if len(player_bboxes) > 0
+        ]
+        if not player_colors:
+            print("No players found in the sampled frames, team model not fitted")
+            return False
+
+        self.fit_team_colors(np.concatenate(player_colors))
+        print(f"Fitted team colours from {len(player_colors)} sampled frames")
+        return True
 
-        self.team_colors[1] = kmeans.cluster_centers_[0]
-        self.team_colors[2] = kmeans.cluster_centers_[1]
+    def save_model(self,model_path,fingerprint=None):
+        if not self.is_fitted():
+            raise ValueError("Team model has not been fitted yet")
+        if fingerprint is not None:
+            self.fingerprint = fingerprint
+
+        model_dir = os.path.dirname(model_path)
+        if model_dir:
+            os.makedirs(model_dir, exist_ok=True)
+        with open(model_path, 'wb') as f:
+            np.savez(
+                f,
+                team_centers=self.team_centers,
+                color_samples=self.color_samples,
+                color_mode=np.array(self.color_mode),
+                fingerprint=np.array(self.fingerprint or "")
+            )
+        print(f"Saved team model to {model_path}")
+
+    def load_model(self,model_path,fingerprint=None,allow_other_video=False):
+        """
+        Warm-start from a saved team model. By default the model must come from
+        the same video; allow_other_video reuses a model fitted on another segment
+        of the match (e.g. the first half) so team 1/2 stay the same.
+        """
+        if not os.path.exists(model_path):
+            return False
+
+        try:
+            with np.load(model_path) as data:
+                team_centers = data['team_centers']
+                color_samples = data['color_samples']
+                color_mode = str(data['color_mode'])
+                saved_fingerprint = str(data['fingerprint']) or None
+        except Exception as e:
+            print(f"Error loading team model: {e}")
+            return False
+
+        if color_mode != self.color_mode:
+            print(f"Team model at {model_path} was fitted with '{color_mode}' colours, refitting")
+            return False
+        if fingerprint is not None and saved_fingerprint != fingerprint:
+            if not allow_other_video:
+                print(f"Team model at {model_path} was fitted on a different video, refitting")
+                return False
+            print("Team model was fitted on another segment, reusing it for consistent team labels")
+
+        self._set_team_centers(team_centers)
+        self.color_samples = color_samples
+        # Saved again under the current video, so its next run matches without allow_other_video
+        self.fingerprint = fingerprint if fingerprint is not None else saved_fingerprint
+        print(f"Loaded team model from {model_path}")
+        return True
 
     def get_player_team(self,frame,player_bbox,player_id):
         if player_id in self.player_team_dict:
@@ -60,9 +235,25 @@ class TeamAssigner:
 
         player_color = self.get_player_color(frame,player_bbox)
 
-        team_id = self.kmeans.predict(player_color.reshape(1,-1))[0]
-        team_id+=1
+        team_id = self.predict_teams(player_color)[0]
 
         self.player_team_dict[player_id] = team_id
 
-        return team_id
\ No newline at end of file
+        return team_id
+
+    def get_player_teams(self,frame,player_ids,player_bboxes):
+        """
+        Teams for all players of a frame. Colours are extracted only for ids not
+        seen before, and classified together in a single predict call.
+        """
+        player_ids = [int(player_id) for player_id in player_ids]
+        unseen = [index for index, player_id in enumerate(player_ids) if player_id not in self.player_team_dict]
+
+        if unseen:
+            player_bboxes = np.asarray(player_bboxes).reshape(-1, 4)
+            player_colors = self.get_player_colors(frame, player_bboxes[unseen])
+            team_ids = self.predict_teams(player_colors)
+            for index, team_id in zip(unseen, team_ids):
+                self.player_team_dict[player_ids[index]] = int(team_id)
+
+        return np.array([self.player_team_dict[player_id] for player_id in player_ids], dtype=np.int64)
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trackers.ball_interpolator import BallInterpolator
+from trackers.track_store import TrackStore
+from pipeline.ball_lookahead import BallLookahead
+
+
+def make_batch(ball_bboxes, num_frames):
+    """Raw tracks of a batch with the ball at the given {frame: bbox} and nobody else"""
+    return TrackStore.from_dict({
+        "players": [{} for _ in range(num_frames)],
+        "referees": [{} for _ in range(num_frames)],
+        "ball": [{1: {"bbox": ball_bboxes[frame]}} if frame in ball_bboxes else {} for frame in range(num_frames)],
+    })
+
+
+def run_batches(batches, batch_size=10):
+    ball_lookahead = BallLookahead(BallInterpolator())
+    released = []
+    for batch_num, ball_bboxes in enumerate(batches):
+        frame_offset = batch_num * batch_size
+        frames = list(range(frame_offset, frame_offset + batch_size))
+        released.append(ball_lookahead.push(frame_offset, frames, make_batch(ball_bboxes, batch_size),
+                                            [[0, 0]] * batch_size))
+    released.append(ball_lookahead.flush())
+    return [ready for ready in released if ready is not None]
+
+
+def test_gap_across_batch_boundary_is_linear():
+    # Detections at frame 5 of the first batch and frame 2 of the second
+    released = run_batches([{5: [0, 0, 10, 10]}, {2: [70, 0, 80, 10]}])
+
+    frames = [frame for _, ready_frames, _, _ in released for frame in ready_frames]
+    assert frames == list(range(20))
+    ball = np.concatenate([tracks.table("ball").columns["bbox"] for _, _, tracks, _ in released])
+    np.testing.assert_allclose(ball[5:13, 0], np.linspace(0, 70, 8), rtol=1e-6)
+    np.testing.assert_allclose(np.diff(ball[5:13, 0]), 10, rtol=1e-5)
+
+
+def test_frames_are_held_back_until_the_next_detection():
+    released = run_batches([{5: [0, 0, 10, 10]}, {2: [70, 0, 80, 10]}])
+
+    # The first batch only releases frames up to its detection, the second starts at the held back frames
+    assert [(offset, len(frames)) for offset, frames, _, _ in released] == [(0, 6), (6, 7), (13, 7)]
+    for offset, frames, tracks, camera_movement in released:
+        assert frames[0] == offset
+        assert tracks.num_frames == len(frames) == len(camera_movement)
+
+
+def test_flush_holds_the_last_detection():
+    released = run_batches([{5: [0, 0, 10, 10]}, {}])
+
+    ball = np.concatenate([tracks.table("ball").columns["bbox"] for _, _, tracks, _ in released])
+    assert len(ball) == 20
+    np.testing.assert_allclose(ball[5:, 0], 0)
+
+
+def test_gap_longer_than_max_gap_is_released_empty():
+    ball_lookahead = BallLookahead(BallInterpolator(max_gap=12))
+    ready = ball_lookahead.push(0, list(range(10)), make_batch({0: [0, 0, 10, 10]}, 10), [[0, 0]] * 10)
+    ready_later = ball_lookahead.push(10, list(range(10, 20)), make_batch({}, 10), [[0, 0]] * 10)
+
+    assert len(ready[1]) == 1
+    assert ready_later[0] == 1 and len(ready_later[1]) == 19
+    assert np.isnan(ready_later[2].table("ball").columns["bbox"]).all()
@@ -0,0 +1 @@
+from .track_export import TrackExporter, TrackReader
\ No newline at end of file
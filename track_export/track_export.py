@@ -0,0 +1,187 @@
+import json
+import os
+
+import numpy as np
+
+from trackers.track_store import TrackStore, TrackTable, OBJECT_TYPES
+
+
+# Exported column -> (TrackTable column, index into it or None)
+EXPORT_COLUMNS = {
+    "bbox_x1": ("bbox", 0), "bbox_y1": ("bbox", 1), "bbox_x2": ("bbox", 2), "bbox_y2": ("bbox", 3),
+    "position_x": ("position", 0), "position_y": ("position", 1),
+    "position_adjusted_x": ("position_adjusted", 0), "position_adjusted_y": ("position_adjusted", 1),
+    "position_transformed_x": ("position_transformed", 0), "position_transformed_y": ("position_transformed", 1),
+    "speed": ("speed", None),
+    "distance": ("distance", None),
+    "team": ("team", None),
+    "has_ball": ("has_ball", None),
+}
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Track export needs the pyarrow package") from e
+    return pyarrow
+
+
+class TrackExporter:
+    """
+    Writes enriched tracks as columnar Arrow IPC or Parquet files, streamed batch by batch.
+
+    Every object type gets its own directory of partitions covering
+    partition_frames consecutive frames each, with one row per detection:
+    absolute frame, track id, bbox, positions, speed, distance, team and
+    has_ball. Arrow files can be memory-mapped by TrackReader, Parquet files
+    are smaller. metadata.json lists the partitions and their frame ranges,
+    so readers only open the ones a query needs.
+    """
+
+    def __init__(self, export_dir, format="arrow", partition_frames=1500):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown track export format {format!r}, expected one of {tuple(FORMATS)}")
+        self.pa = _import_pyarrow()
+        self.export_dir = export_dir
+        self.format = format
+        self.partition_frames = partition_frames
+        self.partitions = []
+        self._buffer = []
+        self._buffer_start = 0
+        self._buffer_frames = 0
+        os.makedirs(export_dir, exist_ok=True)
+
+    def write_batch(self, frame_offset, tracks):
+        """Add the tracks of frames [frame_offset, frame_offset + tracks.num_frames)"""
+        if not self._buffer:
+            self._buffer_start = frame_offset
+        self._buffer.append(tracks)
+        self._buffer_frames += tracks.num_frames
+        if self._buffer_frames >= self.partition_frames:
+            self._write_partition()
+
+    def _table_to_arrow(self, table, frame_start):
+        columns = {
+            "frame": table.frame.astype(np.int64) + frame_start,
+            "track_id": table.track_id,
+        }
+        for name, (column, index) in EXPORT_COLUMNS.items():
+            values = table.columns[column]
+            columns[name] = np.ascontiguousarray(values[:, index]) if index is not None else values
+        return self.pa.table(columns)
+
+    def _write_partition(self):
+        if not self._buffer:
+            return
+        tracks = TrackStore.concatenate(self._buffer)
+        frame_start, frame_end = self._buffer_start, self._buffer_start + tracks.num_frames
+        name = f"frames_{frame_start:08d}_{frame_end:08d}{FORMATS[self.format]}"
+
+        for object_type in tracks.keys():
+            object_dir = os.path.join(self.export_dir, object_type)
+            os.makedirs(object_dir, exist_ok=True)
+            arrow_table = self._table_to_arrow(tracks.table(object_type), frame_start)
+            path = os.path.join(object_dir, name)
+            if self.format == "arrow":
+                with self.pa.OSFile(path, "wb") as sink:
+                    with self.pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                        writer.write_table(arrow_table)
+            else:
+                self.pa.parquet.write_table(arrow_table, path)
+
+        self.partitions.append({"file": name, "frame_start": frame_start, "frame_end": frame_end})
+        self._buffer = []
+        self._buffer_frames = 0
+
+    def close(self):
+        """Write the remaining frames and the metadata"""
+        self._write_partition()
+        with open(os.path.join(self.export_dir, "metadata.json"), "w") as f:
+            json.dump({
+                "format": self.format,
+                "num_frames": self.partitions[-1]["frame_end"] if self.partitions else 0,
+                "partitions": self.partitions,
+            }, f, indent=2)
+
+
+class TrackReader:
+    """
+    Reads slices of tracks exported by TrackExporter without loading the rest.
+
+    Only the partitions overlapping the requested frame range are opened;
+    Arrow partitions are memory-mapped, so only the pages of the rows and
+    columns that are used get read from disk.
+    """
+
+    def __init__(self, export_dir):
+        self.pa = _import_pyarrow()
+        self.export_dir = export_dir
+        with open(os.path.join(export_dir, "metadata.json")) as f:
+            metadata = json.load(f)
+        self.format = metadata["format"]
+        self.num_frames = metadata["num_frames"]
+        self.partitions = metadata["partitions"]
+
+    def _read_partition(self, path):
+        if self.format == "arrow":
+            return self.pa.ipc.open_file(self.pa.memory_map(path, "r")).read_all()
+        return self.pa.parquet.read_table(path, memory_map=True)
+
+    def read_arrow(self, object_type, frame_start=0, frame_end=None, track_ids=None):
+        """pyarrow Table of the rows of one object type in [frame_start, frame_end), optionally of some track ids"""
+        pc = self.pa.compute
+        frame_end = self.num_frames if frame_end is None else min(frame_end, self.num_frames)
+        tables = []
+        for partition in self.partitions:
+            if partition["frame_end"] <= frame_start or partition["frame_start"] >= frame_end:
+                continue
+            table = self._read_partition(os.path.join(self.export_dir, object_type, partition["file"]))
+            mask = pc.and_(pc.greater_equal(table["frame"], frame_start), pc.less(table["frame"], frame_end))
+            if track_ids is not None:
+                mask = pc.and_(mask, pc.is_in(table["track_id"], value_set=self.pa.array(track_ids, self.pa.int64())))
+            tables.append(table.filter(mask))
+        if not tables:
+            return None
+        return self.pa.concat_tables(tables)
+
+    def read_table(self, object_type, frame_start=0, frame_end=None, track_ids=None):
+        """TrackTable of the slice, with frames renumbered from frame_start like TrackTable.slice_frames"""
+        frame_end = self.num_frames if frame_end is None else min(frame_end, self.num_frames)
+        num_frames = max(frame_end - frame_start, 0)
+        arrow_table = self.read_arrow(object_type, frame_start, frame_end, track_ids)
+        if arrow_table is None or arrow_table.num_rows == 0:
+            return TrackTable(np.zeros(num_frames + 1, dtype=np.int64), [], np.zeros((0, 4)))
+
+        frame = arrow_table["frame"].to_numpy() - frame_start
+        frame_offsets = np.concatenate([[0], np.cumsum(np.bincount(frame, minlength=num_frames))])
+        table = TrackTable(
+            frame_offsets,
+            arrow_table["track_id"].to_numpy(),
+            np.stack([arrow_table[f"bbox_{corner}"].to_numpy() for corner in ("x1", "y1", "x2", "y2")], axis=1)
+        )
+        for name, (column, index) in EXPORT_COLUMNS.items():
+            if column == "bbox":
+                continue
+            values = arrow_table[name].to_numpy(zero_copy_only=False)
+            if index is None:
+                table.columns[column][:] = values
+            else:
+                table.columns[column][:, index] = values
+        for column in ("position", "position_adjusted", "position_transformed"):
+            if np.isfinite(table.columns[column]).any():
+                table.mark_present(column)
+        return table
+
+    def read_tracks(self, frame_start=0, frame_end=None, track_ids=None):
+        """TrackStore of frames [frame_start, frame_end), optionally of some player/referee track ids"""
+        return TrackStore({
+            object_type: self.read_table(
+                object_type, frame_start, frame_end, track_ids if object_type != "ball" else None
+            )
+            for object_type in OBJECT_TYPES
+        })
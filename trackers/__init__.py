@@ -1 +1,7 @@
-from .tracker import Tracker
\ No newline at end of file
+from .tracker import Tracker
+from .track_store import TrackStore
+from .detection_store import DetectionStore
+from .keyframe_scheduler import KeyframeScheduler
+from .ball_roi_detector import BallROIDetector
+from .inference_backend import BACKENDS, export_model, load_model
+from .ball_interpolator import BallInterpolator
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class BallInterpolator:
+    """
+    Fills the frames where the ball was not detected, streamed batch by batch.
+
+    Gaps are filled linearly between the real detections on both sides, also
+    when a gap crosses a batch boundary: the last detection carries over, and
+    frames after it stay in a lookahead buffer until the next detection
+    arrives. Gaps longer than max_gap frames are left empty. Frames before the
+    first detection take its box, like the bfill of the former pandas version.
+
+    push() returns only frames whose values are final; flush() releases the
+    buffer at the end of the video. interpolate() is for callers that need a
+    value for every frame of a batch right away: the buffered tail is
+    returned provisionally, holding the last detection.
+    """
+
+    def __init__(self, max_gap=48):
+        self.max_gap = max_gap
+        self.last_bbox = None
+        # Frames after last_bbox without a detection, not returned yet
+        self.pending = 0
+        # The current gap is longer than max_gap, so it stays empty up to the next detection
+        self.gap_too_long = False
+
+    def reset(self):
+        self.last_bbox = None
+        self.pending = 0
+        self.gap_too_long = False
+
+    def _too_long(self, gap):
+        return self.max_gap is not None and gap > self.max_gap
+
+    def push(self, bboxes):
+        """
+        Add a batch of ball boxes, (num_frames, 4) with NaN where the ball is
+        missing. Returns the boxes of the buffered and new frames up to the
+        last detection, in order.
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        boxes = np.vstack([np.full((self.pending, 4), np.nan), bboxes])
+        detected = np.isfinite(boxes).all(axis=1)
+        boxes[~detected] = np.nan
+        known = np.flatnonzero(detected)
+
+        if len(known) == 0:
+            self.pending = len(boxes)
+            if self.gap_too_long or self._too_long(self.pending):
+                # No detection can close this gap within max_gap anymore
+                self.gap_too_long = True
+                self.pending = 0
+                return boxes
+            return boxes[:0]
+
+        last = known[-1]
+        output = boxes[:last + 1]
+        anchored = self.last_bbox is not None and not self.gap_too_long
+        positions = np.concatenate([[-1], known]) if anchored else known
+        values = np.vstack([self.last_bbox, boxes[known]]) if anchored else boxes[known]
+
+        frames = np.arange(max(positions[0], 0), last + 1)
+        for coordinate in range(4):
+            output[frames, coordinate] = np.interp(frames, positions, values[:, coordinate])
+        if self.max_gap is not None:
+            for start, end in zip(positions[:-1], positions[1:]):
+                if end - start - 1 > self.max_gap:
+                    output[start + 1:end] = np.nan
+
+        # Frames before the first detection of the video
+        first = positions[0]
+        if first > 0 and self.last_bbox is None and not self.gap_too_long and not self._too_long(first):
+            output[:first] = boxes[first]
+
+        self.last_bbox = boxes[last].copy()
+        self.gap_too_long = False
+        self.pending = len(boxes) - last - 1
+        if self._too_long(self.pending):
+            self.gap_too_long = True
+            output = np.vstack([output, boxes[last + 1:]])
+            self.pending = 0
+        return output
+
+    def _hold(self, num_frames):
+        if self.last_bbox is None:
+            return np.full((num_frames, 4), np.nan)
+        return np.tile(self.last_bbox, (num_frames, 1))
+
+    def flush(self):
+        """Boxes of the buffered frames at the end of the video, holding the last detection"""
+        output = self._hold(self.pending)
+        self.pending = 0
+        return output
+
+    def interpolate(self, bboxes):
+        """Boxes for every frame of a batch; frames still in the buffer get a provisional value"""
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        buffered = self.pending
+        # Frames of earlier batches were already returned provisionally
+        final = self.push(bboxes)[buffered:]
+        return np.vstack([final, self._hold(len(bboxes) - len(final))])
@@ -0,0 +1,128 @@
+import glob
+import json
+import os
+
+import numpy as np
+import supervision as sv
+
+
+class DetectionStore:
+    """
+    Raw per-frame model detections (xyxy, confidence, class id) on disk, before
+    goalkeeper remapping, class filtering or ByteTrack association.
+
+    Detections are appended one batch at a time as compressed columnar chunks
+    with per-frame offsets, so tracking can be re-run later without model.predict.
+    A store holds one video detected with one set of weights, see for_video;
+    a new chunk replaces the frames it overlaps in older ones.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        self._class_names = None
+
+    def for_video(self, video_hash, model_hash, backend="pytorch"):
+        """Store of one video and model inside this directory, so runs on other inputs never mix"""
+        return DetectionStore(os.path.join(self.directory, f"{video_hash[:16]}_{model_hash[:16]}_{backend}"))
+
+    @property
+    def class_names(self):
+        if self._class_names is None:
+            names_path = os.path.join(self.directory, 'class_names.json')
+            if os.path.exists(names_path):
+                with open(names_path) as f:
+                    self._class_names = {int(k): v for k, v in json.load(f).items()}
+        return self._class_names
+
+    def _chunk_path(self, frame_start, frame_end):
+        return os.path.join(self.directory, f"chunk_{frame_start:09d}_{frame_end:09d}.npz")
+
+    def append(self, frame_start, detections):
+        """Store ultralytics results (one per frame) for frames starting at frame_start"""
+        if len(detections) == 0:
+            return
+
+        class_names = {int(k): v for k, v in detections[0].names.items()}
+        if self.class_names != class_names:
+            self._class_names = class_names
+            with open(os.path.join(self.directory, 'class_names.json'), 'w') as f:
+                json.dump(self._class_names, f)
+
+        detections_supervision = [sv.Detections.from_ultralytics(detection) for detection in detections]
+        frame_offsets = np.zeros(len(detections_supervision) + 1, dtype=np.int64)
+        frame_offsets[1:] = np.cumsum([len(detection) for detection in detections_supervision])
+
+        frame_end = frame_start + len(detections)
+        self._remove_frames(frame_start, frame_end)
+        self._write_chunk(
+            frame_start,
+            frame_offsets,
+            np.concatenate([d.xyxy for d in detections_supervision]).astype(np.float32).reshape(-1, 4),
+            np.concatenate([d.confidence for d in detections_supervision]).astype(np.float32),
+            np.concatenate([d.class_id for d in detections_supervision]).astype(np.int16),
+        )
+
+    def _write_chunk(self, frame_start, frame_offsets, xyxy, confidence, class_id):
+        np.savez_compressed(
+            self._chunk_path(frame_start, frame_start + len(frame_offsets) - 1),
+            frame_offsets=frame_offsets,
+            xyxy=xyxy,
+            confidence=confidence,
+            class_id=class_id,
+        )
+
+    def _remove_frames(self, frame_start, frame_end):
+        """Drop [frame_start, frame_end) from stored chunks, e.g. from a run with another batch size"""
+        for chunk_start, chunk_end, path in self.chunks():
+            if chunk_end <= frame_start or chunk_start >= frame_end:
+                continue
+            with np.load(path) as chunk:
+                arrays = {name: chunk[name] for name in ('frame_offsets', 'xyxy', 'confidence', 'class_id')}
+            os.remove(path)
+
+            # Keep the frames of the old chunk before and after the new one
+            for keep_start, keep_end in ((chunk_start, frame_start), (frame_end, chunk_end)):
+                keep_start, keep_end = max(keep_start, chunk_start), min(keep_end, chunk_end)
+                if keep_start >= keep_end:
+                    continue
+                frame_offsets = arrays['frame_offsets'][keep_start - chunk_start:keep_end - chunk_start + 1]
+                rows = slice(frame_offsets[0], frame_offsets[-1])
+                self._write_chunk(keep_start, frame_offsets - frame_offsets[0], arrays['xyxy'][rows],
+                                  arrays['confidence'][rows], arrays['class_id'][rows])
+
+    def chunks(self):
+        """(frame_start, frame_end, path) of every stored chunk, in frame order"""
+        chunks = []
+        for path in glob.glob(os.path.join(self.directory, 'chunk_*.npz')):
+            _, frame_start, frame_end = os.path.splitext(os.path.basename(path))[0].split('_')
+            chunks.append((int(frame_start), int(frame_end), path))
+        return sorted(chunks)
+
+    def num_frames(self):
+        return max((frame_end for _, frame_end, _ in self.chunks()), default=0)
+
+    def iter_frames(self, frame_start=0, frame_end=None):
+        """Yield (frame_num, sv.Detections) for every stored frame in [frame_start, frame_end), once, in order"""
+        # Stores written before overlapping chunks were replaced can hold a frame twice; the first one wins
+        next_frame = frame_start
+        for chunk_start, chunk_end, path in self.chunks():
+            if chunk_end <= frame_start or (frame_end is not None and chunk_start >= frame_end):
+                continue
+            with np.load(path) as chunk:
+                frame_offsets = chunk['frame_offsets']
+                xyxy = chunk['xyxy']
+                confidence = chunk['confidence']
+                class_id = chunk['class_id'].astype(int)
+
+            for index in range(len(frame_offsets) - 1):
+                frame_num = chunk_start + index
+                if frame_num < next_frame or (frame_end is not None and frame_num >= frame_end):
+                    continue
+                next_frame = frame_num + 1
+                start, end = frame_offsets[index], frame_offsets[index + 1]
+                yield frame_num, sv.Detections(
+                    xyxy=xyxy[start:end],
+                    confidence=confidence[start:end],
+                    class_id=class_id[start:end].copy()
+                )
@@ -0,0 +1,108 @@
+import os
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+
+# "pytorch" runs the trained .pt weights as they are, the others run an export of them on the CPU
+BACKENDS = ("pytorch", "onnx", "openvino", "onnx-int8")
+
+
+def exported_model_path(model_path, backend):
+    """Where the export of model_path for a backend lives, next to the weights"""
+    stem, _ = os.path.splitext(model_path)
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        # Ultralytics writes OpenVINO models as a directory
+        return stem + "_openvino_model"
+    if backend == "onnx-int8":
+        return stem + "_int8.onnx"
+    return model_path
+
+
+def _is_stale(path, model_path):
+    return not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(model_path)
+
+
+def _letterbox(frame, imgsz):
+    """The preprocessing ultralytics applies before an exported model: letterbox, BGR->RGB, CHW, 0-1"""
+    height, width = frame.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top = int(round((imgsz - new_height) / 2 - 0.1))
+    left = int(round((imgsz - new_width) / 2 - 0.1))
+    image = cv2.copyMakeBorder(resized, top, imgsz - new_height - top, left, imgsz - new_width - left,
+                               cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    image = image[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(image, dtype=np.float32)[None] / 255.0
+
+
+def _quantize_int8(onnx_path, int8_path, calibration_frames, imgsz):
+    try:
+        import onnx
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    except ImportError as e:
+        raise ImportError("The onnx-int8 backend needs the onnx and onnxruntime packages") from e
+
+    input_name = onnx.load(onnx_path, load_external_data=False).graph.input[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(calibration_frames)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            return None if frame is None else {input_name: _letterbox(frame, imgsz)}
+
+    # Only the convolutions and matmuls are quantized, the detection head's
+    # box decoding stays in float so coordinates keep their precision
+    quantize_static(
+        onnx_path, int8_path, FrameReader(),
+        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        op_types_to_quantize=["Conv", "MatMul"], per_channel=True,
+    )
+
+
+def export_model(model_path, backend, calibration_frames=None, imgsz=640):
+    """
+    Path of the model to load for a backend, exporting the weights first when
+    the export is missing or older than them. The INT8 variant is quantized
+    from the ONNX export after calibrating activation ranges on
+    calibration_frames, frames from our own footage.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "pytorch":
+        return model_path
+
+    path = exported_model_path(model_path, backend)
+    if not _is_stale(path, model_path):
+        return path
+
+    if backend == "openvino":
+        print(f"Exporting {model_path} to OpenVINO...")
+        YOLO(model_path).export(format="openvino", dynamic=True, imgsz=imgsz)
+        return path
+
+    onnx_path = exported_model_path(model_path, "onnx")
+    if _is_stale(onnx_path, model_path):
+        print(f"Exporting {model_path} to ONNX...")
+        YOLO(model_path).export(format="onnx", dynamic=True, imgsz=imgsz)
+    if backend == "onnx":
+        return onnx_path
+
+    if not calibration_frames:
+        raise ValueError(f"{path} does not exist yet, quantizing it needs calibration frames")
+    print(f"Quantizing {onnx_path} to INT8 on {len(calibration_frames)} calibration frames...")
+    _quantize_int8(onnx_path, path, calibration_frames, imgsz)
+    return path
+
+
+def load_model(model_path, backend="pytorch", calibration_frames=None):
+    """YOLO model running the weights on the given backend; predict() results are the same type for all of them"""
+    if backend == "pytorch":
+        return YOLO(model_path)
+    return YOLO(export_model(model_path, backend, calibration_frames), task="detect")
@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+
+
+class KeyframeScheduler:
+    """
+    Decides which frames get a full model.predict in keyframe mode.
+
+    A frame becomes a keyframe when `interval` frames have passed since the
+    last one, or earlier when a cheap downscaled frame difference against the
+    last keyframe exceeds difference_threshold. After each keyframe the
+    interval adapts: it grows while the boxes propagated since the previous
+    keyframe still overlap the fresh detections (IoU >= iou_target) and the
+    detections are confident, and shrinks as soon as either degrades.
+    """
+
+    def __init__(self, interval=4, min_interval=1, max_interval=12, adaptive=True,
+                 difference_threshold=18.0, iou_target=0.7, confidence_threshold=0.4):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.adaptive = adaptive
+        self.difference_threshold = difference_threshold
+        self.iou_target = iou_target
+        self.confidence_threshold = confidence_threshold
+
+        self.last_keyframe_small = None
+        self.frames_since_keyframe = 0
+
+        # Statistics for report()
+        self.frames = 0
+        self.keyframes = 0
+        self.difference_keyframes = 0
+        self.propagation_ious = []
+
+    def _small_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (160, 90), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def select_keyframes(self, frames):
+        """Keyframe flag for each frame of a batch, continuing from the previous batch"""
+        is_keyframe = []
+        for frame in frames:
+            small = self._small_gray(frame)
+            keyframe = self.last_keyframe_small is None or self.frames_since_keyframe + 1 >= self.interval
+            if not keyframe and np.abs(small - self.last_keyframe_small).mean() > self.difference_threshold:
+                keyframe = True
+                self.difference_keyframes += 1
+
+            if keyframe:
+                self.last_keyframe_small = small
+                self.frames_since_keyframe = 0
+                self.keyframes += 1
+            else:
+                self.frames_since_keyframe += 1
+            self.frames += 1
+            is_keyframe.append(keyframe)
+        return is_keyframe
+
+    def update(self, propagation_iou=None, mean_confidence=None):
+        """Adapt the interval from how well propagation held up until this keyframe"""
+        if propagation_iou is not None:
+            self.propagation_ious.append(propagation_iou)
+        if not self.adaptive:
+            return
+
+        degraded = (
+            (propagation_iou is not None and propagation_iou < self.iou_target)
+            or (mean_confidence is not None and mean_confidence < self.confidence_threshold)
+        )
+        if degraded:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif propagation_iou is not None:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def report(self):
+        if self.frames == 0:
+            return "Keyframe mode: no frames processed"
+        reduction = 1 - self.keyframes / self.frames
+        lines = [
+            f"Keyframe mode: {self.keyframes} inference frames out of {self.frames} "
+            f"({reduction*100:.1f}% fewer model calls, {self.difference_keyframes} triggered by frame difference)",
+            f"  Current interval: {self.interval} frames",
+        ]
+        if self.propagation_ious:
+            lines.append(
+                f"  Propagated vs detected boxes at keyframes: mean IoU {np.mean(self.propagation_ious):.3f}"
+            )
+        return "\n".join(lines)
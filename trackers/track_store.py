@@ -0,0 +1,451 @@
+from collections.abc import Mapping, MutableMapping, Sequence
+import numpy as np
+
+
+OBJECT_TYPES = ("players", "referees", "ball")
+
+# Column name -> (per-detection shape, dtype). Missing values are NaN for float
+# columns, 0 for team and False for has_ball.
+COLUMNS = {
+    "bbox": ((4,), np.float32),
+    "position": ((2,), np.float32),
+    "position_adjusted": ((2,), np.float32),
+    "position_transformed": ((2,), np.float32),
+    "speed": ((), np.float32),
+    "distance": ((), np.float32),
+    "team": ((), np.int8),
+    "team_color": ((3,), np.float32),
+    "has_ball": ((), np.bool_),
+}
+
+# Fields that a stage fills in for every detection at once. Like the dict
+# tracks, they exist as soon as the stage has run and read as None when the
+# value could not be computed (e.g. a point outside the pitch).
+STAGE_FIELDS = ("bbox", "position", "position_adjusted", "position_transformed")
+
+
+def _empty_column(name, num_rows):
+    shape, dtype = COLUMNS[name]
+    if dtype == np.int8:
+        return np.zeros((num_rows,) + shape, dtype=dtype)
+    if dtype == np.bool_:
+        return np.zeros((num_rows,) + shape, dtype=dtype)
+    return np.full((num_rows,) + shape, np.nan, dtype=dtype)
+
+
+class TrackTable:
+    """Columnar storage for all detections of one object type, sorted by frame"""
+
+    def __init__(self, frame_offsets, track_id, bbox):
+        # frame_offsets[f]:frame_offsets[f + 1] are the rows of frame f
+        self.frame_offsets = np.asarray(frame_offsets, dtype=np.int64)
+        self.num_frames = len(self.frame_offsets) - 1
+        self.frame = np.repeat(
+            np.arange(self.num_frames, dtype=np.int32), np.diff(self.frame_offsets)
+        )
+        self.track_id = np.asarray(track_id, dtype=np.int64)
+        self.columns = {name: _empty_column(name, len(self.track_id)) for name in COLUMNS}
+        self.columns["bbox"][:] = np.asarray(bbox, dtype=np.float32).reshape(-1, 4)
+        self.present = {"bbox"}
+        # Values for keys without a column, keyed by row
+        self.extra = {}
+
+    def __len__(self):
+        return len(self.track_id)
+
+    @classmethod
+    def from_frame_arrays(cls, frame_arrays):
+        """Build a table from a list of (track_ids, bboxes) arrays, one per frame"""
+        counts = [len(track_ids) for track_ids, _ in frame_arrays]
+        frame_offsets = np.zeros(len(frame_arrays) + 1, dtype=np.int64)
+        frame_offsets[1:] = np.cumsum(counts)
+        if frame_offsets[-1] == 0:
+            return cls(frame_offsets, np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.float32))
+        track_id = np.concatenate([np.asarray(ids, dtype=np.int64).reshape(-1) for ids, _ in frame_arrays])
+        bbox = np.concatenate([np.asarray(b, dtype=np.float32).reshape(-1, 4) for _, b in frame_arrays])
+        return cls(frame_offsets, track_id, bbox)
+
+    @classmethod
+    def from_frame_dicts(cls, object_tracks):
+        """Build a table from the list-of-dicts layout used by the dict tracks"""
+        frame_arrays = []
+        for track in object_tracks:
+            track_ids = list(track.keys())
+            bboxes = [track[track_id].get("bbox", [np.nan] * 4) for track_id in track_ids]
+            frame_arrays.append((track_ids, np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)))
+        table = cls.from_frame_arrays(frame_arrays)
+
+        row = 0
+        for track in object_tracks:
+            for track_info in track.values():
+                for key, value in track_info.items():
+                    if key != "bbox":
+                        table.set_value(row, key, value)
+                row += 1
+        return table
+
+    def rows(self, frame_num):
+        return self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1]
+
+    def has_value(self, row, key):
+        if key in STAGE_FIELDS:
+            return key in self.present
+        if key in COLUMNS:
+            value = self.columns[key][row]
+            if key == "team":
+                return value != 0
+            if key == "has_ball":
+                return bool(value)
+            return not np.isnan(value).any()
+        return key in self.extra.get(row, {})
+
+    def get_value(self, row, key):
+        if key not in COLUMNS:
+            return self.extra[row][key]
+
+        value = self.columns[key][row]
+        if key == "bbox":
+            return value.tolist()
+        if key in ("position", "position_adjusted"):
+            return None if np.isnan(value).any() else tuple(value.tolist())
+        if key == "position_transformed":
+            return None if np.isnan(value).any() else value.tolist()
+        if key == "team_color":
+            return tuple(value.tolist())
+        if key == "team":
+            return int(value)
+        if key == "has_ball":
+            return bool(value)
+        return float(value)
+
+    def set_value(self, row, key, value):
+        if key not in COLUMNS:
+            self.extra.setdefault(row, {})[key] = value
+            return
+
+        if key in STAGE_FIELDS:
+            self.present.add(key)
+        column = self.columns[key]
+        if value is None:
+            column[row] = _empty_column(key, 1)[0]
+        else:
+            column[row] = np.asarray(value, dtype=column.dtype).reshape(column.shape[1:])
+
+    def mark_present(self, key):
+        if key in STAGE_FIELDS:
+            self.present.add(key)
+
+    def slots(self):
+        """Position of every row within its frame"""
+        return np.arange(len(self)) - self.frame_offsets[self.frame]
+
+    def padded(self, key):
+        """
+        Return (track_ids, values) as (num_frames, max_per_frame) arrays, padded
+        with -1 ids and missing values, for whole-batch operations across frames.
+        """
+        counts = np.diff(self.frame_offsets)
+        width = int(counts.max(initial=0))
+        slots = self.slots()
+
+        track_ids = np.full((self.num_frames, width), -1, dtype=np.int64)
+        track_ids[self.frame, slots] = self.track_id
+
+        column = self.columns[key]
+        values = _empty_column(key, self.num_frames * width).reshape((self.num_frames, width) + column.shape[1:])
+        values[self.frame, slots] = column
+        return track_ids, values
+
+    def slice_frames(self, frame_start, frame_end):
+        """Table of frames [frame_start, frame_end) only, renumbered from 0"""
+        frame_end = min(frame_end, self.num_frames)
+        start, end = self.frame_offsets[frame_start], self.frame_offsets[frame_end]
+        table = TrackTable(
+            self.frame_offsets[frame_start:frame_end + 1] - start,
+            self.track_id[start:end],
+            self.columns["bbox"][start:end]
+        )
+        for name, column in self.columns.items():
+            table.columns[name][:] = column[start:end]
+        table.present = set(self.present)
+        table.extra = {row - start: values for row, values in self.extra.items() if start <= row < end}
+        return table
+
+    @classmethod
+    def concatenate(cls, tables):
+        """One table with the frames of all tables one after another"""
+        frame_offsets = [np.zeros(1, dtype=np.int64)]
+        rows = 0
+        for table in tables:
+            frame_offsets.append(table.frame_offsets[1:] + rows)
+            rows += len(table)
+
+        result = cls(
+            np.concatenate(frame_offsets),
+            np.concatenate([table.track_id for table in tables]),
+            np.concatenate([table.columns["bbox"] for table in tables])
+        )
+        for name in COLUMNS:
+            result.columns[name][:] = np.concatenate([table.columns[name] for table in tables])
+        result.present = set.intersection(*(table.present for table in tables)) if tables else {"bbox"}
+
+        rows = 0
+        for table in tables:
+            for row, values in table.extra.items():
+                result.extra[row + rows] = values
+            rows += len(table)
+        return result
+
+    def nbytes(self):
+        total = self.frame_offsets.nbytes + self.frame.nbytes + self.track_id.nbytes
+        return total + sum(column.nbytes for column in self.columns.values())
+
+    def to_frame_dicts(self):
+        object_tracks = [_FrameTracks(self, frame_num) for frame_num in range(self.num_frames)]
+        return [
+            {track_id: dict(record) for track_id, record in track.items()}
+            for track in object_tracks
+        ]
+
+
+class _TrackRecord(MutableMapping):
+    """Dict-like view of a single detection row"""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def _keys(self):
+        keys = [key for key in COLUMNS if self._table.has_value(self._row, key)]
+        return keys + list(self._table.extra.get(self._row, {}).keys())
+
+    def __getitem__(self, key):
+        if not self._table.has_value(self._row, key):
+            raise KeyError(key)
+        return self._table.get_value(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._table.set_value(self._row, key, value)
+
+    def __delitem__(self, key):
+        if key in COLUMNS:
+            if key in STAGE_FIELDS:
+                raise KeyError(f"Cannot delete stage field '{key}' from a single detection")
+            self._table.set_value(self._row, key, None)
+        else:
+            del self._table.extra[self._row][key]
+
+    def __contains__(self, key):
+        return self._table.has_value(self._row, key)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _FrameTracks(Mapping):
+    """Dict-like view of track_id -> detection for one frame"""
+
+    __slots__ = ("_table", "_start", "_end")
+
+    def __init__(self, table, frame_num):
+        self._table = table
+        self._start, self._end = table.rows(frame_num)
+
+    def _row(self, track_id):
+        matches = np.flatnonzero(self._table.track_id[self._start:self._end] == track_id)
+        if len(matches) == 0:
+            raise KeyError(track_id)
+        # Like the dict tracks, a later detection of the same id wins
+        return self._start + matches[-1]
+
+    def __getitem__(self, track_id):
+        return _TrackRecord(self._table, self._row(track_id))
+
+    def __setitem__(self, track_id, track_info):
+        # Frames have a fixed set of rows; only existing detections can be updated
+        record = self[track_id]
+        for key, value in track_info.items():
+            record[key] = value
+
+    def __contains__(self, track_id):
+        return bool((self._table.track_id[self._start:self._end] == track_id).any())
+
+    def __iter__(self):
+        return iter(self._table.track_id[self._start:self._end].tolist())
+
+    def __len__(self):
+        return int(self._end - self._start)
+
+    def items(self):
+        track_ids = self._table.track_id[self._start:self._end].tolist()
+        return [
+            (track_id, _TrackRecord(self._table, self._start + index))
+            for index, track_id in enumerate(track_ids)
+        ]
+
+    def __repr__(self):
+        return repr({track_id: dict(record) for track_id, record in self.items()})
+
+
+class _TrackFrames(Sequence):
+    """List-like view of per-frame track dicts for one object type"""
+
+    __slots__ = ("_table",)
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, frame_num):
+        if isinstance(frame_num, slice):
+            return [self[i] for i in range(*frame_num.indices(len(self)))]
+        if frame_num < 0:
+            frame_num += len(self)
+        if not 0 <= frame_num < len(self):
+            raise IndexError(frame_num)
+        return _FrameTracks(self._table, frame_num)
+
+    def __len__(self):
+        return self._table.num_frames
+
+
+class TrackStore:
+    """
+    Columnar, array-backed replacement for the nested ``tracks`` dict.
+
+    Every object type is a TrackTable of NumPy columns (frame, track id, bbox,
+    positions, speed, team, has_ball, ...) with per-frame row offsets, so the
+    pipeline stages can work on whole arrays. ``store["players"][frame][track_id]``
+    still returns a dict-like view, which keeps code written against the dict
+    layout working.
+    """
+
+    def __init__(self, tables):
+        self.tables = dict(tables)
+
+    @property
+    def num_frames(self):
+        return max((table.num_frames for table in self.tables.values()), default=0)
+
+    @classmethod
+    def from_frame_arrays(cls, frame_arrays):
+        """frame_arrays: object type -> list of (track_ids, bboxes) per frame"""
+        return cls({
+            object_type: TrackTable.from_frame_arrays(arrays)
+            for object_type, arrays in frame_arrays.items()
+        })
+
+    @classmethod
+    def from_dict(cls, tracks):
+        return cls({
+            object_type: TrackTable.from_frame_dicts(object_tracks)
+            for object_type, object_tracks in tracks.items()
+        })
+
+    def to_dict(self):
+        return {object_type: table.to_frame_dicts() for object_type, table in self.tables.items()}
+
+    def to_arrays(self):
+        """Flat name -> array mapping (e.g. for AnalysisCache), without per-row extras"""
+        arrays = {}
+        for object_type, table in self.tables.items():
+            arrays[f"{object_type}/frame_offsets"] = table.frame_offsets
+            arrays[f"{object_type}/track_id"] = table.track_id
+            for name, column in table.columns.items():
+                if name in STAGE_FIELDS and name not in table.present:
+                    continue
+                arrays[f"{object_type}/{name}"] = column
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        tables = {}
+        object_types = [name.split("/")[0] for name in arrays if name.endswith("/frame_offsets")]
+        for object_type in object_types:
+            table = TrackTable(
+                arrays[f"{object_type}/frame_offsets"],
+                arrays[f"{object_type}/track_id"],
+                arrays[f"{object_type}/bbox"]
+            )
+            for name in COLUMNS:
+                key = f"{object_type}/{name}"
+                if name != "bbox" and key in arrays:
+                    table.columns[name][:] = arrays[key]
+                    table.mark_present(name)
+            tables[object_type] = table
+        return cls(tables)
+
+    def slice_frames(self, frame_start, frame_end):
+        return TrackStore({
+            object_type: table.slice_frames(frame_start, frame_end)
+            for object_type, table in self.tables.items()
+        })
+
+    @classmethod
+    def concatenate(cls, stores):
+        """Tracks of consecutive segments joined into one store, ids unchanged"""
+        return cls({
+            object_type: TrackTable.concatenate([store.table(object_type) for store in stores])
+            for object_type in stores[0].keys()
+        })
+
+    def table(self, object_type):
+        return self.tables[object_type]
+
+    def __getitem__(self, object_type):
+        return _TrackFrames(self.tables[object_type])
+
+    def __setitem__(self, object_type, object_tracks):
+        if isinstance(object_tracks, TrackTable):
+            self.tables[object_type] = object_tracks
+        else:
+            self.tables[object_type] = TrackTable.from_frame_dicts(object_tracks)
+
+    def __contains__(self, object_type):
+        return object_type in self.tables
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def keys(self):
+        return self.tables.keys()
+
+    def items(self):
+        return [(object_type, self[object_type]) for object_type in self.tables]
+
+    def nbytes(self):
+        return sum(table.nbytes() for table in self.tables.values())
+
+    def compute_positions(self):
+        """Vectorized equivalent of Tracker.add_position_to_tracks"""
+        for object_type, table in self.tables.items():
+            bbox = table.columns["bbox"].astype(np.float64)
+            position = table.columns["position"]
+            position[:, 0] = np.trunc((bbox[:, 0] + bbox[:, 2]) / 2)
+            if object_type == "ball":
+                position[:, 1] = np.trunc((bbox[:, 1] + bbox[:, 3]) / 2)
+            else:
+                position[:, 1] = np.trunc(bbox[:, 3])
+            table.mark_present("position")
+
+    def apply_camera_movement(self, camera_movement_per_frame):
+        """Vectorized equivalent of CameraMovementEstimator.add_adjust_positions_to_tracks"""
+        camera_movement = np.asarray(camera_movement_per_frame, dtype=np.float32).reshape(-1, 2)
+        for table in self.tables.values():
+            if "position" not in table.present:
+                continue
+            rows = table.frame < len(camera_movement)
+            table.columns["position_adjusted"][rows] = (
+                table.columns["position"][rows] - camera_movement[table.frame[rows]]
+            )
+            table.mark_present("position_adjusted")
@@ -1,22 +1,58 @@
-from ultralytics import YOLO
 import supervision as sv
 import pickle
 import os
 import numpy as np
-import pandas as pd
 import cv2
 import sys 
 sys.path.append('../')
-from utils.bbox_utils import get_center_of_bbox, get_bbox_width, get_foot_position
+from utils.bbox_utils import get_center_of_bbox, get_bbox_width, get_foot_position, get_iou_matrix
+from .track_store import TrackStore, TrackTable
+from .ball_interpolator import BallInterpolator
+from .inference_backend import load_model
+from analysis_cache.analysis_cache import hash_file
 
 
 class Tracker:
 
-    def __init__(self, model_path):
-        self.model = YOLO(model_path) 
+    def __init__(self, model_path, inference_batch_size=20, backend="pytorch"):
+        self.model_path = model_path
+        # Frames per model.predict call, see autotuner.BatchAutotuner
+        self.inference_batch_size = inference_batch_size
+        # pytorch, or an ONNX Runtime / OpenVINO export of the same weights, see inference_backend
+        self.backend = backend
+        # Without a model path the tracker can only re-track stored detections
+        self.model = load_model(model_path, backend) if model_path is not None else None
         self.tracker = sv.ByteTrack()
+        self.conf = 0.1
+        self._model_hash = None
+        # Keyframe mode: boxes of the last keyframe and the image shift accumulated since the start
+        self._propagation_state = []
+        self._previous_by_id = {}
+        self._camera_shift = np.zeros(2)
+        self._cls_names_inv = None
+        # Ball gaps are filled across batch boundaries, so the interpolator lives as long as the tracker
+        self.ball_interpolator = BallInterpolator()
+
+    def cache_params(self, ball_detector=None):
+        """Everything besides the frames that determines the tracks, for AnalysisCache keys"""
+        if self._model_hash is None:
+            self._model_hash = hash_file(self.model_path)
+        cache_params = {
+            "model": self._model_hash,
+            "backend": self.backend,
+            "conf": self.conf,
+            "tracker": "ByteTrack",
+            "goalkeeper_as_player": True,
+        }
+        if ball_detector is not None:
+            cache_params["ball_roi"] = ball_detector.cache_params()
+        return cache_params
 
     def add_position_to_tracks(self, tracks):
+        if isinstance(tracks, TrackStore):
+            tracks.compute_positions()
+            return
+
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
                 for track_id, track_info in track.items():
@@ -28,44 +64,65 @@ class Tracker:
                     tracks[object][frame_num][track_id]['position'] = position
 
     def interpolate_ball_positions(self, ball_positions):
+        """
+        Fill the frames without a ball, continuing from earlier batches, see
+        BallInterpolator. A TrackTable gives a TrackTable back, a list of
+        per-frame dicts a list of dicts. Frames after the last detection hold
+        it provisionally; pipeline.BallLookahead holds them back until the
+        next detection instead.
+        """
+        if isinstance(ball_positions, TrackTable):
+            num_frames = ball_positions.num_frames
+            ball_bboxes = np.full((num_frames, 4), np.nan)
+            rows = ball_positions.track_id == 1
+            # Like the dict tracks, a later row of the same frame wins
+            ball_bboxes[ball_positions.frame[rows]] = ball_positions.columns['bbox'][rows]
+            interpolated = self.ball_interpolator.interpolate(ball_bboxes)
+            return TrackTable(np.arange(num_frames + 1), np.ones(num_frames, dtype=np.int64), interpolated)
+
         if not ball_positions:
             return []
-            
-        # Extract ball bboxes, handle empty cases
+
         ball_bboxes = []
         for frame_data in ball_positions:
-            if (1 in frame_data and 
-                'bbox' in frame_data[1] and 
-                len(frame_data[1]['bbox']) == 4 and
-                not any(np.isnan(coord) for coord in frame_data[1]['bbox'])):
+            if 1 in frame_data and 'bbox' in frame_data[1] and len(frame_data[1]['bbox']) == 4:
                 ball_bboxes.append(frame_data[1]['bbox'])
             else:
-                # Use NaN for missing ball positions
                 ball_bboxes.append([np.nan, np.nan, np.nan, np.nan])
-        
-        # Create DataFrame
-        df_ball_positions = pd.DataFrame(ball_bboxes, columns=['x1', 'y1', 'x2', 'y2'])
-
-        # Interpolate missing values
-        df_ball_positions = df_ball_positions.interpolate()
-        df_ball_positions = df_ball_positions.bfill()
-
-        # Convert back to track format
-        ball_positions_interpolated = []
-        for bbox in df_ball_positions.to_numpy().tolist():
-            ball_positions_interpolated.append({1: {"bbox": bbox}})
-
-        return ball_positions_interpolated
+        interpolated = self.ball_interpolator.interpolate(np.array(ball_bboxes, dtype=np.float64))
+        return [{1: {"bbox": bbox}} for bbox in interpolated.tolist()]
 
     def detect_frames(self, frames):
-        batch_size = 20 
+        batch_size = self.inference_batch_size
         detections = [] 
         for i in range(0, len(frames), batch_size):
-            detections_batch = self.model.predict(frames[i:i + batch_size], conf=0.1)
+            detections_batch = self.model.predict(frames[i:i + batch_size], conf=self.conf)
             detections += detections_batch
         return detections
 
-    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+    def detect_player_bboxes(self, frames):
+        """Player and goalkeeper boxes per frame, without tracking"""
+        player_bboxes = []
+        for detection in self.detect_frames(frames):
+            detection_supervision, cls_names_inv = self._convert_goalkeepers(detection)
+            mask = detection_supervision.class_id == cls_names_inv["player"]
+            player_bboxes.append(detection_supervision.xyxy[mask])
+        return player_bboxes
+
+    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None, detections=None, columnar=False,
+                          cache_segment=None, detection_store=None, frame_offset=0, ball_detector=None):
+        # Tracks of a segment already analysed with the same video, weights and parameters.
+        # The boxes ByteTrack saw are stored with them and fed to it again, so it ends the
+        # segment in the same state and ids stay consistent with segments tracked afterwards.
+        if cache_segment is not None:
+            arrays = cache_segment.get('tracks', self.cache_params(ball_detector))
+            if arrays is not None and 'tracker_input/row_offsets' in arrays:
+                self._replay_tracker_input(arrays)
+                if ball_detector is not None:
+                    ball_detector.reset()
+                tracks = TrackStore.from_arrays(arrays)
+                return tracks if columnar else tracks.to_dict()
+
         if read_from_stub and stub_path is not None and os.path.exists(stub_path):
             try:
                 with open(stub_path, 'rb') as f:
@@ -75,7 +132,24 @@ class Tracker:
             except Exception as e:
                 print(f"Error loading stub: {e}. Regenerating tracks...")
 
-        detections = self.detect_frames(frames)
+        # Detections may already have been computed by a separate inference stage
+        if detections is None:
+            detections = self.detect_frames(frames)
+
+        # Keep the raw detections so tracking can be re-run without inference
+        if detection_store is not None:
+            detection_store.append(frame_offset, detections)
+
+        if columnar:
+            converted = [self._convert_goalkeepers(detection) for detection in detections]
+            tracks = self._build_track_store(converted)
+            if ball_detector is not None:
+                tracks["ball"] = self.refine_ball_tracks(frames, tracks["ball"], ball_detector)
+            self._save_stub(tracks, stub_path)
+            if cache_segment is not None:
+                cache_segment.put('tracks', self.cache_params(ball_detector),
+                                  dict(tracks.to_arrays(), **self._tracker_input_arrays(converted)))
+            return tracks
 
         tracks = {
             "players": [],
@@ -83,17 +157,10 @@ class Tracker:
             "ball": []
         }
 
+        converted = []
         for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_inv = {v: k for k, v in cls_names.items()}
-
-            # Convert to supervision Detection format
-            detection_supervision = sv.Detections.from_ultralytics(detection)
-
-            # Convert GoalKeeper to player object
-            for object_ind, class_id in enumerate(detection_supervision.class_id):
-                if cls_names[class_id] == "goalkeeper":
-                    detection_supervision.class_id[object_ind] = cls_names_inv["player"]
+            detection_supervision, cls_names_inv = self._convert_goalkeepers(detection)
+            converted.append((detection_supervision, cls_names_inv))
 
             # Track Objects
             detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
@@ -120,6 +187,274 @@ class Tracker:
                 if cls_id == cls_names_inv['ball']:
                     tracks["ball"][frame_num][1] = {"bbox": bbox}
 
+        if ball_detector is not None:
+            tracks["ball"] = self.refine_ball_tracks(frames, tracks["ball"], ball_detector)
+
+        self._save_stub(tracks, stub_path)
+        if cache_segment is not None:
+            cache_segment.put('tracks', self.cache_params(ball_detector),
+                              dict(TrackStore.from_dict(tracks).to_arrays(), **self._tracker_input_arrays(converted)))
+
+        return tracks
+
+    @staticmethod
+    def _tracker_input_arrays(converted):
+        """Boxes and confidences ByteTrack was updated with, per frame, stored with cached tracks"""
+        detections = [detection_supervision for detection_supervision, _ in converted]
+        return {
+            "tracker_input/row_offsets": np.cumsum([0] + [len(detection) for detection in detections]),
+            "tracker_input/xyxy": np.concatenate(
+                [detection.xyxy for detection in detections] + [np.zeros((0, 4), dtype=np.float32)]
+            ),
+            "tracker_input/confidence": np.concatenate(
+                [detection.confidence for detection in detections] + [np.zeros(0, dtype=np.float32)]
+            ),
+        }
+
+    def _replay_tracker_input(self, arrays):
+        """Advance ByteTrack over a cached segment without running the model"""
+        row_offsets = arrays["tracker_input/row_offsets"]
+        xyxy = arrays["tracker_input/xyxy"]
+        confidence = arrays["tracker_input/confidence"]
+        for start, end in zip(row_offsets[:-1], row_offsets[1:]):
+            self.tracker.update_with_detections(
+                sv.Detections(xyxy=np.array(xyxy[start:end]), confidence=np.array(confidence[start:end]))
+            )
+
+    def refine_ball_tracks(self, frames, ball_tracks, ball_detector):
+        """Ball tracks with full-frame misses searched again in a crop around the predicted position"""
+        refined = []
+        for frame, ball_track in zip(frames, ball_tracks):
+            bbox = ball_track[1]["bbox"] if 1 in ball_track else None
+            bbox = ball_detector.refine(frame, bbox)
+            refined.append({1: {"bbox": bbox}} if bbox is not None else {})
+        return refined
+
+    def get_ball_tracks(self, frames, ball_detector):
+        """
+        Ball-only tracks in the same format as tracks["ball"], detected in a crop
+        around the predicted ball position and on the full frame only when it is lost
+        """
+        ball_tracks = []
+        for frame in frames:
+            bbox = ball_detector.detect(frame)
+            ball_tracks.append({1: {"bbox": bbox}} if bbox is not None else {})
+        return ball_tracks
+
+    def get_object_tracks_keyframes(self, frames, keyframe_scheduler, camera_movement_per_frame, ball_detector=None):
+        """
+        Columnar tracks with model.predict run on keyframes only.
+
+        Between keyframes, player and referee boxes are carried forward with the
+        per-track velocity measured between their last two keyframes (in camera
+        compensated coordinates) plus the image shift from the camera movement.
+        The propagated boxes are fed to ByteTrack as detections, so its motion
+        model advances every frame and ids match up again at the next keyframe.
+        The ball is only set on keyframes and filled in by interpolate_ball_positions,
+        unless a ball_detector follows it in between with crops around its predicted position.
+        State is kept on the tracker, so batches can be fed one after another.
+        """
+        is_keyframe = keyframe_scheduler.select_keyframes(frames)
+        keyframe_indices = [frame_num for frame_num, keyframe in enumerate(is_keyframe) if keyframe]
+        detections = self.detect_frames([frames[frame_num] for frame_num in keyframe_indices])
+        keyframe_detections = dict(zip(keyframe_indices, detections))
+
+        frame_arrays = {"players": [], "referees": [], "ball": []}
+        empty = ([], np.zeros((0, 4), dtype=np.float32))
+
+        for frame_num in range(len(frames)):
+            # Camera movement is old - new feature position, so image content shifts by its negative
+            self._camera_shift = self._camera_shift - np.asarray(camera_movement_per_frame[frame_num], dtype=np.float64)
+            propagated = self._propagate_boxes()
+
+            keyframe = frame_num in keyframe_detections
+            if keyframe:
+                detection_supervision, self._cls_names_inv = self._convert_goalkeepers(keyframe_detections[frame_num])
+                tracked_classes = np.isin(
+                    detection_supervision.class_id, [self._cls_names_inv['player'], self._cls_names_inv['referee']]
+                )
+                self._update_keyframe_scheduler(keyframe_scheduler, propagated, detection_supervision, tracked_classes)
+                tracked_detections = detection_supervision[tracked_classes]
+                tracked_detections.data['state_index'] = np.arange(len(tracked_detections))
+                self._start_propagation(tracked_detections)
+            else:
+                tracked_detections = propagated
+
+            # Track Objects
+            detection_with_tracks = self.tracker.update_with_detections(tracked_detections)
+            for state_index, track_id in zip(detection_with_tracks.data.get('state_index', []),
+                                             detection_with_tracks.tracker_id):
+                self._propagation_state[state_index]["track_id"] = int(track_id)
+
+            if self._cls_names_inv is None:
+                for object_type in frame_arrays:
+                    frame_arrays[object_type].append(empty)
+                continue
+
+            for object_type, class_name in (("players", "player"), ("referees", "referee")):
+                mask = detection_with_tracks.class_id == self._cls_names_inv[class_name]
+                frame_arrays[object_type].append((detection_with_tracks.tracker_id[mask], detection_with_tracks.xyxy[mask]))
+
+            # Like the dict tracks, the last ball detection of the frame is kept as id 1
+            ball_bbox = None
+            if keyframe:
+                ball_rows = np.flatnonzero(detection_supervision.class_id == self._cls_names_inv['ball'])
+                if len(ball_rows) > 0:
+                    ball_bbox = detection_supervision.xyxy[ball_rows[-1]]
+                if ball_detector is not None:
+                    ball_bbox = ball_detector.refine(frames[frame_num], ball_bbox)
+            elif ball_detector is not None:
+                ball_bbox = ball_detector.detect(frames[frame_num])
+
+            if ball_bbox is not None:
+                frame_arrays["ball"].append(([1], np.asarray(ball_bbox, dtype=np.float32).reshape(1, 4)))
+            else:
+                frame_arrays["ball"].append(empty)
+
+        return TrackStore.from_frame_arrays(frame_arrays)
+
+    def _start_propagation(self, tracked_detections):
+        """Replace the propagation state with the player and referee detections of a keyframe"""
+        previous_by_id = {
+            track_state["track_id"]: track_state
+            for track_state in self._propagation_state if track_state["track_id"] is not None
+        }
+        # Ids are only known after ByteTrack has run on the keyframe, so the velocity is
+        # taken from the previous state of the track id the keyframe box ends up with
+        self._previous_by_id = previous_by_id
+        self._propagation_state = [
+            {
+                "bbox": bbox.astype(np.float64),
+                "velocity": None,
+                "camera_shift": self._camera_shift.copy(),
+                "frames_since_keyframe": 0,
+                "confidence": float(confidence),
+                "class_id": int(class_id),
+                "track_id": None,
+            }
+            for bbox, confidence, class_id in zip(
+                tracked_detections.xyxy, tracked_detections.confidence, tracked_detections.class_id
+            )
+        ]
+
+    def _track_velocity(self, track_state):
+        """Box velocity per frame between the last two keyframes of a track, without the camera's contribution"""
+        if track_state["velocity"] is None:
+            track_state["velocity"] = np.zeros(4)
+            previous = self._previous_by_id.get(track_state["track_id"])
+            if previous is not None:
+                frames_between = previous["frames_since_keyframe"]
+                camera_shift = np.tile(track_state["camera_shift"] - previous["camera_shift"], 2)
+                track_state["velocity"] = (track_state["bbox"] - previous["bbox"] - camera_shift) / max(frames_between, 1)
+        return track_state["velocity"]
+
+    def _propagate_boxes(self):
+        """Every player and referee of the last keyframe moved to the current frame, as sv.Detections"""
+        if not self._propagation_state:
+            return sv.Detections.empty()
+
+        xyxy = []
+        for track_state in self._propagation_state:
+            track_state["frames_since_keyframe"] += 1
+            camera_shift = np.tile(self._camera_shift - track_state["camera_shift"], 2)
+            xyxy.append(
+                track_state["bbox"] + self._track_velocity(track_state) * track_state["frames_since_keyframe"] + camera_shift
+            )
+
+        return sv.Detections(
+            xyxy=np.array(xyxy, dtype=np.float32),
+            confidence=np.array([track_state["confidence"] for track_state in self._propagation_state], dtype=np.float32),
+            class_id=np.array([track_state["class_id"] for track_state in self._propagation_state], dtype=int),
+            data={"state_index": np.arange(len(self._propagation_state))}
+        )
+
+    def _update_keyframe_scheduler(self, keyframe_scheduler, propagated, detection_supervision, tracked_classes):
+        """Feed the scheduler how well the propagated boxes matched this keyframe's detections"""
+        propagation_iou = None
+        if len(propagated) > 0:
+            ious = get_iou_matrix(propagated.xyxy, detection_supervision.xyxy[tracked_classes])
+            # Boxes the model no longer finds count as a complete miss
+            best_ious = ious.max(axis=1) if ious.shape[1] > 0 else np.zeros(len(propagated))
+            propagation_iou = float(best_ious.mean())
+
+        confidence = detection_supervision.confidence[tracked_classes]
+        keyframe_scheduler.update(propagation_iou, float(confidence.mean()) if len(confidence) > 0 else None)
+
+    def _convert_goalkeepers(self, detection):
+        # Convert to supervision Detection format
+        detection_supervision = sv.Detections.from_ultralytics(detection)
+        return self._remap_goalkeepers(detection_supervision, detection.names)
+
+    def _remap_goalkeepers(self, detection_supervision, cls_names, goalkeeper_as_player=True):
+        cls_names_inv = {v: k for k, v in cls_names.items()}
+
+        # Convert GoalKeeper to player object
+        if goalkeeper_as_player:
+            for object_ind, class_id in enumerate(detection_supervision.class_id):
+                if cls_names[class_id] == "goalkeeper":
+                    detection_supervision.class_id[object_ind] = cls_names_inv["player"]
+
+        return detection_supervision, cls_names_inv
+
+    def _build_track_store(self, supervision_detections, byte_tracker=None):
+        """
+        Track (detection_supervision, cls_names_inv) pairs, one per frame, straight
+        into per-frame arrays without per-object dicts
+        """
+        if byte_tracker is None:
+            byte_tracker = self.tracker
+        frame_arrays = {"players": [], "referees": [], "ball": []}
+
+        for detection_supervision, cls_names_inv in supervision_detections:
+            # Track Objects
+            detection_with_tracks = byte_tracker.update_with_detections(detection_supervision)
+
+            for object_type, class_name in (("players", "player"), ("referees", "referee")):
+                mask = detection_with_tracks.class_id == cls_names_inv[class_name]
+                frame_arrays[object_type].append(
+                    (detection_with_tracks.tracker_id[mask], detection_with_tracks.xyxy[mask])
+                )
+
+            # Like the dict tracks, the last ball detection of the frame is kept as id 1
+            ball_rows = np.flatnonzero(detection_supervision.class_id == cls_names_inv['ball'])
+            if len(ball_rows) > 0:
+                frame_arrays["ball"].append(([1], detection_supervision.xyxy[ball_rows[-1:]]))
+            else:
+                frame_arrays["ball"].append(([], np.zeros((0, 4), dtype=np.float32)))
+
+        return TrackStore.from_frame_arrays(frame_arrays)
+
+    def retrack(self, detection_store, frame_start=0, frame_end=None, tracker_params=None,
+                min_confidence=None, goalkeeper_as_player=True, columnar=True):
+        """
+        Rebuild tracks from stored raw detections with a fresh ByteTrack, so tracker
+        settings, the goalkeeper remap or confidence filtering can be changed
+        without running the model again.
+
+        tracker_params are passed to sv.ByteTrack (e.g. lost_track_buffer).
+        """
+        cls_names = detection_store.class_names
+        if cls_names is None:
+            raise ValueError(f"No detections stored in {detection_store.directory}")
+        byte_tracker = sv.ByteTrack(**(tracker_params or {}))
+
+        def stored_detections():
+            expected_frame = frame_start
+            for frame_num, detection_supervision in detection_store.iter_frames(frame_start, frame_end):
+                # Frames that were never stored (e.g. served from the cache) stay empty
+                while expected_frame < frame_num:
+                    yield self._remap_goalkeepers(sv.Detections.empty(), cls_names)
+                    expected_frame += 1
+                if min_confidence is not None:
+                    detection_supervision = detection_supervision[detection_supervision.confidence >= min_confidence]
+                yield self._remap_goalkeepers(detection_supervision, cls_names, goalkeeper_as_player)
+                expected_frame += 1
+
+        tracks = self._build_track_store(stored_detections(), byte_tracker)
+        print(f"Re-tracked {tracks.num_frames} frames from {detection_store.directory}")
+        return tracks if columnar else tracks.to_dict()
+
+    def _save_stub(self, tracks, stub_path):
         if stub_path is not None:
             try:
                 os.makedirs(os.path.dirname(stub_path), exist_ok=True)
@@ -129,8 +464,6 @@ class Tracker:
             except Exception as e:
                 print(f"Error saving stub: {e}")
 
-        return tracks
-    
     def is_valid_bbox(self, bbox):
         """Check if bounding box is valid (not None, correct length, no NaN values)"""
         if bbox is None or len(bbox) != 4:
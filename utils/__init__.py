@@ -1,2 +1,2 @@
-from .video_utils import read_video, save_video
-from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, measure_xy_distance, get_foot_position
\ No newline at end of file
+from .video_utils import read_video, read_sampled_frames, save_video, get_video_properties, create_video_writer, get_video_fingerprint
+from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, measure_xy_distance, get_foot_position, get_iou_matrix
\ No newline at end of file
@@ -1,4 +1,7 @@
 import cv2
+import hashlib
+import numpy as np
+import os
 
 def read_video(video_path):
     cap = cv2.VideoCapture(video_path)
@@ -10,9 +13,48 @@ def read_video(video_path):
         frames.append(frame)
     return frames
 
-def save_video(ouput_video_frames,output_video_path):
+def read_sampled_frames(video_path, num_frames):
+    """Frames spread evenly over the whole video, e.g. for fitting or calibration"""
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for frame_num in np.linspace(0, max(total_frames - 1, 0), num_frames).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_num))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+def get_video_fingerprint(video_path, chunk_size=1 << 20):
+    """
+    Cheap content fingerprint of a video file: its size plus the first, middle
+    and last chunks, so renamed copies of the same footage match.
+    """
+    file_size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(file_size).encode())
+    with open(video_path, 'rb') as f:
+        for offset in sorted({0, max(file_size // 2 - chunk_size // 2, 0), max(file_size - chunk_size, 0)}):
+            f.seek(offset)
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+def get_video_properties(cap, default_fps=24):
+    """Return (fps, (width, height)) of an opened cv2.VideoCapture"""
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps <= 0:
+        fps = default_fps
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    return fps, (width, height)
+
+def create_video_writer(output_video_path, fps, frame_size):
+    """Open an XVID writer once so frames can be streamed to it batch by batch"""
     fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (ouput_video_frames[0].shape[1], ouput_video_frames[0].shape[0]))
+    return cv2.VideoWriter(output_video_path, fourcc, fps, frame_size)
+
+def save_video(ouput_video_frames,output_video_path,fps=24):
+    out = create_video_writer(output_video_path, fps, (ouput_video_frames[0].shape[1], ouput_video_frames[0].shape[0]))
     for frame in ouput_video_frames:
         out.write(frame)
     out.release()
@@ -1,5 +1,8 @@
 import numpy as np 
 import cv2
+import sys 
+sys.path.append('../')
+from trackers.track_store import TrackStore
 
 class ViewTransformer():
     def __init__(self):
@@ -33,13 +36,56 @@ class ViewTransformer():
         tranform_point = cv2.perspectiveTransform(reshaped_point,self.persepctive_trasnformer)
         return tranform_point.reshape(-1,2)
 
+    def is_inside_pitch(self, points):
+        """Vectorized cv2.pointPolygonTest(..., False) >= 0 for an (N,2) array of points"""
+        points = np.trunc(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+        vertices = self.pixel_vertices.astype(np.float64)
+        edge_start = vertices
+        edge_end = np.roll(vertices, -1, axis=0)
+
+        # The pitch polygon is convex: a point is inside (or on an edge) when it
+        # lies on the same side of every edge
+        cross = (
+            (edge_end[:, 0] - edge_start[:, 0]) * (points[:, None, 1] - edge_start[:, 1])
+            - (edge_end[:, 1] - edge_start[:, 1]) * (points[:, None, 0] - edge_start[:, 0])
+        )
+        inside = np.all(cross >= 0, axis=1) | np.all(cross <= 0, axis=1)
+        return inside & ~np.isnan(points).any(axis=1)
+
+    def transform_points(self, points):
+        """
+        Transform an (N,2) array of pixel positions to pitch coordinates in one call.
+        Returns the (N,2) transformed points (NaN outside the pitch) and a validity mask.
+        """
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        transformed = np.full(points.shape, np.nan, dtype=np.float32)
+        valid = self.is_inside_pitch(points)
+        if valid.any():
+            reshaped_points = points[valid].reshape(-1, 1, 2)
+            transformed[valid] = cv2.perspectiveTransform(reshaped_points, self.persepctive_trasnformer).reshape(-1, 2)
+        return transformed, valid
+
     def add_transformed_position_to_tracks(self,tracks):
+        if isinstance(tracks, TrackStore):
+            for table in tracks.tables.values():
+                transformed, _ = self.transform_points(table.columns['position_adjusted'])
+                table.columns['position_transformed'][:] = transformed
+                table.mark_present('position_transformed')
+            return
+
+        # Gather every position so the whole batch is transformed in one call
+        entries = []
+        positions = []
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
                 for track_id, track_info in track.items():
                     position = track_info['position_adjusted']
-                    position = np.array(position)
-                    position_trasnformed = self.transform_point(position)
-                    if position_trasnformed is not None:
-                        position_trasnformed = position_trasnformed.squeeze().tolist()
-                    tracks[object][frame_num][track_id]['position_transformed'] = position_trasnformed
\ No newline at end of file
+                    entries.append((object, frame_num, track_id))
+                    positions.append(position if position is not None else (np.nan, np.nan))
+
+        if not entries:
+            return
+
+        transformed, valid = self.transform_points(np.array(positions, dtype=np.float32))
+        for (object, frame_num, track_id), point, is_valid in zip(entries, transformed.tolist(), valid):
+            tracks[object][frame_num][track_id]['position_transformed'] = point if is_valid else None
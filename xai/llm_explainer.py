@@ -1,13 +1,36 @@
 import openai
 from openai import OpenAI
 import groq
+import hashlib
 import json
 import os
+import numpy as np
+
+# Chat model used per provider unless one is given
+MODELS = {
+    "groq": "llama3-70b-8192",
+    "openai": "gpt-3.5-turbo",
+}
+
+# Sections of the analysis data whose keys are all kept in the digest, nested as in the data;
+# only their values are bounded. Other dicts keep at most max_items entries.
+KEPT_SECTIONS = {
+    "match_statistics": {"ball_possession": {}, "top_performers": {}},
+    "key_events": {},
+}
+
 
 class LLMExplainer:
-    def __init__(self, api_key=None, provider="groq"):
+    def __init__(self, api_key=None, provider="groq", model=None, cache_dir='stubs/llm_cache', max_players=5,
+                 max_items=10):
         self.provider = provider
         self.api_key = api_key
+        self.model = model or MODELS.get(provider)
+        # Reports are stored here by digest, provider and model; None disables the cache
+        self.cache_dir = cache_dir
+        # Limits that keep the prompt the same size for any match length
+        self.max_players = max_players
+        self.max_items = max_items
         
         if provider == "openai" and api_key:
             self.client = OpenAI(api_key=api_key)
@@ -16,34 +39,164 @@ class LLMExplainer:
         else:
             self.client = None
     
-    def generate_match_report(self, analysis_data):
+    def generate_match_report(self, analysis_data, possession=None):
         """
-        Generate comprehensive match report using LLM
+        Generate comprehensive match report using LLM.
+        The prompt holds a bounded digest of analysis_data, and reports are
+        cached on disk, so an unchanged match is not sent again.
+        With a PossessionStats, its match and window shares are reported as
+        the ball possession.
         """
+        if possession is not None:
+            analysis_data = dict(analysis_data)
+            analysis_data['match_statistics'] = dict(analysis_data.get('match_statistics', {}),
+                                                     ball_possession=possession.to_dict())
+        
         if not self.client:
             return self._generate_fallback_report(analysis_data)
         
-        prompt = self._create_report_prompt(analysis_data)
+        digest = self.summarize(analysis_data)
+        cache_path = self._cache_path(digest)
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    return json.load(f)["report"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error reading cached report {cache_path}: {e}. Generating it again...")
+        
+        prompt = self._create_report_prompt(digest)
         
         try:
-            if self.provider == "groq":
-                response = self.client.chat.completions.create(
-                    model="llama3-70b-8192",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=1500
-                )
-                return response.choices[0].message.content
-            else:  # openai
-                response = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=1500
-                )
-                return response.choices[0].message.content
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=1500
+            )
+            report = response.choices[0].message.content
         except Exception as e:
             return f"LLM analysis failed: {str(e)}\n\n{self._generate_fallback_report(analysis_data)}"
+        
+        if cache_path is not None:
+            self._save_report(cache_path, report)
+        return report
+    
+    def summarize(self, analysis_data):
+        """
+        Bounded-size digest of analysis_data for the prompt: possession as
+        shares, the top max_players of every performer list, event counts
+        instead of event lists, and per-frame series as summary statistics.
+        Top-level keys and the KEPT_SECTIONS keys are never dropped.
+        """
+        data = dict(analysis_data)
+        stats = dict(data.get('match_statistics', {}))
+        events = dict(data.get('key_events', {}))
+        
+        # Per-frame team in control, as produced by PossessionStats.update_batch
+        team_ball_control = data.pop('team_ball_control', None)
+        if team_ball_control is not None:
+            team_ball_control = np.asarray(team_ball_control)
+            controlled = team_ball_control[np.isin(team_ball_control, (1, 2))]
+            if len(controlled) and 'ball_possession' not in stats:
+                share_1 = float(np.mean(controlled == 1))
+                stats['ball_possession'] = {"team_1": f"{share_1 * 100:.1f}%", "team_2": f"{(1 - share_1) * 100:.1f}%"}
+            if 'total_possession_changes' not in events:
+                events['total_possession_changes'] = int(np.count_nonzero(np.diff(controlled)))
+        
+        if 'top_performers' in stats:
+            stats['top_performers'] = {
+                name: list(performers)[:self.max_players] if isinstance(performers, (list, tuple)) else performers
+                for name, performers in stats['top_performers'].items()
+            }
+        # Lists of events become counts
+        events = {
+            name: len(value) if isinstance(value, (list, tuple, np.ndarray)) else value
+            for name, value in events.items()
+        }
+        
+        if stats:
+            data['match_statistics'] = stats
+        if events:
+            data['key_events'] = events
+        return self._bound_sections(data, KEPT_SECTIONS)
+    
+    def _bound_sections(self, value, sections, depth=0):
+        """Like _bound, but keeps every key of value and of the nested dicts named in sections"""
+        return {
+            str(key): self._bound_sections(item, sections[key], depth + 1)
+            if key in sections and isinstance(item, dict) else self._bound(item, depth + 1)
+            for key, item in value.items()
+        }
+    
+    def _bound(self, value, depth=0, max_depth=4, max_chars=200):
+        """JSON-ready copy of value with at most max_items entries per container"""
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float):
+            return round(value, 4)
+        if value is None or isinstance(value, (bool, int)):
+            return value
+        if isinstance(value, str):
+            return value if len(value) <= max_chars else value[:max_chars] + "..."
+        
+        if isinstance(value, dict):
+            if depth >= max_depth:
+                return f"{len(value)} entries"
+            items = list(value.items())
+            if len(items) > self.max_items:
+                items = self._top_entries(items)
+            bounded = {str(key): self._bound(item, depth + 1) for key, item in items[:self.max_items]}
+            if len(items) > self.max_items:
+                bounded["omitted_entries"] = len(items) - self.max_items
+            return bounded
+        
+        if isinstance(value, (list, tuple, np.ndarray)):
+            numeric = isinstance(value, np.ndarray) and value.dtype.kind in "biuf" or \
+                all(isinstance(item, (int, float, np.number)) for item in value)
+            if numeric and len(value) > self.max_items:
+                array = np.asarray(value)
+                # Long numeric series, e.g. per-frame values
+                finite = array[np.isfinite(array)] if array.dtype.kind == "f" else array.ravel()
+                if not len(finite):
+                    return {"count": int(array.size)}
+                return {"count": int(array.size), "mean": round(float(finite.mean()), 4),
+                        "min": round(float(finite.min()), 4), "max": round(float(finite.max()), 4)}
+            items = list(value)
+            if depth >= max_depth:
+                return f"{len(items)} items"
+            bounded = [self._bound(item, depth + 1) for item in items[:self.max_items]]
+            if len(items) > self.max_items:
+                bounded.append(f"... {len(items) - self.max_items} more")
+            return bounded
+        
+        return self._bound(str(value), depth)
+    
+    def _top_entries(self, items):
+        """Per-player style entries (dicts of stats) ranked by distance or speed, best first"""
+        if not all(isinstance(item, dict) for _, item in items):
+            return items
+        for metric in ("distance", "total_distance", "max_speed", "speed"):
+            if all(isinstance(item.get(metric), (int, float, np.number)) for _, item in items):
+                return sorted(items, key=lambda entry: entry[1][metric], reverse=True)
+        return items
+    
+    def _cache_path(self, digest):
+        if self.cache_dir is None:
+            return None
+        description = json.dumps({
+            "digest": digest,
+            "provider": self.provider,
+            "model": self.model,
+        }, sort_keys=True)
+        return os.path.join(self.cache_dir, f"report-{hashlib.sha1(description.encode()).hexdigest()}.json")
+    
+    def _save_report(self, cache_path, report):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Written under a temporary name first, so a half-written report is never read
+        tmp_path = f"{cache_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({"provider": self.provider, "model": self.model, "report": report}, f)
+        os.replace(tmp_path, cache_path)
     
     def _create_report_prompt(self, analysis_data):
         """Create prompt for match report"""
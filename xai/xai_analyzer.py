@@ -6,16 +6,29 @@ import sys
 import os
 
 sys.path.append('../')
+from trackers.track_store import TrackStore
 
 class XAIAnalyzer:
-    def __init__(self, model):
+    def __init__(self, model, track_reader=None):
         self.model = model
         self.model.eval()
+        # TrackReader of exported tracks, for analysing frames without the whole match in memory
+        self.track_reader = track_reader
+        
+    def load_tracks(self, frame_start, frame_end, track_ids=None):
+        """Load the tracks of frames [frame_start, frame_end) from the exported tracks"""
+        if self.track_reader is None:
+            raise ValueError("No track reader given to load tracks from")
+        return self.track_reader.read_tracks(frame_start, frame_end, track_ids)
         
     def analyze_tactical_patterns(self, tracks, frame_num):
         """
-        Analyze tactical patterns using tracking data
+        Analyze tactical patterns using tracking data.
+        With tracks=None only frame_num is loaded from the exported tracks.
         """
+        if tracks is None:
+            tracks = self.load_tracks(frame_num, frame_num + 1)
+            frame_num = 0
         try:
             players = tracks["players"][frame_num]
             ball_data = tracks["ball"][frame_num]
@@ -35,6 +48,77 @@ class XAIAnalyzer:
                 "defensive_line": "Analysis failed"
             }
     
+    def analyze_match(self, tracks=None, frame_start=0, frame_end=None):
+        """
+        Tactical time series for every frame at once, from a TrackStore, dict
+        tracks or, with tracks=None, the exported tracks.
+
+        Returns per-frame arrays, with the same measures as analyze_tactical_patterns:
+        frame: frame numbers, from frame_start
+        ball_visible: whether the ball has a position
+        pressure: players within 60 px of the ball
+        open_players: players with a team between 20 and 100 px from the ball
+        spread: (num_frames, 2) horizontal spread of teams 1 and 2, NaN with fewer than 5 players
+        defensive_line: mean horizontal position of the players with a team, NaN without any
+        """
+        if tracks is None:
+            tracks = self.load_tracks(frame_start, frame_end if frame_end is not None else self.track_reader.num_frames)
+        else:
+            if not isinstance(tracks, TrackStore):
+                tracks = TrackStore.from_dict(tracks)
+            if frame_start or frame_end is not None:
+                tracks = tracks.slice_frames(frame_start, frame_end if frame_end is not None else tracks.num_frames)
+        num_frames = tracks.num_frames
+        
+        ball_position = self._ball_positions(tracks.table("ball"), num_frames)
+        players = tracks.table("players")
+        position = players.columns["position"].astype(np.float64)
+        team = players.columns["team"]
+        # Distance of every player to the ball of its frame, NaN when either has no position
+        distance = np.linalg.norm(position - ball_position[players.frame], axis=1)
+        
+        def count(mask):
+            return np.bincount(players.frame[mask], minlength=num_frames)
+        
+        located = np.isfinite(position).all(axis=1)
+        x = position[:, 0]
+        spread = np.full((num_frames, 2), np.nan)
+        for column, team_id in enumerate((1, 2)):
+            rows = located & (team == team_id)
+            x_max = np.full(num_frames, -np.inf)
+            x_min = np.full(num_frames, np.inf)
+            np.maximum.at(x_max, players.frame[rows], x[rows])
+            np.minimum.at(x_min, players.frame[rows], x[rows])
+            spread[:, column] = np.where(count(rows) >= 5, x_max - x_min, np.nan)
+        
+        rows = located & ((team == 1) | (team == 2))
+        line_sum = np.bincount(players.frame[rows], weights=x[rows], minlength=num_frames)
+        line_count = count(rows)
+        defensive_line = np.full(num_frames, np.nan)
+        np.divide(line_sum, line_count, out=defensive_line, where=line_count > 0)
+        
+        return {
+            "frame": np.arange(frame_start, frame_start + num_frames),
+            "ball_visible": np.isfinite(ball_position).all(axis=1),
+            "pressure": count(distance < 60),
+            "open_players": count((team != 0) & (distance > 20) & (distance < 100)),
+            "spread": spread,
+            "defensive_line": defensive_line,
+        }
+    
+    def _ball_positions(self, ball, num_frames):
+        """(num_frames, 2) ball centres, NaN where the ball is missing"""
+        ball_position = np.full((num_frames, 2), np.nan)
+        rows = ball.track_id == 1
+        if "position" in ball.present:
+            centers = ball.columns["position"][rows]
+        else:
+            # Interpolated ball tracks only carry boxes
+            bbox = ball.columns["bbox"][rows].astype(np.float64)
+            centers = (bbox[:, :2] + bbox[:, 2:]) / 2
+        ball_position[ball.frame[rows]] = centers
+        return ball_position
+    
     def _detect_formation(self, players):
         """Detect team formation"""
         if not players: